@@ -0,0 +1,282 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import stat
+import time
+from http import HTTPStatus
+from typing import Callable
+from urllib.parse import parse_qs, urlsplit
+
+from dashboard import DASHBOARD_HTML, DashboardStream
+from metrics import metrics
+from store import ReadingStore
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+class QueryError(Exception):
+    """Invalid query of the API, answered with 400 Bad Request."""
+
+
+def parse_time(value: str | None) -> datetime.datetime | None:
+    """
+    Parse a query time as local naive datetime, like the reading timestamps.
+
+    Args:
+        value (str | None): Seconds since the epoch or an ISO 8601 time.
+
+    Returns:
+        datetime.datetime | None: The time, None when no value is given.
+
+    Raises:
+        QueryError: If the value is not a time.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromtimestamp(float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise QueryError(f"Invalid time: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+class QueryAPI:
+    """
+    Local read-only API of the scanner state, HTTP/1.1 over a Unix domain
+    socket and optionally over TCP.
+
+    Endpoints (GET, JSON responses):
+
+    - ``/readings``: the latest reading of every device.
+    - ``/devices``: the known devices.
+    - ``/history?address=X&start=T1&end=T2``: the stored readings of a device,
+      times as seconds since the epoch or ISO 8601.
+    - ``/alerts``: the devices out of the alert thresholds.
+
+    With a dashboard, ``/`` serves the web dashboard and ``/events`` its
+    Server-Sent Events stream.
+
+    The encoded snapshot responses are cached until the version of their
+    source changes, so frequent polling does not rebuild the JSON. They carry
+    an ETag and conditional requests are answered with 304 Not Modified.
+    """
+
+    def __init__(
+        self, store: ReadingStore, scanner=None, dashboard: DashboardStream = None
+    ):
+        """
+        Initialize the API.
+
+        Args:
+            store (ReadingStore): The store of readings.
+            scanner (BLEScanner, optional): The scanner, source of the active alerts.
+            dashboard (DashboardStream, optional): The live state of the web dashboard.
+        """
+        self.store = store
+        self.scanner = scanner
+        self.dashboard = dashboard
+        self.servers: list[asyncio.AbstractServer] = []
+        self.socket_path: str | None = None
+        self.connections: set[asyncio.StreamWriter] = set()
+        self._cache: dict[str, tuple[int, bytes, str]] = {}
+        self._requests = metrics.counter("api.requests")
+        self._cache_hits = metrics.counter("api.cache_hits")
+        self._request_time = metrics.histogram("api.request_us")
+
+    def cached(
+        self, key: str, version: int, build: Callable[[], object]
+    ) -> tuple[bytes, str]:
+        """
+        Return the encoded response of the key, built again when the version changed.
+
+        Args:
+            key (str): The cache key.
+            version (int): The version of the source of the response.
+            build (Callable[[], object]): Builds the JSON-serializable response.
+
+        Returns:
+            tuple[bytes, str]: The body and its ETag.
+        """
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == version:
+            self._cache_hits.inc()
+            return entry[1], entry[2]
+        body = json.dumps(build(), ensure_ascii=False, separators=(",", ":")).encode()
+        etag = f'"{key}-{version}"'
+        self._cache[key] = (version, body, etag)
+        return body, etag
+
+    def handle(self, method: str, target: str) -> tuple[int, bytes, str | None, str]:
+        """
+        Answer a request.
+
+        Args:
+            method (str): The HTTP method.
+            target (str): The request target, path and query.
+
+        Returns:
+            tuple[int, bytes, str | None, str]: The status, the body, the ETag
+                and the content type.
+        """
+        if method not in ("GET", "HEAD"):
+            return self.error(HTTPStatus.METHOD_NOT_ALLOWED)
+        url = urlsplit(target)
+        store = self.store
+        if url.path == "/readings":
+            body, etag = self.cached(
+                "readings",
+                store.version,
+                lambda: [reading.as_dict() for reading in store.latest.values()],
+            )
+        elif url.path == "/devices":
+            body, etag = self.cached("devices", store.version, store.devices)
+        elif url.path == "/alerts":
+            scanner = self.scanner
+            body, etag = self.cached(
+                "alerts",
+                scanner.alerts_version if scanner else 0,
+                lambda: list(scanner.active_alerts.values()) if scanner else [],
+            )
+        elif url.path == "/" and self.dashboard is not None:
+            return HTTPStatus.OK, DASHBOARD_HTML.encode(), None, "text/html"
+        elif url.path == "/history":
+            query = parse_qs(url.query)
+            address = query.get("address", [None])[0]
+            if not address:
+                return self.error(HTTPStatus.BAD_REQUEST, "address is required")
+            try:
+                start = parse_time(query.get("start", [None])[0])
+                end = parse_time(query.get("end", [None])[0])
+            except QueryError as e:
+                return self.error(HTTPStatus.BAD_REQUEST, str(e))
+            readings = store.get_history(address, start, end)
+            body = json.dumps(
+                [reading.as_dict() for reading in readings],
+                ensure_ascii=False,
+                separators=(",", ":"),
+            ).encode()
+            etag = None
+        else:
+            return self.error(HTTPStatus.NOT_FOUND)
+        return HTTPStatus.OK, body, etag, "application/json"
+
+    @staticmethod
+    def error(status: HTTPStatus, message: str = None) -> tuple[int, bytes, None, str]:
+        body = json.dumps({"error": message or status.phrase}).encode()
+        return status, body, None, "application/json"
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Serve the requests of a connection, keep-alive supported."""
+        self.connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                started = time.perf_counter_ns()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                self._requests.inc()
+                if self.dashboard is not None and target == "/events":
+                    await self.dashboard.stream(writer)
+                    break
+                status, body, etag, content_type = self.handle(method, target)
+                keep_alive = headers.get("connection", "").lower() != "close" and (
+                    version != "HTTP/1.0"
+                )
+                if etag and headers.get("if-none-match") == etag:
+                    status, body = HTTPStatus.NOT_MODIFIED, b""
+                head = [
+                    f"HTTP/1.1 {status.value} {status.phrase}",
+                    f"Content-Type: {content_type}; charset=utf-8",
+                    f"Content-Length: {len(body)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ]
+                if etag:
+                    head.append(f"ETag: {etag}")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                self._request_time.record((time.perf_counter_ns() - started) // 1000)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            logger.debug(f"API connection error: {e}")
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def start(self, socket_path: str = None, http: str = None) -> None:
+        """
+        Start listening.
+
+        Args:
+            socket_path (str, optional): The path of the Unix domain socket.
+            http (str, optional): '[HOST:]PORT' of the TCP listener, the host
+                defaults to 127.0.0.1.
+        """
+        if socket_path:
+            if not hasattr(asyncio, "start_unix_server"):
+                logger.error("Unix domain sockets are not supported on this platform")
+            else:
+                try:
+                    if stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                        # Left over by a previous run
+                        os.unlink(socket_path)
+                except FileNotFoundError:
+                    pass
+                server = await asyncio.start_unix_server(
+                    self.handle_connection, socket_path
+                )
+                self.servers.append(server)
+                self.socket_path = socket_path
+                logger.info(f"API listening on unix socket {socket_path}")
+        if http:
+            host, _, port = http.rpartition(":")
+            host = host or "127.0.0.1"
+            server = await asyncio.start_server(self.handle_connection, host, int(port))
+            self.servers.append(server)
+            logger.info(f"API listening on http://{host}:{port}")
+
+    async def close(self) -> None:
+        """Stop listening and remove the Unix domain socket."""
+        for server in self.servers:
+            server.close()
+        if self.dashboard is not None:
+            self.dashboard.close()
+        # Idle keep-alive connections would delay wait_closed
+        for writer in list(self.connections):
+            writer.close()
+        for server in self.servers:
+            await server.wait_closed()
+        self.servers.clear()
+        if self.socket_path:
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+            self.socket_path = None
@@ -0,0 +1,217 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from env_settings import settings
+from events import Reading
+from metrics import metrics
+from sinks import SinkAbstract
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+CSV_COLUMNS = (
+    "timestamp",
+    "address",
+    "name",
+    "temp",
+    "humidity",
+    "battery",
+    "battery_v",
+    "rssi",
+    "count",
+    "adapter",
+)
+
+
+class ArchiveSink(SinkAbstract):
+    """
+    Sink archiving readings to hourly rotated gzip files.
+
+    Readings are encoded as JSON lines or CSV rows into an in-memory buffer.
+    The buffer is compressed and written by a single background thread, so
+    the event loop never blocks on compression or disk I/O. Files are named
+    ``readings-YYYYMMDD-HH.jsonl.gz`` (or ``.csv.gz``) after the local time of
+    the readings and are fsynced only when they are rotated. On rotation
+    files older than the retention are removed.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        file_format: str = None,
+        retention_days: float = None,
+        flush_bytes: int = 256 * 1024,
+        flush_interval: float = 10.0,
+        compress_level: int = 6,
+    ):
+        """
+        Initialize the sink, defaults are read from the settings.
+
+        Args:
+            path (str): The archive directory.
+            file_format (str): 'jsonl' or 'csv'.
+            retention_days (float): Days the files are kept, 0 keeps them forever.
+            flush_bytes (int): Buffered bytes written at once.
+            flush_interval (float): Seconds after which the buffer is written.
+            compress_level (int): The gzip compression level.
+        """
+        self.path = Path(path or settings.ARCHIVE_DIR)
+        self.format = (file_format or settings.ARCHIVE_FORMAT).lower()
+        if self.format not in ("jsonl", "csv"):
+            raise ValueError(f"Unknown archive format: {self.format}")
+        self.retention_days = (
+            settings.ARCHIVE_RETENTION_DAYS
+            if retention_days is None
+            else retention_days
+        )
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.compress_level = compress_level
+        self.buffer = io.StringIO()
+        self.csv_writer = csv.writer(self.buffer, lineterminator="\n")
+        self.hour: tuple | None = None
+        self.file_path: Path | None = None
+        self.file: gzip.GzipFile | None = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="archive")
+        self._task: asyncio.Task | None = None
+        self._stop = asyncio.Event()
+        self._readings = metrics.counter("archive.readings")
+        self._bytes = metrics.counter("archive.bytes")
+        self._write_time = metrics.histogram("archive.write_us")
+
+    async def start(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._task = asyncio.create_task(self.run(), name="archive")
+
+    def file_name(self, hour: tuple) -> str:
+        year, month, day, hour_of_day = hour
+        return f"readings-{year:04}{month:02}{day:02}-{hour_of_day:02}.{self.format}.gz"
+
+    def encode(self, reading: Reading) -> None:
+        """Append the reading to the buffer."""
+        if self.format == "jsonl":
+            self.buffer.write(json.dumps(reading.as_dict(), ensure_ascii=False))
+            self.buffer.write("\n")
+        else:
+            self.csv_writer.writerow(
+                (
+                    reading.timestamp.isoformat(),
+                    reading.address,
+                    reading.name or "",
+                    reading.temp,
+                    reading.humidity,
+                    reading.battery,
+                    reading.battery_v,
+                    "" if reading.rssi is None else reading.rssi,
+                    reading.count,
+                    reading.adapter or "",
+                )
+            )
+
+    async def write(self, reading: Reading) -> None:
+        timestamp = reading.timestamp
+        hour = (timestamp.year, timestamp.month, timestamp.day, timestamp.hour)
+        if hour != self.hour:
+            await self.flush()
+            await self.submit(self._rotate, self.file_name(hour))
+            self.hour = hour
+        self.encode(reading)
+        self._readings.inc()
+        if self.buffer.tell() >= self.flush_bytes:
+            await self.flush()
+
+    async def submit(self, function, *args) -> None:
+        """Run the function on the archive thread, in submission order."""
+        await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def flush(self) -> None:
+        """Hand the buffered text over to the archive thread."""
+        if not self.buffer.tell():
+            return
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        await self.submit(self._write, text)
+
+    async def run(self) -> None:
+        """Write the buffer every flush interval until closed."""
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    # Methods below run on the archive thread
+
+    def _write(self, text: str) -> None:
+        started = time.perf_counter_ns()
+        data = text.encode("utf-8")
+        try:
+            self.file.write(data)
+        except (OSError, AttributeError) as e:
+            logger.error(f"Archive write to {self.file_path} failed: {e!r}")
+            return
+        self._bytes.inc(len(data))
+        self._write_time.record((time.perf_counter_ns() - started) // 1000)
+
+    def _close_file(self) -> None:
+        if self.file is None:
+            return
+        raw = self.file.fileobj
+        try:
+            self.file.close()
+            raw.flush()
+            os.fsync(raw.fileno())
+        except OSError as e:
+            logger.error(f"Archive close of {self.file_path} failed: {e!r}")
+        finally:
+            raw.close()
+            self.file = None
+
+    def _rotate(self, name: str) -> None:
+        self._close_file()
+        self.file_path = self.path.joinpath(name)
+        new_file = not self.file_path.exists()
+        try:
+            # Appending starts a new gzip member, readers see one stream
+            raw = open(self.file_path, "ab")
+        except OSError as e:
+            logger.error(f"Archive open of {self.file_path} failed: {e!r}")
+            return
+        self.file = gzip.GzipFile(
+            filename=name, mode="ab", fileobj=raw, compresslevel=self.compress_level
+        )
+        if new_file and self.format == "csv":
+            self.file.write((",".join(CSV_COLUMNS) + "\n").encode())
+        logger.debug(f"Archive file {self.file_path}")
+        self._sweep()
+
+    def _sweep(self) -> None:
+        if not self.retention_days:
+            return
+        expire = time.time() - self.retention_days * 86400
+        for path in self.path.glob(f"readings-*.{self.format}.gz"):
+            try:
+                if path != self.file_path and path.stat().st_mtime < expire:
+                    path.unlink()
+                    logger.info(f"Archive file {path} removed by retention")
+            except OSError as e:
+                logger.error(f"Archive retention of {path} failed: {e!r}")
+
+    async def close(self) -> None:
+        if self._task:
+            # Not cancelled, a cancelled flush could lose its text
+            self._stop.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        await self.submit(self._close_file)
+        self.executor.shutdown()
@@ -0,0 +1,273 @@
+import asyncio
+import inspect
+import logging
+import math
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from capture import read_capture
+from clock import get_clock
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+def bleak_backend(callback: Callable, scanning_mode: str = "passive", adapter=None):
+    """
+    Create a BleakScanner for the given adapter.
+
+    Args:
+        callback (Callable): The detection callback.
+        scanning_mode (str): Either 'active' or 'passive'.
+        adapter (str | None): The adapter name (e.g. 'hci1'). None is the default adapter.
+
+    Returns:
+        BleakScanner: The scanner, used as async context manager.
+    """
+    # bleak is imported only when BLE devices are scanned
+    from bleak import BleakScanner
+
+    kwargs = {"adapter": adapter} if adapter else {}
+    return BleakScanner(callback, scanning_mode=scanning_mode, **kwargs)
+
+
+@dataclass(frozen=True)
+class ReplayDevice:
+    address: str
+    name: str | None = None
+
+
+@dataclass(frozen=True)
+class ReplayAdvertisementData:
+    rssi: int
+    service_data: dict = field(default_factory=dict)
+
+
+class ReplaySession:
+    """
+    One running replay of a capture for a single adapter.
+
+    Used as async context manager in the same way as BleakScanner.
+    """
+
+    def __init__(self, backend: "ReplayBackend", callback: Callable, adapter=None):
+        self.backend = backend
+        self.callback = callback
+        self.adapter = adapter
+        self.task: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        """Feed the records of the capture to the callback."""
+        records = self.backend.get_records(self.adapter)
+        positions = self.backend.positions
+        self.backend.active_sessions += 1
+        completed = False
+        try:
+            while True:
+                prev_ts = None
+                # Resume where the previous session of the adapter stopped
+                while positions.get(self.adapter, 0) < len(records):
+                    position = positions.get(self.adapter, 0)
+                    positions[self.adapter] = position + 1
+                    record = records[position]
+                    ts = record.get("ts")
+                    if self.backend.speed and prev_ts is not None and ts is not None:
+                        await asyncio.sleep(max(0.0, ts - prev_ts) / self.backend.speed)
+                    else:
+                        await asyncio.sleep(0)
+                    prev_ts = ts
+                    device = ReplayDevice(record["address"], record.get("name"))
+                    advertising_data = ReplayAdvertisementData(
+                        record.get("rssi", 0),
+                        {self.backend.service_uuid: record["data"]},
+                    )
+                    result = self.callback(device, advertising_data)
+                    if inspect.isawaitable(result):
+                        await result
+                if not self.backend.loop:
+                    break
+                positions[self.adapter] = 0
+            completed = True
+        finally:
+            self.backend.active_sessions -= 1
+            if completed and self.backend.active_sessions == 0:
+                self.backend.finished.set()
+
+
+class ReplayBackend:
+    """
+    Fake scanner backend that replays a capture file instead of real hardware.
+
+    Records with an ``adapter`` key are only delivered to the session of that
+    adapter, records without it are delivered to every session (the default
+    adapter session receives everything). This allows multi-adapter scanning
+    to be exercised without BLE dongles. A new session of an adapter resumes
+    the replay where the previous one was closed.
+    """
+
+    ATC_SERVICE = "0000181a-0000-1000-8000-00805f9b34fb"
+
+    def __init__(
+        self,
+        path: str | Path = None,
+        speed: float = 1.0,
+        loop: bool = False,
+        records: list[dict] = None,
+        service_uuid: str = ATC_SERVICE,
+    ):
+        """
+        Initialize the replay backend.
+
+        Args:
+            path (str | Path): The capture file to replay.
+            speed (float): Replay speed factor, 0 replays as fast as possible.
+            loop (bool): Restart the capture from the beginning when it ends.
+            records (list[dict]): Records to replay instead of a capture file.
+            service_uuid (str): Service UUID used for the replayed service data.
+        """
+        self.records = records if records is not None else list(read_capture(path))
+        self.speed = speed
+        self.loop = loop
+        self.service_uuid = service_uuid
+        self.active_sessions = 0
+        self.positions: dict[str | None, int] = {}
+        self.finished = asyncio.Event()
+        logger.info(f"Replay backend loaded {len(self.records)} records")
+
+    def get_records(self, adapter=None) -> list[dict]:
+        """
+        Return the records delivered to the session of the adapter.
+
+        Args:
+            adapter (str | None): The adapter name of the session, the default
+                adapter session receives all records.
+
+        Returns:
+            list[dict]: The records.
+        """
+        if adapter is None:
+            return self.records
+        return [r for r in self.records if r.get("adapter") in (None, adapter)]
+
+    def __call__(
+        self, callback: Callable, scanning_mode: str = "passive", adapter=None
+    ):
+        return ReplaySession(self, callback, adapter)
+
+
+class SyntheticSession:
+    """
+    One running synthetic scan of a single adapter.
+
+    Used as async context manager in the same way as BleakScanner.
+    """
+
+    def __init__(self, backend: "SyntheticBackend", callback: Callable, adapter=None):
+        self.backend = backend
+        self.callback = callback
+        self.adapter = adapter
+        self.task: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        """Feed the advertisements of all devices, round robin."""
+        backend = self.backend
+        step = backend.adv_interval / len(backend.devices)
+        while True:
+            for index, device in enumerate(backend.devices):
+                await asyncio.sleep(step)
+                result = self.callback(device, backend.advertisement(index))
+                if inspect.isawaitable(result):
+                    await result
+
+
+class SyntheticBackend:
+    """
+    Fake scanner backend generating PVVX advertisements of simulated devices.
+
+    Every device advertises every ``adv_interval`` seconds and takes a new
+    measurement (a new frame counter) every ``measure_interval`` seconds, so
+    frames are repeated as by real devices. The measurements follow a daily
+    temperature and humidity cycle of the current clock time; sessions of
+    several adapters receive the same frames. Used for soak tests, usually in
+    virtual time.
+    """
+
+    ATC_SERVICE = "0000181a-0000-1000-8000-00805f9b34fb"
+
+    def __init__(
+        self,
+        devices: int = 20,
+        adv_interval: float = 2.5,
+        measure_interval: float = 10.0,
+        seed: int = 0,
+        service_uuid: str = ATC_SERVICE,
+    ):
+        """
+        Initialize the synthetic backend.
+
+        Args:
+            devices (int): The number of simulated devices.
+            adv_interval (float): Seconds between advertisements of a device.
+            measure_interval (float): Seconds between measurements of a device.
+            seed (int): Seed of the per-device offsets and RSSI noise.
+            service_uuid (str): Service UUID of the generated service data.
+        """
+        self.adv_interval = adv_interval
+        self.measure_interval = measure_interval
+        self.service_uuid = service_uuid
+        self.random = random.Random(seed)
+        self.devices = []
+        self.offsets = []
+        for i in range(1, devices + 1):
+            mac = f"A4:C1:38:{i >> 16 & 255:02X}:{i >> 8 & 255:02X}:{i & 255:02X}"
+            self.devices.append(ReplayDevice(mac, "ATC_" + mac.replace(":", "")[-6:]))
+            self.offsets.append(self.random.uniform(-4, 4))
+        logger.info(f"Synthetic backend with {devices} devices")
+
+    def advertisement(self, index: int) -> ReplayAdvertisementData:
+        """Return the advertisement of the device at the current clock time."""
+        device = self.devices[index]
+        measurement = int(get_clock().time() // self.measure_interval)
+        # The values only change with the measurement, repeats are identical
+        day = 2 * math.pi * measurement * self.measure_interval / 86400
+        temp = 21 + self.offsets[index] + 6 * math.sin(day + index)
+        humidity = 50 + 15 * math.cos(day + index)
+        data = (
+            bytes.fromhex(device.address.replace(":", ""))[::-1]
+            + round(temp * 100).to_bytes(2, "little", signed=True)
+            + round(humidity * 100).to_bytes(2, "little", signed=True)
+            + (3000 - index).to_bytes(2, "little")
+            + bytes((90, measurement % 256, 0))
+        )
+        rssi = -60 - index % 30 + self.random.randint(-3, 3)
+        return ReplayAdvertisementData(rssi, {self.service_uuid: data})
+
+    def __call__(
+        self, callback: Callable, scanning_mode: str = "passive", adapter=None
+    ):
+        return SyntheticSession(self, callback, adapter)
@@ -0,0 +1,456 @@
+"""
+Backtesting of the temperature alerts over recorded readings.
+
+Replays captures ('.pvcap' or JSON lines) or archived readings (the
+'readings-*.jsonl.gz' / '.csv.gz' files of the archive sink) through the
+alert logic of the scanner and reports the notifications the thresholds
+would have produced, without sending any.
+
+Usage:
+    python backtest.py SOURCE [SOURCE ...] [-lt LOW] [-ht HIGH] [-st DELTA]
+
+The threshold checks of all readings are evaluated at once with NumPy. The
+notification dedup (a new notification only after the temperature moved by
+more than the sent threshold) depends on the previous notification of the
+device, it runs on the alerting readings only, with the method of the
+scanner itself. ``--verify`` replays the readings through
+``BLEScanner.monitor_thresholds`` as well and compares the notifications.
+"""
+
+import argparse
+import asyncio
+import csv
+import datetime
+import gzip
+import json
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("NumPy is required: pip install numpy (or the 'analysis' extra)")
+
+from backends import ReplayDevice
+from batch_decode import decode, dedup, format_address, load_capture
+from blescanner import BLEScanner
+from capture import BINARY_SUFFIX
+from env_settings import settings
+from notifications import ManagerNotifications, NotificationAbstract
+from outputs import NullOutput
+
+# Codes of the alert types of the readings
+ALERT_NONE, ALERT_LOW, ALERT_HIGH = 0, 1, 2
+ALERT_TYPES = {ALERT_LOW: "low", ALERT_HIGH: "high"}
+
+
+class Readings:
+    """Readings as columns: time, device index and temperature."""
+
+    def __init__(self, ts: np.ndarray, device: np.ndarray, temp: np.ndarray, names):
+        self.ts = ts
+        self.device = device
+        self.temp = temp
+        self.names: list[str] = names
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def select(self, mask: np.ndarray) -> "Readings":
+        return Readings(self.ts[mask], self.device[mask], self.temp[mask], self.names)
+
+
+def new_scanner(custom_names: dict = None, **thresholds) -> BLEScanner:
+    """Return a scanner without backend and output, used for its alert logic."""
+    return BLEScanner(
+        output=NullOutput(),
+        notification=ManagerNotifications([]),
+        custom_names=custom_names,
+        use_text_pos=False,
+        **thresholds,
+    )
+
+
+def load_capture_readings(path: Path, scanner: BLEScanner) -> Readings:
+    """
+    Load the deduplicated readings of a capture, named as the scanner does.
+
+    Args:
+        path (Path): A binary or JSON lines capture.
+        scanner (BLEScanner): The scanner used for the device names.
+
+    Returns:
+        Readings: The readings.
+    """
+    frames, _ = load_capture(path)
+    decoded = decode(frames)
+    decoded = decoded[dedup(decoded)]
+    addresses, device = np.unique(decoded["address"], return_inverse=True)
+    names = []
+    for address in addresses.tolist():
+        replay_device = ReplayDevice(format_address(address))
+        names.append(
+            scanner.custom_name(replay_device.name)
+            or scanner.generate_device_name(replay_device)
+        )
+    return Readings(decoded["ts"].copy(), device, decoded["temp"].copy(), names)
+
+
+def read_archive(path: Path):
+    """Yield (timestamp, name, temp) of an archive file."""
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        if path.name.endswith(".csv.gz"):
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for record in records:
+            yield (
+                datetime.datetime.fromisoformat(record["timestamp"]).timestamp(),
+                record["name"] or record["address"],
+                float(record["temp"]),
+            )
+
+
+def load_archive_readings(paths: list[Path]) -> Readings:
+    """Load the readings of archive files, in the order of the files."""
+    ts, devices, temps = [], [], []
+    index: dict[str, int] = {}
+    for path in paths:
+        for timestamp, name, temp in read_archive(path):
+            ts.append(timestamp)
+            devices.append(index.setdefault(name, len(index)))
+            temps.append(temp)
+    return Readings(
+        np.array(ts, "<f8"),
+        np.array(devices, "<i4"),
+        np.array(temps, "<f8"),
+        list(index),
+    )
+
+
+def load_readings(sources: list[str], scanner: BLEScanner) -> Readings:
+    """
+    Load and merge the readings of captures, archive files and directories.
+
+    Returns:
+        Readings: The readings in time order.
+    """
+    archives: list[Path] = []
+    parts: list[Readings] = []
+    for source in map(Path, sources):
+        if source.is_dir():
+            archives.extend(sorted(source.glob("readings-*.gz")))
+        elif source.name.endswith(".gz"):
+            archives.append(source)
+        elif source.suffix in (BINARY_SUFFIX, ".jsonl", ".json"):
+            parts.append(load_capture_readings(source, scanner))
+        else:
+            raise ValueError(f"Unknown source: {source}")
+    if archives:
+        parts.append(load_archive_readings(archives))
+    if not parts:
+        return Readings(np.zeros(0), np.zeros(0, "<i4"), np.zeros(0), [])
+    # Devices of all sources share the index of their names
+    index: dict[str, int] = {}
+    devices = []
+    for part in parts:
+        remap = np.array(
+            [index.setdefault(name, len(index)) for name in part.names], "<i4"
+        )
+        devices.append(remap[part.device] if len(part) else part.device)
+    ts = np.concatenate([part.ts for part in parts])
+    order = np.argsort(ts, kind="stable")
+    return Readings(
+        ts[order],
+        np.concatenate(devices).astype("<i4")[order],
+        np.concatenate([part.temp for part in parts])[order],
+        list(index),
+    )
+
+
+def classify(temp: np.ndarray, low: float | None, high: float | None) -> np.ndarray:
+    """
+    Return the alert type code of every temperature, as monitor_thresholds.
+
+    The high threshold wins when both thresholds match.
+    """
+    alert = np.full(len(temp), ALERT_NONE, "u1")
+    if low is not None:
+        alert[temp <= low] = ALERT_LOW
+    if high is not None:
+        alert[temp >= high] = ALERT_HIGH
+    return alert
+
+
+def backtest(readings: Readings, scanner: BLEScanner) -> dict:
+    """
+    Evaluate the alerts of the readings with the thresholds of the scanner.
+
+    Args:
+        readings (Readings): The readings in time order.
+        scanner (BLEScanner): The scanner providing thresholds and the dedup of
+            the notifications, its state is updated.
+
+    Returns:
+        dict: The alert type of every reading ('alert'), the indexes of the
+            readings sent as notification ('sent') and the alert periods per
+            device as (device, type, start, end) ('episodes').
+    """
+    alert = classify(
+        readings.temp, scanner.alert_low_threshold, scanner.alert_high_threshold
+    )
+    # Alert periods: changes of the alert type in the readings of a device
+    order = np.argsort(readings.device, kind="stable")
+    device = readings.device[order]
+    state = alert[order]
+    boundary = np.ones(len(order), bool)
+    boundary[1:] = (device[1:] != device[:-1]) | (state[1:] != state[:-1])
+    starts = np.flatnonzero(boundary)
+    ends = np.append(starts[1:], len(order)) - 1
+    in_alert = state[starts] != ALERT_NONE
+    starts, ends = starts[in_alert], ends[in_alert]
+    # A period lasts until the first reading after it, or its last reading
+    after = np.minimum(ends + 1, len(order) - 1)
+    closed = (ends + 1 < len(order)) & (device[after] == device[ends])
+    end_index = np.where(closed, order[after], order[ends])
+    episodes = list(
+        zip(
+            device[starts].tolist(),
+            state[starts].tolist(),
+            readings.ts[order[starts]].tolist(),
+            readings.ts[end_index].tolist(),
+        )
+    )
+    # The notification dedup is sequential, run on the alerting readings only
+    sent = []
+    names = readings.names
+    candidates = np.flatnonzero(alert)
+    for i, device_index, temp in zip(
+        candidates.tolist(),
+        readings.device[candidates].tolist(),
+        readings.temp[candidates].tolist(),
+    ):
+        if scanner.is_need_send_alert(names[device_index], temp):
+            sent.append(i)
+    return {"alert": alert, "sent": np.array(sent, "<i8"), "episodes": episodes}
+
+
+class RecordingNotification(NotificationAbstract):
+    """Notification keeping the alerts instead of sending them."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.alerts: list[tuple] = []
+
+    async def send_alert(self, title=None, message=None, params=None) -> None:
+        self.alerts.append((title, message))
+
+
+async def replay_alerts(readings: Readings, scanner: BLEScanner) -> list[tuple]:
+    """
+    Run the readings through monitor_thresholds of the scanner.
+
+    Returns:
+        list[tuple]: The (title, message) of the notifications.
+    """
+    recorder = RecordingNotification()
+    scanner.notification = ManagerNotifications([recorder])
+    names = readings.names
+    for device_index, temp in zip(readings.device.tolist(), readings.temp.tolist()):
+        await scanner.monitor_thresholds(names[device_index], temp)
+    return recorder.alerts
+
+
+def verify(readings: Readings, result: dict, scanner: BLEScanner) -> int:
+    """
+    Compare the notifications with the streaming alert logic.
+
+    Returns:
+        int: The number of mismatching notifications, 0 when identical.
+    """
+    expected = []
+    for i in result["sent"].tolist():
+        alert = int(result["alert"][i])
+        threshold_type, threshold = (
+            (0, scanner.alert_low_threshold)
+            if alert == ALERT_LOW
+            else (2, scanner.alert_high_threshold)
+        )
+        expected.append(
+            scanner.generate_title_message(
+                readings.names[readings.device[i]],
+                float(readings.temp[i]),
+                threshold_type=threshold_type,
+                threshold_value=threshold,
+            )
+        )
+    replayed = asyncio.run(replay_alerts(readings, scanner))
+    mismatches = sum(1 for a, b in zip(expected, replayed) if a != b)
+    mismatches += abs(len(expected) - len(replayed))
+    print(
+        f"verify: backtest {len(expected)} notifications, "
+        f"monitor_thresholds {len(replayed)} notifications, {mismatches} mismatches"
+    )
+    return mismatches
+
+
+def format_time(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def report(readings: Readings, result: dict, list_sent: bool = False) -> None:
+    """Print the alert counts, timings and the breakdown per device."""
+    alert, sent = result["alert"], result["sent"]
+    devices = len(readings.names)
+    per_device = np.bincount(readings.device, minlength=devices)
+    span = (readings.ts[-1] - readings.ts[0]) if len(readings) else 0.0
+    days = max(span / 86400, 1 / 24)
+    sent_types = alert[sent]
+    print(
+        f"{len(readings)} readings of {np.count_nonzero(per_device)} devices"
+        + (
+            f" from {format_time(readings.ts[0])} to {format_time(readings.ts[-1])}"
+            if len(readings)
+            else ""
+        )
+    )
+    print(
+        f"Alerting readings: {np.count_nonzero(alert)} "
+        f"(low {np.count_nonzero(alert == ALERT_LOW)}, "
+        f"high {np.count_nonzero(alert == ALERT_HIGH)}), "
+        f"alert periods: {len(result['episodes'])}"
+    )
+    print(
+        f"Notifications: {len(sent)} "
+        f"(low {np.count_nonzero(sent_types == ALERT_LOW)}, "
+        f"high {np.count_nonzero(sent_types == ALERT_HIGH)}), "
+        f"{len(sent) / days:.1f} per day"
+    )
+    if len(sent):
+        hours = Counter(
+            datetime.datetime.fromtimestamp(ts).hour
+            for ts in readings.ts[sent].tolist()
+        )
+        busiest = ", ".join(f"{hour:02}h: {n}" for hour, n in hours.most_common(3))
+        print(f"Busiest hours: {busiest}")
+
+    alerting = np.bincount(readings.device[alert != ALERT_NONE], minlength=devices)
+    notified = np.bincount(readings.device[sent], minlength=devices)
+    periods = Counter(device for device, *_ in result["episodes"])
+    alert_time = Counter()
+    for device, _, start, end in result["episodes"]:
+        alert_time[device] += end - start
+    first, last = {}, {}
+    for device, ts in zip(readings.device[sent].tolist(), readings.ts[sent].tolist()):
+        first.setdefault(device, ts)
+        last[device] = ts
+    print()
+    print(
+        f"{'Device':<20} {'Readings':>9} {'Alerting':>9} {'Periods':>8} "
+        f"{'In alert':>9} {'Sent':>6}  First / last notification"
+    )
+    for device in np.argsort(-notified, kind="stable").tolist():
+        if not per_device[device]:
+            continue
+        times = (
+            f"{format_time(first[device])} / {format_time(last[device])}"
+            if device in first
+            else ""
+        )
+        print(
+            f"{readings.names[device][:20]:<20} {per_device[device]:>9} "
+            f"{alerting[device]:>9} {periods[device]:>8} "
+            f"{alert_time[device] / 3600:>8.1f}h {notified[device]:>6}  {times}"
+        )
+    if list_sent:
+        print()
+        for i in sent.tolist():
+            print(
+                f"{format_time(readings.ts[i])} {readings.names[readings.device[i]]}: "
+                f"{readings.temp[i]:.2f} °C {ALERT_TYPES[int(alert[i])]}"
+            )
+
+
+def parse_time(value: str) -> float:
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def parse_threshold(value: str) -> float | None:
+    return float(value) if value.lower() != "none" else None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Backtest the temperature alerts over recorded readings"
+    )
+    parser.add_argument(
+        "sources",
+        nargs="+",
+        help="Captures (.pvcap, .jsonl), archive files (.jsonl.gz, .csv.gz) "
+        "or archive directories",
+    )
+    parser.add_argument(
+        "-lt",
+        "--alert-low-threshold",
+        type=parse_threshold,
+        default=settings.ALERT_LOW_THRESHOLD,
+        help=f"The low temperature threshold, 'None' disables it. Default is {settings.ALERT_LOW_THRESHOLD}.",
+    )
+    parser.add_argument(
+        "-ht",
+        "--alert-high-threshold",
+        type=parse_threshold,
+        default=settings.ALERT_HIGH_THRESHOLD,
+        help=f"The high temperature threshold, 'None' disables it. Default is {settings.ALERT_HIGH_THRESHOLD}.",
+    )
+    parser.add_argument(
+        "-st",
+        "--sent_threshold_temp",
+        type=float,
+        default=settings.SENT_THRESHOLD_TEMP,
+        help=f"The temperature change for the next notification. Default is {settings.SENT_THRESHOLD_TEMP}.",
+    )
+    parser.add_argument("--start", type=parse_time, help="Start time (ISO format)")
+    parser.add_argument("--end", type=parse_time, help="End time (ISO format)")
+    parser.add_argument("--list", action="store_true", help="List every notification")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Compare with the alert logic of the scanner reading by reading",
+    )
+    args = parser.parse_args()
+
+    thresholds = {
+        "alert_low_threshold": args.alert_low_threshold,
+        "alert_high_threshold": args.alert_high_threshold,
+        "sent_theshold_temp": args.sent_threshold_temp,
+    }
+    scanner = new_scanner(settings.ATC_CUSTOM_NAMES, **thresholds)
+    started = time.perf_counter()
+    readings = load_readings(args.sources, scanner)
+    if args.start is not None or args.end is not None:
+        mask = np.ones(len(readings), bool)
+        if args.start is not None:
+            mask &= readings.ts >= args.start
+        if args.end is not None:
+            mask &= readings.ts < args.end
+        readings = readings.select(mask)
+    loaded = time.perf_counter()
+    result = backtest(readings, scanner)
+    done = time.perf_counter()
+    print(
+        f"Thresholds: low {args.alert_low_threshold}, high {args.alert_high_threshold}, "
+        f"sent threshold {args.sent_threshold_temp}"
+    )
+    report(readings, result, args.list)
+    print(f"\nLoaded in {loaded - started:.3f}s, evaluated in {done - loaded:.3f}s")
+    if args.verify:
+        reference = new_scanner(settings.ATC_CUSTOM_NAMES, **thresholds)
+        if verify(readings, result, reference):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+Vectorized batch decoding of capture files with NumPy.
+
+Binary captures ('.pvcap', written with ``--capture FILE.pvcap``) are
+memory-mapped as a structured array, JSON lines captures are parsed once
+into the same layout. Temperature, humidity, battery and frame counter are
+decoded for all frames in one vectorized pass, followed by the frame counter
+dedup of the scanner.
+
+Usage:
+    python batch_decode.py CAPTURE [--csv FILE] [--verify]
+
+``--verify`` replays the capture through the streaming decoder of the
+scanner and compares every accepted reading.
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:
+    sys.exit("NumPy is required: pip install numpy (or the 'analysis' extra)")
+
+from capture import (
+    BINARY_HEADER_SIZE,
+    BINARY_RECORD,
+    BINARY_SUFFIX,
+    read_binary_header,
+    read_capture,
+)
+
+# Layout of BINARY_RECORD
+RECORD_DTYPE = np.dtype(
+    [
+        ("ts", "<f8"),
+        ("address", "u1", (6,)),
+        ("rssi", "i1"),
+        ("adapter", "u1"),
+        ("length", "u1"),
+        ("data", "u1", (20,)),
+        ("pad", "V3"),
+    ]
+)
+assert RECORD_DTYPE.itemsize == BINARY_RECORD.size
+
+DECODED_DTYPE = np.dtype(
+    [
+        ("ts", "<f8"),
+        ("address", "<u8"),
+        ("adapter", "u1"),
+        ("rssi", "i1"),
+        ("temp", "<f8"),
+        ("humidity", "<f8"),
+        ("battery_v", "<f8"),
+        ("battery", "u1"),
+        ("count", "u1"),
+    ]
+)
+
+# Recent frame counters per device compared by the dedup, as in BLEScanner
+DEDUP_WINDOW = 16
+# Vectorized dedup passes before the devices still changing are scanned
+DEDUP_MAX_PASSES = 8
+RSSI_UNKNOWN = -128
+
+
+def load_capture(path: str | Path) -> tuple[np.ndarray, list[str | None]]:
+    """
+    Load a capture as structured array of raw frames.
+
+    Args:
+        path (str | Path): A binary ('.pvcap') or JSON lines capture.
+
+    Returns:
+        tuple[np.ndarray, list[str | None]]: The frames (memory-mapped for
+            binary captures) and the adapter names by index.
+    """
+    path = Path(path)
+    if path.suffix == BINARY_SUFFIX:
+        adapters = read_binary_header(path)
+        count = (path.stat().st_size - BINARY_HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.zeros(0, RECORD_DTYPE), adapters
+        frames = np.memmap(
+            path, RECORD_DTYPE, mode="r", offset=BINARY_HEADER_SIZE, shape=(count,)
+        )
+        return frames, adapters
+    records = list(read_capture(path))
+    frames = np.zeros(len(records), RECORD_DTYPE)
+    adapters: list[str | None] = [None]
+    kept = 0
+    for record in records:
+        try:
+            address = bytes.fromhex(record["address"].replace(":", ""))
+        except ValueError:
+            continue
+        if len(address) != 6:
+            continue
+        adapter = record.get("adapter")
+        if adapter not in adapters:
+            adapters.append(adapter)
+        data = record["data"][:20]
+        frame = frames[kept]
+        frame["ts"] = record.get("ts") or 0.0
+        frame["address"] = np.frombuffer(address, "u1")
+        rssi = record.get("rssi")
+        frame["rssi"] = RSSI_UNKNOWN if rssi is None else rssi
+        frame["adapter"] = adapters.index(adapter)
+        frame["length"] = len(data)
+        frame["data"][: len(data)] = np.frombuffer(data, "u1")
+        kept += 1
+    return frames[:kept], adapters
+
+
+def _le16(data: np.ndarray, offset: int, signed: bool) -> np.ndarray:
+    value = np.ascontiguousarray(data[:, offset : offset + 2]).view("<u2")[:, 0]
+    return value.view("<i2") if signed else value
+
+
+def decode(frames: np.ndarray) -> np.ndarray:
+    """
+    Decode the PVVX fields of all frames.
+
+    Args:
+        frames (np.ndarray): Raw frames of ``RECORD_DTYPE``.
+
+    Returns:
+        np.ndarray: The decoded frames of ``DECODED_DTYPE``, frames without
+            frame counter (shorter than 14 bytes) are left out.
+    """
+    frames = frames[frames["length"] >= 14]
+    data = frames["data"]
+    decoded = np.empty(len(frames), DECODED_DTYPE)
+    decoded["ts"] = frames["ts"]
+    address = frames["address"].astype("<u8")
+    shifts = np.array([40, 32, 24, 16, 8, 0], "<u8")
+    decoded["address"] = (address << shifts).sum(axis=1, dtype="<u8")
+    decoded["adapter"] = frames["adapter"]
+    decoded["rssi"] = frames["rssi"]
+    # Same arithmetic as the streaming decoder, the floats are identical
+    decoded["temp"] = _le16(data, 6, signed=True) / 100.0
+    decoded["humidity"] = _le16(data, 8, signed=True) / 100.0
+    decoded["battery_v"] = _le16(data, 10, signed=False) / 1000.0
+    decoded["battery"] = data[:, 12]
+    decoded["count"] = data[:, 13]
+    return decoded
+
+
+def dedup(decoded: np.ndarray, window: int = DEDUP_WINDOW) -> np.ndarray:
+    """
+    Return the mask of accepted frames, dropping repeated frame counters.
+
+    A frame is a duplicate when its counter is one of the last ``window``
+    accepted counters of the device, as in the streaming decoder. Frames are
+    grouped per device with a stable sort, repeats of the previous frame of
+    the device are removed first, then every remaining frame is compared
+    with the ``window`` accepted frames before it.
+
+    Args:
+        decoded (np.ndarray): Decoded frames in reception order.
+        window (int): The number of recent counters compared.
+
+    Returns:
+        np.ndarray: Boolean mask of the accepted frames.
+    """
+    n = len(decoded)
+    if n == 0:
+        return np.zeros(0, bool)
+    order = np.argsort(decoded["address"], kind="stable")
+    # (address, counter) packed into one key, a frame is compared at once
+    key = (decoded["address"][order] << np.uint64(8)) | decoded["count"][order]
+    duplicate = np.zeros(n, bool)
+    duplicate[1:] = key[1:] == key[:-1]
+    kept = np.flatnonzero(~duplicate)
+    key = key[kept]
+    accepted = np.ones(len(key), bool)
+    # The window holds accepted counters only: iterated until stable, every
+    # pass settles at least the next frame of each device, real captures
+    # settle after a few passes
+    changed = None
+    for _ in range(DEDUP_MAX_PASSES):
+        accepted_key = key[accepted]
+        before = np.cumsum(accepted) - accepted
+        repeated = np.zeros(len(key), bool)
+        for k in range(1, min(window, len(accepted_key)) + 1):
+            previous = accepted_key[np.maximum(before - k, 0)]
+            repeated |= (key == previous) & (before >= k)
+        changed = accepted == repeated
+        accepted = ~repeated
+        if not changed.any():
+            break
+    else:
+        # Changes of the window still cascade (e.g. a device in a reboot
+        # loop), these devices are scanned sequentially in O(n * window)
+        addresses = key >> np.uint64(8)
+        for address in np.unique(addresses[changed]):
+            start = np.searchsorted(addresses, address, "left")
+            end = np.searchsorted(addresses, address, "right")
+            accepted[start:end] = _scan_counters(key[start:end] & 0xFF, window)
+    duplicate[kept[~accepted]] = True
+    accepted = np.empty(n, bool)
+    accepted[order] = ~duplicate
+    return accepted
+
+
+def _scan_counters(counters: np.ndarray, window: int) -> np.ndarray:
+    """Return the mask of accepted counters of one device, frame by frame."""
+    accepted = np.ones(len(counters), bool)
+    seen = deque(maxlen=window)
+    for i, count in enumerate(counters.tolist()):
+        if count in seen:
+            accepted[i] = False
+        else:
+            seen.append(count)
+    return accepted
+
+
+def format_address(address: int) -> str:
+    return address.to_bytes(6, "big").hex(":").upper()
+
+
+def write_csv(path: str | Path, readings: np.ndarray, adapters: list) -> None:
+    """Write the decoded readings as CSV."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ts,address,adapter,rssi,temp,humidity,battery_v,battery,count\n")
+        for row in readings.tolist():
+            ts, address, adapter, rssi, temp, humidity, battery_v, battery, count = row
+            f.write(
+                f"{ts:.3f},{format_address(address)},{adapters[adapter] or ''},"
+                f"{'' if rssi == RSSI_UNKNOWN else rssi},{temp},{humidity},"
+                f"{battery_v},{battery},{count}\n"
+            )
+
+
+async def stream_decode(path: str | Path) -> list[tuple]:
+    """
+    Decode the capture with the streaming decoder of the scanner.
+
+    Returns:
+        list[tuple]: (address, count, temp, humidity, battery_v, battery, rssi)
+            of every accepted reading in order.
+    """
+    from backends import ReplayBackend
+    from blescanner import BLEScanner
+    from events import EventBus
+    from notifications import ManagerNotifications
+    from outputs import NullOutput
+
+    readings = []
+    bus = EventBus()
+    bus.subscribe(
+        "verify",
+        lambda r: readings.append(
+            (r.address, r.count, r.temp, r.humidity, r.battery_v, r.battery, r.rssi)
+        ),
+        overflow="block",
+    )
+    backend = ReplayBackend(path, speed=0)
+    scanner = BLEScanner(
+        output=NullOutput(),
+        notification=ManagerNotifications([]),
+        use_text_pos=False,
+        mode="passive",
+        backend=backend,
+        bus=bus,
+    )
+    finished = asyncio.create_task(backend.finished.wait())
+    finished.add_done_callback(lambda _: scanner.stop_event.set())
+    await scanner.start_scanning()
+    await bus.close()
+    return readings
+
+
+def verify(path: str | Path, readings: np.ndarray) -> int:
+    """
+    Compare the batch decoded readings with the streaming decoder.
+
+    Returns:
+        int: The number of mismatching readings, 0 when identical.
+    """
+    streamed = asyncio.run(stream_decode(path))
+    batch = [
+        (
+            format_address(address),
+            count,
+            temp,
+            humidity,
+            battery_v,
+            battery,
+            None if rssi == RSSI_UNKNOWN else rssi,
+        )
+        for _, address, _, rssi, temp, humidity, battery_v, battery, count in (
+            readings.tolist()
+        )
+    ]
+    mismatches = sum(1 for a, b in zip(batch, streamed) if a != b)
+    mismatches += abs(len(batch) - len(streamed))
+    print(
+        f"verify: batch {len(batch)} readings, streaming {len(streamed)} readings, "
+        f"{mismatches} mismatches"
+    )
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch decoder of capture files")
+    parser.add_argument("capture", help="Binary (.pvcap) or JSON lines capture")
+    parser.add_argument("--csv", metavar="FILE", help="Write the readings as CSV")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Compare with the streaming decoder of the scanner",
+    )
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    frames, adapters = load_capture(args.capture)
+    loaded = time.perf_counter()
+    decoded = decode(frames)
+    readings = decoded[dedup(decoded)]
+    done = time.perf_counter()
+    print(
+        f"{len(frames)} frames loaded in {loaded - started:.3f}s, "
+        f"{len(readings)} readings decoded in {done - loaded:.3f}s"
+    )
+    if args.csv:
+        write_csv(args.csv, readings, adapters)
+    if args.verify and verify(args.capture, readings):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,47 @@
 import asyncio
+import contextlib
 import datetime
-from functools import wraps
+from collections import deque
 import logging
-from typing import Literal
-
-from bleak import BleakScanner, BleakError
-
+import sys
+import time
+from typing import TYPE_CHECKING, Callable, Literal
+
+from clock import Clock, get_clock
+from events import EventBus, Reading
+from link_quality import LinkQuality, LinkQualityTracker
+from metrics import metrics
 from notifications import ManagerNotifications
 
 from outputs import ConsolePrint, PrintAbstract
 
+if TYPE_CHECKING:
+    # Optional features, imported by main only when enabled
+    from capture import CaptureWriter
+    from scheduler import DutyCycleScheduler
+    from virtual_devices import VirtualDevices
+
 logger = logging.getLogger(f"BLEScanner.{__name__}")
 
 
-def output_cols(func):
-    @wraps(func)
-    async def wrapper(self, *args, **kwargs):
-        address = args[0] if len(args) > 0 else kwargs.get("address")
-        if address is not None:
-            device = self.atc_devices.get(address, {})
-            device_id = device.get("id")
-            if device_id is not None:
-                pos_x = self.TEXT_WIDTH * (device_id % self.COLS)
-                pos_y = self.LINE_HEIGHT * (device_id // self.COLS) + 1
-                self.set_text_pos(pos_x, pos_y)
+class ScannerStalledError(Exception):
+    """No advertisement was received within the watchdog timeout."""
 
-        await func(self, *args, **kwargs)
 
-        if address is not None:
-            self.shift_text_pos(dy=2)
-            self.set_text_pos(x=0)
+def scan_errors() -> tuple[type[Exception], ...]:
+    """
+    Return the errors of a scan mode after which the next mode is tried.
 
-    return wrapper
+    bleak is imported only by the BLE backend, its errors are matched once it
+    was loaded.
+
+    Returns:
+        tuple[type[Exception], ...]: The error types.
+    """
+    bleak_exc = sys.modules.get("bleak.exc")
+    if bleak_exc is None:
+        return (ScannerStalledError,)
+    return (ScannerStalledError, bleak_exc.BleakError)
 
 
 class BLEScanner:
@@ -43,6 +53,8 @@ class BLEScanner:
     LINE_HEIGHT = 5
     SENT_THRESHOLD_TEMP = 1
     ATC_SERVICE = "0000181a-0000-1000-8000-00805f9b34fb"
+    # Number of recent frame counters per device kept for deduplication
+    DEDUP_WINDOW = 16
 
     def __init__(
         self,
@@ -54,11 +66,33 @@ class BLEScanner:
         use_text_pos: bool = True,
         sent_theshold_temp: float = SENT_THRESHOLD_TEMP,
         mode: str = "auto",  # all, passive, active
+        adapters: list[str] = None,
+        backend: Callable = None,
+        capture: "CaptureWriter" = None,
+        watchdog: float = None,
+        scheduler: "DutyCycleScheduler" = None,
+        bus: EventBus = None,
+        forwarder=None,
+        clock: Clock = None,
+        virtual_devices: "VirtualDevices" = None,
     ):
         self.output = output or ConsolePrint()
         self.stop_event = asyncio.Event()
+        # Set while the scanners of all adapters are running
+        self.scanning = asyncio.Event()
+        self.active_mode: str | None = None
+        # Source of the time, virtual in simulations (clock.VirtualClock)
+        self.clock = clock or get_clock()
+        self.watchdog = watchdog
+        self.scheduler = scheduler
+        # Display and alerts consume the readings published on the bus
+        self.bus = bus or EventBus()
+        self.bus.subscribe("display", self.on_reading_display)
+        self.bus.subscribe("alerts", self.on_reading_alert, maxsize=10000)
+        self.last_advertisement: float | None = None
         self.atc_counters = {}
         self.atc_date = {}
+        self.atc_monotonic = {}
         self.atc_custom_names = custom_names or {}
         self.atc_devices = {}
         self.print_pos = {"x": 0, "y": 0}
@@ -67,8 +101,40 @@ class BLEScanner:
         self.notification = notification
         self.use_text_pos = use_text_pos
         self.cache_sent_alert = {}
+        # Devices out of the thresholds, bumped version on every change
+        self.active_alerts: dict[str, dict] = {}
+        self.alerts_version = 0
         self.sent_threshold_temp = sent_theshold_temp
         self.mode = mode
+        # None is the default adapter of the platform
+        self.adapters = adapters or [None]
+        if backend is None:
+            from backends import bleak_backend
+
+            backend = bleak_backend
+        self.backend = backend
+        self.capture = capture
+        # Forwards the advertisements to an aggregator (wire.WireForwarder)
+        self.forwarder = forwarder
+        # Groups of devices published as devices of their own
+        self.virtual_devices = virtual_devices
+        self.atc_seen_counters = {}
+        self.atc_rssi = {}
+        # Adapter credited with the best RSSI of the latest frame of a device
+        self.atc_rssi_adapter = {}
+        self.link_quality = LinkQualityTracker()
+        self.metric_callbacks = metrics.counter("ble.callbacks")
+        self.metric_advertisements = metrics.counter("ble.advertisements")
+        self.metric_duplicates = metrics.counter("ble.duplicates")
+        self.metric_readings = metrics.counter("ble.readings")
+        self.metric_decode = metrics.histogram("ble.decode_us")
+        self.metric_alert_evaluation = metrics.histogram("alerts.evaluate_us")
+        metrics.register_collector("adapters", self.get_adapter_stats)
+        metrics.register_collector("link", self.get_link_stats)
+        self.adapter_stats = {
+            self.adapter_name(adapter): self.new_adapter_stats()
+            for adapter in self.adapters
+        }
         assert self.output is not None, "Output is not set"
 
     def set_text_pos(self, x: int = None, y: int = None) -> None:
@@ -88,7 +154,7 @@ class BLEScanner:
         return self.print_pos.copy()
 
     async def print_text(self, text: str, max_width: int = None) -> None:
-        """Print text at the current cursor position."""
+        """Print text at the current cursor position, under ``output.lock``."""
         pos = self.get_text_pos_dict() if self.use_text_pos else None
         await self.output.print_value(self.align_line_width(text, max_width), pos=pos)
         if self.use_text_pos:
@@ -107,11 +173,41 @@ class BLEScanner:
                     return custom_name
         return name
 
-    async def process_advertising_data(self, device, advertising_data):
+    @staticmethod
+    def adapter_name(adapter: str | None) -> str:
+        """Return the adapter name used as key of the reception stats."""
+        return adapter or "default"
+
+    @staticmethod
+    def new_adapter_stats() -> dict:
+        return {"received": 0, "accepted": 0, "duplicates": 0, "best_rssi": 0}
+
+    def adapter_callback(self, adapter: str | None) -> Callable:
+        """Return the detection callback bound to the adapter."""
+
+        async def callback(device, advertising_data, source: str = None):
+            # Backends receiving from several sources (the aggregator) name it
+            await self.process_advertising_data(
+                device, advertising_data, source or adapter
+            )
+
+        return callback
+
+    async def process_advertising_data(
+        self, device, advertising_data, adapter: str | None = None
+    ):
         """Process BLE advertising data."""
+        self.metric_callbacks.inc()
         adv_atc = advertising_data.service_data.get(self.ATC_SERVICE)
         if not adv_atc:
             return
+        self.metric_advertisements.inc()
+
+        self.last_advertisement = self.clock.monotonic()
+        if self.capture:
+            self.capture.write(device, advertising_data, adv_atc, adapter)
+        if self.forwarder:
+            self.forwarder.write(device, advertising_data, adv_atc, adapter)
 
         name = self.custom_name(device.name) or self.generate_device_name(device)
         stored_device = self.atc_devices.get(device.address)
@@ -121,7 +217,7 @@ class BLEScanner:
         elif name != stored_device["name"]:
             stored_device["name"] = name
 
-        await self.update_device_data(device, advertising_data, adv_atc)
+        await self.update_device_data(device, advertising_data, adv_atc, adapter)
 
     async def register_new_device(self, device, name):
         """Register a new BLE device."""
@@ -142,18 +238,82 @@ class BLEScanner:
 
         return self.atc_devices.get(address, {}).get("name")
 
-    async def update_device_data(self, device, advertising_data, adv_atc):
+    def is_duplicate_frame(
+        self, address: str, count: int, rssi: int, adapter: str | None = None
+    ) -> bool:
+        """
+        Check whether the frame was already received, on any adapter.
+
+        Frames are identified by (address, frame counter). The best RSSI of
+        the latest frame and the per-adapter reception stats are updated, every
+        frame is credited to the one adapter with its best RSSI.
+
+        Args:
+            address (str): The address of the device.
+            count (int): The PVVX frame counter.
+            rssi (int): The RSSI of this reception.
+            adapter (str | None): The adapter that received the frame.
+
+        Returns:
+            bool: True if the frame is a duplicate, False if it is new.
+        """
+        name = self.adapter_name(adapter)
+        stats = self.adapter_stats.setdefault(name, self.new_adapter_stats())
+        stats["received"] += 1
+        seen = self.atc_seen_counters.get(address)
+        if seen is None:
+            seen = self.atc_seen_counters[address] = deque(maxlen=self.DEDUP_WINDOW)
+        if count in seen:
+            stats["duplicates"] += 1
+            self.metric_duplicates.inc()
+            if (
+                count == self.atc_counters.get(address)
+                and rssi is not None
+                and rssi > self.atc_rssi.get(address, rssi)
+            ):
+                self.atc_rssi[address] = rssi
+                # Move the credit of the frame to this adapter
+                previous = self.atc_rssi_adapter.get(address)
+                if previous != name:
+                    if previous in self.adapter_stats:
+                        self.adapter_stats[previous]["best_rssi"] -= 1
+                    stats["best_rssi"] += 1
+                    self.atc_rssi_adapter[address] = name
+            return True
+        seen.append(count)
+        stats["accepted"] += 1
+        stats["best_rssi"] += 1
+        self.atc_rssi[address] = rssi
+        self.atc_rssi_adapter[address] = name
+        return False
+
+    async def update_device_data(
+        self, device, advertising_data, adv_atc, adapter: str | None = None
+    ):
         """Update the data of a registered BLE device."""
+        started = time.perf_counter_ns()
         count = int.from_bytes(adv_atc[13:14], byteorder="little", signed=False)
-        if self.atc_counters.get(device.address) == count:
+        if self.scheduler:
+            self.scheduler.observe(device.address, count, self.clock.monotonic())
+        if self.is_duplicate_frame(
+            device.address, count, advertising_data.rssi, adapter
+        ):
             return
 
         self.atc_counters[device.address] = count
-        date_now = datetime.datetime.now()
-        date_diff: datetime.timedelta = date_now - self.atc_date.get(
-            device.address, date_now
-        )
+        date_now = self.clock.now()
+        now = self.clock.monotonic()
+        previous = self.atc_monotonic.get(device.address)
+        if previous is not None:
+            # Steps of the system time do not change the duration
+            date_diff = datetime.timedelta(seconds=now - previous)
+        else:
+            # The wall time of the previous reading restored from a checkpoint
+            date_diff: datetime.timedelta = date_now - self.atc_date.get(
+                device.address, date_now
+            )
         self.atc_date[device.address] = date_now
+        self.atc_monotonic[device.address] = now
 
         temp = int.from_bytes(adv_atc[6:8], byteorder="little", signed=True) / 100.0
         humidity = (
@@ -164,19 +324,41 @@ class BLEScanner:
         )
         battery = int.from_bytes(adv_atc[12:13], byteorder="little", signed=False)
         rssi = advertising_data.rssi
-
-        await self.display_device_info(
-            device.address,
-            temp,
-            humidity,
-            battery_v,
-            battery,
-            rssi,
-            count,
-            date_now,
-            date_diff,
+        self.link_quality.update(device.address, count, rssi, now)
+        self.metric_readings.inc()
+        reading = Reading(
+            address=device.address,
+            name=self.get_device_name(device.address),
+            temp=temp,
+            humidity=humidity,
+            battery_v=battery_v,
+            battery=battery,
+            rssi=rssi,
+            count=count,
+            timestamp=date_now,
+            interval=date_diff,
+            adapter=adapter,
         )
-        await self.monitor_thresholds(self.get_device_name(device.address), temp)
+        self.metric_decode.record((time.perf_counter_ns() - started) // 1000)
+        await self.bus.publish(reading)
+        if self.virtual_devices:
+            for group in self.virtual_devices.update(reading):
+                self.atc_devices.setdefault(
+                    group.address, {"name": group.name, "id": len(self.atc_devices)}
+                )
+                await self.bus.publish(group)
+
+    async def on_reading_display(self, reading: Reading) -> None:
+        """Bus subscriber showing the reading on the output."""
+        await self.display_device_info(reading, self.link_quality.get(reading.address))
+
+    async def on_reading_alert(self, reading: Reading) -> None:
+        """Bus subscriber checking the alert thresholds."""
+        if self.virtual_devices and not self.virtual_devices.is_alerting(
+            reading.address
+        ):
+            return
+        await self.monitor_thresholds(reading.name, reading.temp, reading.address)
 
     async def clear_lines(self, lines: int = 1):
         if self.use_text_pos:
@@ -187,32 +369,31 @@ class BLEScanner:
             max_width = self.WINDOW_WIDTH
         return line[:max_width].ljust(max_width)
 
-    @output_cols
+    def set_device_text_pos(self, address: str) -> None:
+        """Move the cursor to the tile of the device in the grid of devices."""
+        device_id = self.atc_devices.get(address, {}).get("id")
+        if device_id is not None:
+            self.set_text_pos(
+                self.TEXT_WIDTH * (device_id % self.COLS),
+                self.LINE_HEIGHT * (device_id // self.COLS) + 1,
+            )
+
     async def display_device_info(
-        self,
-        address: str,
-        temp: float,
-        humidity: float,
-        battery_v: float,
-        battery: int,
-        rssi: int,
-        count: int,
-        date_now: datetime.datetime,
-        date_diff: datetime.timedelta,
-    ):
-        """Display formatted device information."""
-        name = self.get_device_name(address)
+        self, reading: Reading, link: LinkQuality = None
+    ) -> None:
+        """Display the device information, formatted by the output."""
+        # The cursor is positioned, read and advanced under the lock of the
+        # screen, the alerts worker prints on it concurrently
         async with self.output.lock:
-            await self.print_text(f"Device: {name}")
-            await self.print_text("-" * self.WINDOW_WIDTH)
-            await self.print_text(f"Temp: {temp:<.2f}°C")
-            await self.print_text(f"Humidity: {humidity:<.2f}%")
-            await self.print_text(f"Battery: {battery}% ({battery_v:.2f}V)")
-            await self.print_text(f"RSSI: {rssi} dBm")
-            await self.print_text(f"Count: {count:<3}")
-            await self.print_text(f"Last Seen: {date_now.strftime('%H:%M:%S'):<8}")
-            if date_diff:
-                await self.print_text(f"Duration: {str(date_diff).split('.')[0]:<9}")
+            self.set_device_text_pos(reading.address)
+            pos = self.get_text_pos_dict() if self.use_text_pos else None
+            lines = await self.output.print_reading(
+                reading, link, pos, self.WINDOW_WIDTH
+            )
+            if self.use_text_pos:
+                self.shift_text_pos(dy=lines)
+            self.shift_text_pos(dy=2)
+            self.set_text_pos(x=0)
 
     @staticmethod
     def generate_title_message(
@@ -232,25 +413,75 @@ class BLEScanner:
 
         return title, message
 
-    async def monitor_thresholds(self, name, temp):
+    async def monitor_thresholds(self, name, temp, address=None):
+        started = time.perf_counter_ns()
         title, message = None, None
+        alert = None
         # Trigger alert if temperature is below the threshold
         if self.alert_low_threshold is not None and temp <= self.alert_low_threshold:
             title, message = self.generate_title_message(
                 name, temp, threshold_type=0, threshold_value=self.alert_low_threshold
             )
+            alert = ("low", self.alert_low_threshold)
         # Trigger alert if temperature is higher than the threshold
         if self.alert_high_threshold is not None and temp >= self.alert_high_threshold:
             title, message = self.generate_title_message(
                 name, temp, threshold_type=2, threshold_value=self.alert_high_threshold
             )
-        if title or message:
-            if self.is_need_send_alert(name, temp):
-                async with self.output.lock:
-                    await self.clear_lines(10)
-                    await self.print_text("")
-                await asyncio.sleep(0)
-                await self.send_alert(title, message)
+            alert = ("high", self.alert_high_threshold)
+        self.update_active_alert(name, temp, alert)
+        need_send = bool(title or message) and self.is_need_send_alert(name, temp)
+        self.metric_alert_evaluation.record((time.perf_counter_ns() - started) // 1000)
+        if need_send:
+            async with self.output.lock:
+                await self.clear_lines(10)
+                await self.print_text("")
+            await asyncio.sleep(0)
+            alert_type, threshold = alert
+            await self.send_alert(
+                title,
+                message,
+                {
+                    "device": name,
+                    "address": address,
+                    "temp": temp,
+                    "type": alert_type,
+                    "threshold": threshold,
+                },
+            )
+
+    def update_active_alert(
+        self, name: str, temp: float, alert: tuple[str, float] | None
+    ) -> None:
+        """
+        Track the devices whose temperature is out of the thresholds.
+
+        Args:
+            name (str): The name of the device.
+            temp (float): The current temperature.
+            alert (tuple[str, float] | None): The alert type ('low' or 'high')
+                and threshold, None when the temperature is within the thresholds.
+        """
+        active = self.active_alerts.get(name)
+        if alert is None:
+            if active is not None:
+                del self.active_alerts[name]
+                self.alerts_version += 1
+            return
+        alert_type, threshold = alert
+        if active and active["type"] == alert_type:
+            if active["temp"] == temp:
+                return
+            active["temp"] = temp
+        else:
+            self.active_alerts[name] = {
+                "device": name,
+                "type": alert_type,
+                "threshold": threshold,
+                "temp": temp,
+                "since": self.clock.now().isoformat(),
+            }
+        self.alerts_version += 1
 
     def is_need_send_alert(self, name: str, temp: float) -> bool:
         """
@@ -280,29 +511,129 @@ class BLEScanner:
         self,
         title: str = None,
         message: str = None,
+        params: dict = None,
     ) -> None:
-        """Sends an alert message."""
+        """Sends an alert message, params describe the alert for the digest."""
         if not self.notification:
             return
         try:
-            await self.notification.send_alert(title, message)
+            await self.notification.send_alert(title, message, params)
         except Exception as e:
             logger.error(f"Notification failed: {e}")
 
+    def get_link_stats(self) -> dict:
+        """Return the link quality of every device."""
+        return self.link_quality.get_stats()
+
+    def get_adapter_stats(self) -> dict:
+        """Return the reception stats of every adapter."""
+        return {name: stats.copy() for name, stats in self.adapter_stats.items()}
+
+    async def wait_stop(self, timeout: float = None) -> None:
+        """
+        Wait for the stop event while scanning.
+
+        Args:
+            timeout (float): Return after this number of seconds. None waits
+                until the stop event.
+
+        Raises:
+            ScannerStalledError: If the watchdog is enabled and no advertisement
+                was received within the watchdog timeout.
+        """
+        deadline = None if timeout is None else self.clock.monotonic() + timeout
+        if self.watchdog:
+            self.last_advertisement = self.clock.monotonic()
+        while not self.stop_event.is_set():
+            now = self.clock.monotonic()
+            waits = []
+            if deadline is not None:
+                waits.append(deadline - now)
+            if self.watchdog:
+                stall = self.last_advertisement + self.watchdog - now
+                if stall <= 0:
+                    raise ScannerStalledError(
+                        f"No advertisement received for {self.watchdog}s"
+                    )
+                waits.append(stall)
+            wait = min(waits) if waits else None
+            if wait is not None and wait <= 0:
+                return
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    @contextlib.asynccontextmanager
+    async def open_scanners(self, mode: str):
+        """Run one scanner per configured adapter inside the context."""
+        async with contextlib.AsyncExitStack() as stack:
+            for adapter in self.adapters:
+                await stack.enter_async_context(
+                    self.backend(
+                        self.adapter_callback(adapter),
+                        scanning_mode=mode,
+                        adapter=adapter,
+                    )
+                )
+            self.active_mode = mode
+            self.scanning.set()
+            try:
+                yield
+            finally:
+                self.scanning.clear()
+                self.active_mode = None
+
+    async def scan(self, mode: str) -> None:
+        """
+        Scan in the mode until the stop event.
+
+        Without a scheduler the scanners run continuously, otherwise scan
+        windows alternate with idle periods planned by the scheduler.
+        """
+        if not self.scheduler:
+            async with self.open_scanners(mode):
+                await self.wait_stop()
+            return
+        while not self.stop_event.is_set():
+            window, idle = self.scheduler.plan(self.clock.monotonic())
+            self.scheduler.start_window()
+            async with self.open_scanners(mode):
+                await self.wait_stop(window)
+            if idle and not self.stop_event.is_set():
+                try:
+                    await asyncio.wait_for(self.stop_event.wait(), timeout=idle)
+                except asyncio.TimeoutError:
+                    pass
+
     async def start_scanning(self):
-        """Start scanning for BLE devices."""
+        """
+        Start scanning for BLE devices, one scanner per configured adapter.
+
+        Modes are tried in order until one of them runs until the stop event.
+
+        Raises:
+            BleakError | ScannerStalledError: The error of the last mode if
+                scanning failed in all modes.
+        """
         # self.print_clear()
         modes = ("passive", "active") if self.mode.lower() == "auto" else (self.mode,)
         mode: Literal["active", "passive"]
+        error = None
         for mode in modes:
-            logger.info(f"Scanning BLE devices in {mode} mode...")
+            adapters = ", ".join(self.adapter_name(a) for a in self.adapters)
+            logger.info(f"Scanning BLE devices in {mode} mode on {adapters}...")
             try:
                 if mode not in ["active", "passive"]:
                     raise ValueError("Mode must be either 'active' or 'passive'.")
-                async with BleakScanner(
-                    self.process_advertising_data, scanning_mode=mode
-                ):
-                    await self.stop_event.wait()
-                    break
-            except BleakError as e:
+                await self.scan(mode)
+                error = None
+                break
+            except scan_errors() as e:
                 logger.error(f"Error in {mode} mode: {e}")
+                error = e
+        logger.debug(f"Adapter stats: {self.get_adapter_stats()}")
+        if self.scheduler:
+            logger.debug(f"Scheduler stats: {self.scheduler.get_stats()}")
+        if error:
+            raise error
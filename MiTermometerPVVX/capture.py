@@ -0,0 +1,291 @@
+import json
+import logging
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+from clock import get_clock
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+# Binary capture: a header with the adapter names, then fixed-size records
+# that can be memory-mapped (see batch_decode.py)
+BINARY_SUFFIX = ".pvcap"
+BINARY_MAGIC = b"PVCAP\x00\x01\x00"
+BINARY_HEADER_SIZE = 128
+ADAPTER_NAME_SIZE = 8
+# Index 0 is the default adapter (None)
+ADAPTER_SLOTS = (BINARY_HEADER_SIZE - len(BINARY_MAGIC)) // ADAPTER_NAME_SIZE
+# ts, MAC address, rssi, adapter index, data length, service data
+BINARY_RECORD = struct.Struct("<d6sbBB20s3x")
+
+
+class CaptureWriter:
+    """
+    Write received PVVX advertisements to a JSON lines capture file.
+
+    Every line is one advertisement with the keys ``ts``, ``adapter``,
+    ``address``, ``name``, ``rssi`` and ``data`` (service data as hex string).
+    The file can be replayed later with the replay backend.
+    """
+
+    def __init__(self, path: str | Path):
+        """
+        Open the capture file for appending.
+
+        Args:
+            path (str | Path): The path of the capture file.
+        """
+        self.path = Path(path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def write(
+        self, device, advertising_data, adv_atc: bytes, adapter: str | None = None
+    ) -> None:
+        """
+        Append one advertisement to the capture file.
+
+        Args:
+            device: The BLE device object (needs ``address`` and ``name``).
+            advertising_data: The advertising data object (needs ``rssi``).
+            adv_atc (bytes): The raw PVVX service data.
+            adapter (str | None): The adapter that received the advertisement.
+        """
+        record = {
+            "ts": get_clock().time(),
+            "adapter": adapter,
+            "address": device.address,
+            "name": device.name,
+            "rssi": advertising_data.rssi,
+            "data": bytes(adv_atc).hex(),
+        }
+        self._file.write(json.dumps(record) + "\n")
+
+    def close(self) -> None:
+        """
+        Flush and close the capture file.
+        """
+        if not self._file.closed:
+            self._file.close()
+
+
+class BinaryCaptureWriter:
+    """
+    Write received PVVX advertisements to a binary capture file.
+
+    Records have a fixed size of 40 bytes, so multi-day captures can be
+    memory-mapped and decoded in bulk. Only MAC addresses (Linux, Windows)
+    and up to 14 named adapters (the default adapter takes the first of the
+    15 slots) are supported, other advertisements are skipped.
+
+    Records are packed in the scanner callback and written in batches by a
+    dedicated thread, in order, so the event loop never waits for the disk.
+    """
+
+    # Records handed to the writer thread at once
+    BATCH_RECORDS = 64
+
+    def __init__(self, path: str | Path):
+        """
+        Open the capture file for appending, the header is written when new.
+
+        Args:
+            path (str | Path): The path of the capture file.
+        """
+        self.path = Path(path)
+        self.adapters: list[str | None] = [None]
+        self.skipped = 0
+        self.pending = bytearray()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+        if self.path.exists() and self.path.stat().st_size >= BINARY_HEADER_SIZE:
+            self.adapters = read_binary_header(self.path)
+            self._file = open(self.path, "r+b")
+            self._file.seek(0, 2)
+        else:
+            self._file = open(self.path, "w+b")
+            self._write_header(self.adapters)
+
+    def _write_header(self, adapters: list[str | None]) -> None:
+        header = bytearray(BINARY_HEADER_SIZE)
+        header[: len(BINARY_MAGIC)] = BINARY_MAGIC
+        for index, name in enumerate(adapters[1:], 1):
+            offset = len(BINARY_MAGIC) + index * ADAPTER_NAME_SIZE
+            header[offset : offset + ADAPTER_NAME_SIZE] = name.encode()[
+                :ADAPTER_NAME_SIZE
+            ].ljust(ADAPTER_NAME_SIZE, b"\0")
+        position = self._file.tell()
+        self._file.seek(0)
+        self._file.write(header)
+        self._file.seek(max(position, BINARY_HEADER_SIZE))
+
+    def adapter_index(self, adapter: str | None) -> int | None:
+        if adapter in self.adapters:
+            return self.adapters.index(adapter)
+        if len(self.adapters) >= ADAPTER_SLOTS:
+            return None
+        self.adapters.append(adapter)
+        # The records of the previous adapters are written first
+        self.flush()
+        self.submit(self._write_header, list(self.adapters))
+        return len(self.adapters) - 1
+
+    def submit(self, function, *args) -> None:
+        """Run the function on the writer thread, in submission order."""
+        get_clock().track(self.executor.submit(self._run, function, *args))
+
+    def _run(self, function, *args) -> None:
+        try:
+            function(*args)
+        except OSError as e:
+            logger.error(f"Writing capture {self.path} failed: {e!r}")
+
+    def flush(self) -> None:
+        """Hand the packed records over to the writer thread."""
+        if self.pending:
+            data, self.pending = bytes(self.pending), bytearray()
+            self.submit(self._file.write, data)
+
+    def write(
+        self, device, advertising_data, adv_atc: bytes, adapter: str | None = None
+    ) -> None:
+        """
+        Append one advertisement to the capture file.
+
+        Args:
+            device: The BLE device object (needs ``address``).
+            advertising_data: The advertising data object (needs ``rssi``).
+            adv_atc (bytes): The raw PVVX service data.
+            adapter (str | None): The adapter that received the advertisement.
+        """
+        try:
+            address = bytes.fromhex(device.address.replace(":", ""))
+        except ValueError:
+            address = b""
+        index = self.adapter_index(adapter)
+        if len(address) != 6 or index is None:
+            self.skipped += 1
+            return
+        rssi = advertising_data.rssi
+        data = bytes(adv_atc)[:20]
+        self.pending += BINARY_RECORD.pack(
+            get_clock().time(),
+            address,
+            -128 if rssi is None else max(-127, min(127, rssi)),
+            index,
+            len(data),
+            data,
+        )
+        # Buffered like the file buffer before, which held about 200 records
+        if len(self.pending) >= self.BATCH_RECORDS * BINARY_RECORD.size:
+            self.flush()
+
+    def close(self) -> None:
+        """
+        Write the pending records and close the capture file.
+        """
+        self.flush()
+        self.executor.shutdown()
+        if not self._file.closed:
+            self._file.close()
+        if self.skipped:
+            logger.warning(
+                f"{self.skipped} advertisements not supported by {self.path}"
+            )
+
+
+def open_capture(path: str | Path) -> CaptureWriter | BinaryCaptureWriter:
+    """
+    Open a capture writer, binary for files with the '.pvcap' suffix.
+
+    Args:
+        path (str | Path): The path of the capture file.
+
+    Returns:
+        CaptureWriter | BinaryCaptureWriter: The writer.
+    """
+    if Path(path).suffix == BINARY_SUFFIX:
+        return BinaryCaptureWriter(path)
+    return CaptureWriter(path)
+
+
+def read_binary_header(path: str | Path) -> list[str | None]:
+    """
+    Read the adapter names of a binary capture.
+
+    Args:
+        path (str | Path): The path of the capture file.
+
+    Returns:
+        list[str | None]: The adapter names by index, None for the default adapter.
+
+    Raises:
+        ValueError: If the file is not a binary capture.
+    """
+    with open(path, "rb") as f:
+        header = f.read(BINARY_HEADER_SIZE)
+    if not header.startswith(BINARY_MAGIC) or len(header) < BINARY_HEADER_SIZE:
+        raise ValueError(f"{path} is not a binary capture")
+    adapters: list[str | None] = [None]
+    for index in range(1, ADAPTER_SLOTS):
+        offset = len(BINARY_MAGIC) + index * ADAPTER_NAME_SIZE
+        name = header[offset : offset + ADAPTER_NAME_SIZE].rstrip(b"\0")
+        if not name:
+            break
+        adapters.append(name.decode())
+    return adapters
+
+
+def read_binary_capture(path: str | Path) -> Iterator[dict]:
+    """
+    Read advertisements from a binary capture file.
+
+    Args:
+        path (str | Path): The path of the capture file.
+
+    Yields:
+        dict: One record per advertisement, like ``read_capture``.
+    """
+    adapters = read_binary_header(path)
+    with open(path, "rb") as f:
+        f.seek(BINARY_HEADER_SIZE)
+        while chunk := f.read(BINARY_RECORD.size * 4096):
+            usable = len(chunk) - len(chunk) % BINARY_RECORD.size
+            for ts, address, rssi, index, length, data in BINARY_RECORD.iter_unpack(
+                chunk[:usable]
+            ):
+                yield {
+                    "ts": ts,
+                    "adapter": adapters[index] if index < len(adapters) else None,
+                    "address": address.hex(":").upper(),
+                    "name": None,
+                    "rssi": None if rssi == -128 else rssi,
+                    "data": data[:length],
+                }
+
+
+def read_capture(path: str | Path) -> Iterator[dict]:
+    """
+    Read advertisements from a JSON lines or binary ('.pvcap') capture file.
+
+    Args:
+        path (str | Path): The path of the capture file.
+
+    Yields:
+        dict: One record per advertisement, ``data`` decoded to bytes.
+    """
+    if Path(path).suffix == BINARY_SUFFIX:
+        yield from read_binary_capture(path)
+        return
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+                record["data"] = bytes.fromhex(record["data"])
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Skip invalid capture line {line_no}: {e}")
+                continue
+            yield record
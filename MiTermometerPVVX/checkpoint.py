@@ -0,0 +1,399 @@
+"""
+Checkpoint of the scanner state for fast restarts.
+
+Binary format, all values little-endian. Header (20 bytes)::
+
+    magic       8s  b"PVCKPT\\x00\\x01"
+    created     d   wall time of the checkpoint
+    crc32       I   of the payload
+    length      I   of the payload
+
+Payload: the number of devices (H), then per device::
+
+    address, name           str (H length + UTF-8)
+    id                      H   display slot
+    counter                 h   last frame counter, -1 unknown
+    seen                    B + B * n   recent frame counters (dedup window)
+    rssi                    h   best RSSI of the last frame, -32768 unknown
+    last_date               d   wall time of the last reading, NaN unknown
+    received, missed        I I link quality counters
+    has_reading             B   1 if the last reading follows
+    temp, humidity, battery_v   d d d
+    battery, rssi, count    B h B
+    timestamp, interval     d d (interval NaN unknown)
+    adapter                 str
+
+Then the number of alert entries (H), per device name::
+
+    name                    str
+    sent_temp               d   temperature of the last notification, NaN none
+    type                    B   active alert: 0 none, 1 low, 2 high
+    threshold, temp, since  d d d
+"""
+
+import asyncio
+import datetime
+import logging
+import math
+import os
+import struct
+import zlib
+from collections import deque
+from pathlib import Path
+
+from clock import Clock, get_clock
+from env_settings import settings
+from events import Reading
+from link_quality import LinkQuality
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+MAGIC = b"PVCKPT\x00\x01"
+HEADER = struct.Struct("<8sdII")
+DEVICE = struct.Struct("<Hh")
+LINK = struct.Struct("<hdIIB")
+READING = struct.Struct("<dddBhBdd")
+ALERT = struct.Struct("<dBddd")
+NONE_RSSI = -32768
+ALERT_TYPES = (None, "low", "high")
+
+
+class CheckpointError(Exception):
+    """The checkpoint is invalid."""
+
+
+def _pack_str(out: bytearray, value: str | None) -> None:
+    data = (value or "").encode("utf-8")[:65535]
+    out += struct.pack("<H", len(data))
+    out += data
+
+
+def _nan(value: float | None) -> float:
+    return math.nan if value is None else value
+
+
+def _none(value: float) -> float | None:
+    return None if math.isnan(value) else value
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt: struct.Struct) -> tuple:
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def bytes(self, size: int) -> bytes:
+        if self.offset + size > len(self.data):
+            raise CheckpointError("Truncated checkpoint")
+        value = self.data[self.offset : self.offset + size]
+        self.offset += size
+        return value
+
+    def str(self) -> str:
+        (size,) = struct.unpack_from("<H", self.data, self.offset)
+        self.offset += 2
+        return self.bytes(size).decode("utf-8", "replace")
+
+
+def encode_state(scanner, readings: dict[str, Reading], created: float) -> bytes:
+    """
+    Encode the state of the scanner as checkpoint.
+
+    Args:
+        scanner (BLEScanner): The scanner.
+        readings (dict[str, Reading]): The last reading by device address.
+        created (float): The wall time of the checkpoint.
+
+    Returns:
+        bytes: The checkpoint file content.
+    """
+    payload = bytearray()
+    payload += struct.pack("<H", len(scanner.atc_devices))
+    for address, device in scanner.atc_devices.items():
+        _pack_str(payload, address)
+        _pack_str(payload, device["name"])
+        payload += DEVICE.pack(device["id"], scanner.atc_counters.get(address, -1))
+        seen = bytes(scanner.atc_seen_counters.get(address, ()))
+        payload += struct.pack("<B", len(seen)) + seen
+        last_date = scanner.atc_date.get(address)
+        link = scanner.link_quality.get(address)
+        reading = readings.get(address)
+        payload += LINK.pack(
+            scanner.atc_rssi.get(address, NONE_RSSI),
+            last_date.timestamp() if last_date else math.nan,
+            link.received if link else 0,
+            link.missed if link else 0,
+            reading is not None,
+        )
+        if reading is not None:
+            payload += READING.pack(
+                reading.temp,
+                reading.humidity,
+                reading.battery_v,
+                reading.battery,
+                NONE_RSSI if reading.rssi is None else reading.rssi,
+                reading.count,
+                reading.timestamp.timestamp(),
+                (
+                    reading.interval.total_seconds()
+                    if reading.interval is not None
+                    else math.nan
+                ),
+            )
+            _pack_str(payload, reading.adapter)
+    names = scanner.cache_sent_alert.keys() | scanner.active_alerts.keys()
+    payload += struct.pack("<H", len(names))
+    for name in names:
+        _pack_str(payload, name)
+        active = scanner.active_alerts.get(name)
+        payload += ALERT.pack(
+            _nan(scanner.cache_sent_alert.get(name)),
+            ALERT_TYPES.index(active["type"]) if active else 0,
+            active["threshold"] if active else math.nan,
+            active["temp"] if active else math.nan,
+            (
+                datetime.datetime.fromisoformat(active["since"]).timestamp()
+                if active
+                else math.nan
+            ),
+        )
+    header = HEADER.pack(MAGIC, created, zlib.crc32(payload), len(payload))
+    return header + bytes(payload)
+
+
+def decode_state(data: bytes) -> dict:
+    """
+    Decode a checkpoint.
+
+    Args:
+        data (bytes): The checkpoint file content.
+
+    Returns:
+        dict: 'created' (wall time), 'devices' (list of dicts) and 'alerts'
+            (list of dicts).
+
+    Raises:
+        CheckpointError: If the checkpoint is invalid or corrupted.
+    """
+    if len(data) < HEADER.size:
+        raise CheckpointError("Truncated checkpoint")
+    magic, created, crc, length = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CheckpointError("Not a checkpoint or unsupported version")
+    payload = data[HEADER.size :]
+    if len(payload) != length or zlib.crc32(payload) != crc:
+        raise CheckpointError("Corrupted checkpoint")
+    reader = _Reader(payload)
+    try:
+        devices = []
+        (count,) = reader.unpack(struct.Struct("<H"))
+        for _ in range(count):
+            device = {"address": reader.str(), "name": reader.str()}
+            device["id"], counter = reader.unpack(DEVICE)
+            device["counter"] = None if counter < 0 else counter
+            device["seen"] = list(reader.bytes(reader.bytes(1)[0]))
+            rssi, last_date, received, missed, has_reading = reader.unpack(LINK)
+            device["rssi"] = None if rssi == NONE_RSSI else rssi
+            device["last_date"] = _none(last_date)
+            device["received"], device["missed"] = received, missed
+            device["reading"] = None
+            if has_reading:
+                values = reader.unpack(READING)
+                device["reading"] = values + (reader.str() or None,)
+            devices.append(device)
+        alerts = []
+        (count,) = reader.unpack(struct.Struct("<H"))
+        for _ in range(count):
+            name = reader.str()
+            sent, alert_type, threshold, temp, since = reader.unpack(ALERT)
+            alerts.append(
+                {
+                    "name": name,
+                    "sent_temp": _none(sent),
+                    "type": ALERT_TYPES[alert_type],
+                    "threshold": threshold,
+                    "temp": temp,
+                    "since": since,
+                }
+            )
+    except (struct.error, IndexError) as e:
+        raise CheckpointError(f"Invalid checkpoint: {e}") from e
+    return {"created": created, "devices": devices, "alerts": alerts}
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Replace the file with the data, a crash leaves the old or the new file."""
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    if hasattr(os, "O_DIRECTORY"):
+        # Persist the rename
+        fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class Checkpointer:
+    """
+    Periodic checkpoint of the scanner state, restored on startup.
+
+    The device registry (display slots and names), frame counters and the
+    dedup window, link counters, the last reading of every device and the
+    alert state (last notified temperature, active alerts) are written every
+    ``interval`` seconds and on exit, atomically. On startup a checkpoint not
+    older than ``max_age`` is restored, so the display layout is kept and
+    devices already past a threshold do not alert again.
+    """
+
+    def __init__(
+        self,
+        scanner,
+        path: str = None,
+        interval: float = None,
+        max_age: float = None,
+        clock: Clock = None,
+    ):
+        """
+        Initialize the checkpointer, defaults are read from the settings.
+
+        Args:
+            scanner (BLEScanner): The scanner.
+            path (str): The checkpoint file.
+            interval (float): Seconds between checkpoints.
+            max_age (float): Seconds after which a checkpoint is not restored.
+            clock (Clock): The clock, the current clock by default.
+        """
+        self.scanner = scanner
+        self.path = Path(path or settings.CHECKPOINT_FILE)
+        self.interval = interval or settings.CHECKPOINT_INTERVAL
+        self.max_age = settings.CHECKPOINT_MAX_AGE if max_age is None else max_age
+        self.clock = clock or get_clock()
+        self.readings: dict[str, Reading] = {}
+
+    def add(self, reading: Reading) -> None:
+        """Keep the last reading of the device, used as bus subscriber."""
+        self.readings[reading.address] = reading
+
+    async def save(self) -> None:
+        """Write the checkpoint."""
+        data = encode_state(self.scanner, self.readings, self.clock.time())
+        try:
+            await asyncio.to_thread(write_atomic, self.path, data)
+        except OSError as e:
+            logger.error(f"Checkpoint write to {self.path} failed: {e!r}")
+            return
+        logger.debug(f"Checkpoint of {len(self.scanner.atc_devices)} devices saved")
+
+    async def restore(self) -> bool:
+        """
+        Restore the scanner state from the checkpoint file.
+
+        Returns:
+            bool: True if the state was restored.
+        """
+        try:
+            data = await asyncio.to_thread(self.path.read_bytes)
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            logger.error(f"Checkpoint read of {self.path} failed: {e!r}")
+            return False
+        try:
+            state = decode_state(data)
+        except CheckpointError as e:
+            logger.error(f"Checkpoint {self.path} ignored: {e}")
+            return False
+        age = self.clock.time() - state["created"]
+        if age > self.max_age or age < 0:
+            logger.info(f"Checkpoint {self.path} ignored, {age:.0f}s old")
+            return False
+        self.apply(state)
+        logger.info(
+            f"Checkpoint restored: {len(state['devices'])} devices, "
+            f"{len(self.scanner.active_alerts)} active alerts, {age:.0f}s old"
+        )
+        if self.readings:
+            await self.scanner.print_clear()
+            for reading in self.readings.values():
+                await self.scanner.on_reading_display(reading)
+        return True
+
+    def apply(self, state: dict) -> None:
+        """Set the decoded state on the scanner."""
+        scanner = self.scanner
+        for device in state["devices"]:
+            address = device["address"]
+            scanner.atc_devices[address] = {"name": device["name"], "id": device["id"]}
+            if device["counter"] is not None:
+                scanner.atc_counters[address] = device["counter"]
+            scanner.atc_seen_counters[address] = deque(
+                device["seen"], maxlen=scanner.DEDUP_WINDOW
+            )
+            if device["rssi"] is not None:
+                scanner.atc_rssi[address] = device["rssi"]
+            if device["last_date"] is not None:
+                scanner.atc_date[address] = datetime.datetime.fromtimestamp(
+                    device["last_date"]
+                )
+            # Counters only, arrival times do not survive the restart
+            link = scanner.link_quality.devices.setdefault(address, LinkQuality())
+            link.received, link.missed = device["received"], device["missed"]
+            if device["reading"]:
+                (
+                    temp,
+                    humidity,
+                    battery_v,
+                    battery,
+                    rssi,
+                    count,
+                    ts,
+                    interval,
+                    adapter,
+                ) = device["reading"]
+                self.readings[address] = Reading(
+                    address=address,
+                    name=device["name"],
+                    temp=temp,
+                    humidity=humidity,
+                    battery_v=battery_v,
+                    battery=battery,
+                    rssi=None if rssi == NONE_RSSI else rssi,
+                    count=count,
+                    timestamp=datetime.datetime.fromtimestamp(ts),
+                    interval=(
+                        None
+                        if math.isnan(interval)
+                        else datetime.timedelta(seconds=interval)
+                    ),
+                    adapter=adapter,
+                )
+        for alert in state["alerts"]:
+            name = alert["name"]
+            if alert["sent_temp"] is not None:
+                scanner.cache_sent_alert[name] = alert["sent_temp"]
+            if alert["type"]:
+                scanner.active_alerts[name] = {
+                    "device": name,
+                    "type": alert["type"],
+                    "threshold": alert["threshold"],
+                    "temp": alert["temp"],
+                    "since": datetime.datetime.fromtimestamp(
+                        alert["since"]
+                    ).isoformat(),
+                }
+        scanner.alerts_version += 1
+
+    async def run(self) -> None:
+        """Write a checkpoint every interval until cancelled."""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
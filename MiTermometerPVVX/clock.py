@@ -0,0 +1,190 @@
+"""
+Clocks of the scanner pipeline.
+
+Components read the time from the current clock (``get_clock()``) instead of
+``time`` and ``datetime`` directly. ``RealClock`` is used in production,
+``VirtualClock`` runs replays and simulations in virtual time.
+"""
+
+import asyncio
+import datetime
+import selectors
+import time
+from abc import ABC, abstractmethod
+
+
+class Clock(ABC):
+    """Source of the time of the pipeline."""
+
+    @abstractmethod
+    def monotonic(self) -> float:
+        """Return the monotonic time in seconds, for durations and timeouts."""
+        ...
+
+    @abstractmethod
+    def time(self) -> float:
+        """Return the wall time in seconds since the epoch."""
+        ...
+
+    def now(self) -> datetime.datetime:
+        """Return the local wall time."""
+        return datetime.datetime.fromtimestamp(self.time())
+
+    async def sleep(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+
+    def track(self, future) -> None:
+        """
+        Account work running on a thread, until the future is done.
+
+        Args:
+            future: The ``concurrent.futures`` or asyncio future of the work.
+        """
+
+
+class RealClock(Clock):
+    """
+    Clock of the real time.
+
+    The wall time is the system time, it follows NTP adjustments and the time
+    spent suspended. Durations are measured with the monotonic clock, which
+    never steps.
+    """
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def time(self) -> float:
+        return time.time()
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop running in the virtual time of its clock.
+
+    When the loop would wait for the next timer and no I/O is ready, the
+    virtual time jumps to the timer instead. ``asyncio.sleep`` and timeouts
+    therefore take no real time. While executor work is running the loop
+    waits for it in real time, the virtual time stands still.
+    """
+
+    def __init__(self, clock: "VirtualClock"):
+        super().__init__(_VirtualSelector(selectors.DefaultSelector(), clock))
+        self.clock = clock
+
+    def time(self) -> float:
+        return self.clock.monotonic()
+
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self.clock.track(future)
+        return future
+
+
+class _VirtualSelector:
+    """Selector advancing the virtual clock instead of blocking on timers."""
+
+    # Real seconds between the checks of running thread work
+    BUSY_POLL = 0.01
+
+    def __init__(self, selector: selectors.BaseSelector, clock: "VirtualClock"):
+        self._selector = selector
+        self._clock = clock
+
+    def select(self, timeout: float = None):
+        if timeout is None:
+            # No timers, only I/O (e.g. of executor threads) can wake the loop
+            return self._selector.select(None)
+        events = self._selector.select(0)
+        if events or timeout <= 0:
+            return events
+        if self._clock.busy():
+            # The timers wait for the thread work, its completion wakes the
+            # loop, work submitted without the loop is polled
+            return self._selector.select(min(timeout, self.BUSY_POLL))
+        self._clock.advance(timeout)
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class VirtualClock(Clock):
+    """
+    Clock of a virtual time, advanced by its event loop or by ``advance``.
+
+    A 24 hours scenario runs in seconds: the loop skips the time where all
+    tasks are waiting. The virtual time starts at ``start``.
+    """
+
+    def __init__(self, start: float | datetime.datetime = None):
+        """
+        Initialize the clock.
+
+        Args:
+            start (float | datetime.datetime): The wall time at start, the
+                current time by default.
+        """
+        if isinstance(start, datetime.datetime):
+            start = start.timestamp()
+        self.start = time.time() if start is None else start
+        self.elapsed = 0.0
+        self._work: set = set()
+
+    def monotonic(self) -> float:
+        return self.elapsed
+
+    def time(self) -> float:
+        return self.start + self.elapsed
+
+    def advance(self, seconds: float) -> None:
+        """Move the virtual time forward."""
+        self.elapsed += seconds
+
+    def track(self, future) -> None:
+        self._work.add(future)
+
+    def busy(self) -> bool:
+        """Check whether tracked thread work is still running."""
+        if self._work:
+            self._work = {future for future in self._work if not future.done()}
+        return bool(self._work)
+
+    def new_event_loop(self) -> VirtualEventLoop:
+        return VirtualEventLoop(self)
+
+    def run(self, coroutine):
+        """
+        Run the coroutine in virtual time, as ``asyncio.run``.
+
+        The clock is the current clock while the coroutine runs.
+        """
+        previous = set_clock(self)
+        try:
+            with asyncio.Runner(loop_factory=self.new_event_loop) as runner:
+                return runner.run(coroutine)
+        finally:
+            set_clock(previous)
+
+
+_clock: Clock = RealClock()
+
+
+def get_clock() -> Clock:
+    """Return the current clock."""
+    return _clock
+
+
+def set_clock(clock: Clock) -> Clock:
+    """
+    Replace the current clock.
+
+    Args:
+        clock (Clock): The new clock.
+
+    Returns:
+        Clock: The previous clock.
+    """
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
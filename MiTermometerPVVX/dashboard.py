@@ -0,0 +1,276 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+from events import Reading
+from metrics import metrics
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+# Fields of a reading sent to the dashboard
+FIELDS = ("name", "temp", "humidity", "battery", "battery_v", "rssi", "count")
+
+
+def sse_event(event: str, data) -> bytes:
+    """Encode a Server-Sent Event with JSON data."""
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {event}\ndata: {payload}\n\n".encode()
+
+
+class DashboardStream:
+    """
+    Live state of the web dashboard, pushed to the viewers as Server-Sent Events.
+
+    Every reading is turned into a delta of the changed fields of its device
+    and serialized once; the encoded event is fanned out to the queues of all
+    connected viewers, so more viewers do not add serialization work. A new
+    viewer first gets a snapshot of all devices with their recent
+    temperatures (for the sparklines) and the active alerts, encoded once per
+    state version. Viewers that fall behind by ``max_pending`` events are
+    disconnected, the browser reconnects and starts from a new snapshot.
+    """
+
+    def __init__(
+        self,
+        scanner=None,
+        spark_size: int = 60,
+        max_pending: int = 100,
+        keepalive: float = 15.0,
+    ):
+        """
+        Initialize the stream.
+
+        Args:
+            scanner (BLEScanner, optional): The scanner, source of the active alerts.
+            spark_size (int): The number of temperatures per sparkline.
+            max_pending (int): Events queued per viewer before it is disconnected.
+            keepalive (float): Seconds between keep-alive comments.
+        """
+        self.scanner = scanner
+        self.spark_size = spark_size
+        self.max_pending = max_pending
+        self.keepalive = keepalive
+        self.devices: dict[str, dict] = {}
+        self.sparks: dict[str, deque[float]] = {}
+        self.version = 0
+        self.alerts_version = -1
+        self.clients: set[asyncio.Queue] = set()
+        self._snapshot: tuple[int, bytes] | None = None
+        self._serialize = metrics.histogram("dashboard.serialize_us")
+        self._dropped = metrics.counter("dashboard.dropped_viewers")
+        metrics.gauge("dashboard.viewers", lambda: len(self.clients))
+
+    def broadcast(self, chunk: bytes) -> None:
+        """Queue the encoded event for every viewer."""
+        for queue in list(self.clients):
+            if queue.qsize() >= self.max_pending:
+                # Too slow, the stream of the viewer is closed
+                self.clients.discard(queue)
+                queue.put_nowait(None)
+                self._dropped.inc()
+            else:
+                queue.put_nowait(chunk)
+
+    def add(self, reading: Reading) -> None:
+        """
+        Update the state with the reading and push the delta, used as bus subscriber.
+
+        Args:
+            reading (Reading): The reading.
+        """
+        started = time.perf_counter_ns()
+        address = reading.address
+        device = self.devices.get(address)
+        if device is None:
+            device = self.devices[address] = {"address": address}
+            self.sparks[address] = deque(maxlen=self.spark_size)
+        delta = {"address": address, "seen": reading.timestamp.isoformat()}
+        for field in FIELDS:
+            value = getattr(reading, field)
+            if device.get(field) != value:
+                device[field] = value
+                delta[field] = value
+        device["seen"] = delta["seen"]
+        self.sparks[address].append(reading.temp)
+        self.version += 1
+        if self.clients:
+            self.broadcast(sse_event("reading", delta))
+        self.check_alerts()
+        self._serialize.record((time.perf_counter_ns() - started) // 1000)
+
+    def alerts(self) -> list[dict]:
+        if self.scanner is None:
+            return []
+        return list(self.scanner.active_alerts.values())
+
+    def check_alerts(self) -> None:
+        """Push the active alerts when they changed."""
+        version = self.scanner.alerts_version if self.scanner else 0
+        if version == self.alerts_version:
+            return
+        self.alerts_version = version
+        self.version += 1
+        if self.clients:
+            self.broadcast(sse_event("alerts", self.alerts()))
+
+    def snapshot(self) -> bytes:
+        """Return the encoded snapshot event of the current state."""
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            data = {
+                "devices": [
+                    dict(device, spark=list(self.sparks[address]))
+                    for address, device in self.devices.items()
+                ],
+                "alerts": self.alerts(),
+            }
+            self._snapshot = (self.version, sse_event("snapshot", data))
+        return self._snapshot[1]
+
+    async def watch_alerts(self, interval: float = 0.5) -> None:
+        """Push alert changes between readings until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            self.check_alerts()
+
+    async def stream(self, writer: asyncio.StreamWriter) -> None:
+        """
+        Stream the events to a viewer until it disconnects.
+
+        Args:
+            writer (asyncio.StreamWriter): The connection of the viewer, the
+                response headers are written here.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+            b"retry: 2000\n\n"
+        )
+        writer.write(self.snapshot())
+        self.clients.add(queue)
+        try:
+            await writer.drain()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    chunk = b": keep-alive\n\n"
+                if chunk is None:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
+
+    def close(self) -> None:
+        """End the streams of all viewers."""
+        for queue in list(self.clients):
+            queue.put_nowait(None)
+        self.clients.clear()
+
+
+DASHBOARD_HTML = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>BLE metrics</title>
+<style>
+body { font-family: sans-serif; background: #111; color: #ddd; margin: 1em; }
+#status { font-size: 0.8em; color: #888; }
+#alerts div { background: #822; padding: 0.4em; margin-bottom: 0.3em; }
+#devices { display: flex; flex-wrap: wrap; gap: 1em; }
+.device { background: #222; padding: 0.8em; width: 14em; border: 2px solid #333; }
+.device.alert { border-color: #c33; }
+.device h3 { margin: 0 0 0.4em 0; font-size: 1em; }
+.temp { font-size: 2em; }
+.small { font-size: 0.8em; color: #aaa; }
+svg { width: 100%; height: 40px; }
+polyline { fill: none; stroke: #4af; stroke-width: 1.5; }
+</style>
+</head>
+<body>
+<div id="status">connecting...</div>
+<div id="alerts"></div>
+<div id="devices"></div>
+<script>
+const devices = {};
+let alerts = [];
+
+function card(address) {
+  let el = document.getElementById(address);
+  if (!el) {
+    el = document.createElement("div");
+    el.id = address;
+    el.className = "device";
+    el.innerHTML = '<h3></h3><div class="temp"></div><div class="hum"></div>' +
+      '<svg viewBox="0 0 100 40" preserveAspectRatio="none"><polyline/></svg>' +
+      '<div class="small"></div>';
+    document.getElementById("devices").appendChild(el);
+  }
+  return el;
+}
+
+function sparkline(values) {
+  if (values.length < 2) return "";
+  const min = Math.min(...values), max = Math.max(...values);
+  const range = max - min || 1;
+  return values.map((v, i) =>
+    (i * 100 / (values.length - 1)).toFixed(1) + "," +
+    (38 - (v - min) * 36 / range).toFixed(1)).join(" ");
+}
+
+function render(address) {
+  const d = devices[address];
+  const el = card(address);
+  el.querySelector("h3").textContent = d.name || address;
+  el.querySelector(".temp").textContent = d.temp.toFixed(2) + " \\u00b0C";
+  el.querySelector(".hum").textContent = d.humidity.toFixed(2) + " %";
+  el.querySelector("polyline").setAttribute("points", sparkline(d.spark));
+  el.querySelector(".small").textContent = "Battery " + d.battery + "% (" +
+    d.battery_v.toFixed(2) + " V), RSSI " + d.rssi + " dBm, " +
+    d.seen.slice(11, 19);
+  el.classList.toggle("alert", alerts.some(a => a.device === d.name));
+}
+
+function renderAlerts() {
+  document.getElementById("alerts").innerHTML = "";
+  for (const a of alerts) {
+    const el = document.createElement("div");
+    el.textContent = a.device + ": " + a.temp.toFixed(2) + " \\u00b0C is " +
+      a.type + " (threshold " + a.threshold + " \\u00b0C) since " +
+      a.since.slice(11, 19);
+    document.getElementById("alerts").appendChild(el);
+  }
+  Object.keys(devices).forEach(render);
+}
+
+const source = new EventSource("events");
+source.onopen = () => document.getElementById("status").textContent = "live";
+source.onerror = () => document.getElementById("status").textContent = "reconnecting...";
+source.addEventListener("snapshot", e => {
+  const data = JSON.parse(e.data);
+  for (const d of data.devices) devices[d.address] = d;
+  alerts = data.alerts;
+  renderAlerts();
+});
+source.addEventListener("reading", e => {
+  const delta = JSON.parse(e.data);
+  const d = devices[delta.address] || (devices[delta.address] = {spark: []});
+  Object.assign(d, delta);
+  d.spark.push(d.temp);
+  if (d.spark.length > 60) d.spark.shift();
+  render(delta.address);
+});
+source.addEventListener("alerts", e => {
+  alerts = JSON.parse(e.data);
+  renderAlerts();
+});
+</script>
+</body>
+</html>
+"""
@@ -1,7 +1,7 @@
 import logging
 import httpx
 from functools import wraps
-import time
+from clock import get_clock
 from env_settings import settings
 
 # In-memory cache to track recently sent messages
@@ -21,15 +21,16 @@ def limit_repeated_messages(interval: int, cleanup_interval: int = CLEANUP_INTER
         interval (int): Time in seconds to block repeated messages.
         cleanup_interval (int): Time in seconds to trigger cleanup of stale records.
     """
-    _last_cleanup_time = [
-        time.time()
-    ]  # Use a mutable object to store the last cleanup time
+    # Use a mutable object to store the last cleanup time, set on first use
+    _last_cleanup_time = [None]
 
     def decorator(func):
         @wraps(func)
         async def wrapper(message: str, *args, **kwargs):
             nonlocal _last_cleanup_time
-            current_time = time.time()
+            current_time = get_clock().monotonic()
+            if _last_cleanup_time[0] is None:
+                _last_cleanup_time[0] = current_time
 
             # Perform cleanup if the cleanup interval has passed
             if current_time - _last_cleanup_time[0] > cleanup_interval:
@@ -68,9 +69,33 @@ def _cleanup_cache(current_time: float, interval: int):
     print(f"Cleaned up {len(keys_to_delete)} stale entries from the cache.")
 
 
+# Connection pool per webhook, the alerts of a destination reuse its connections
+_clients: dict[str, httpx.AsyncClient] = {}
+POOL_LIMITS = httpx.Limits(max_connections=4, max_keepalive_connections=2)
+
+
+def get_client(web_hook: str) -> httpx.AsyncClient:
+    """Return the HTTP/2 client of the webhook, created on first use."""
+    client = _clients.get(web_hook)
+    if client is None or client.is_closed:
+        client = _clients[web_hook] = httpx.AsyncClient(
+            http2=True, timeout=10, limits=POOL_LIMITS
+        )
+    return client
+
+
+async def close_client(web_hook: str | None = None) -> None:
+    """Close the client of the webhook, DISCORD_WEB_HOOKS by default."""
+    client = _clients.pop(web_hook or settings.DISCORD_WEB_HOOKS, None)
+    if client:
+        await client.aclose()
+
+
 # @limit_repeated_messages(interval=LIMIT_INTERVAL)
-async def send_message(message: str, tts: bool = False) -> bool | None:
-    web_hook = settings.DISCORD_WEB_HOOKS
+async def send_message(
+    message: str, tts: bool = False, web_hook: str | None = None
+) -> bool | None:
+    web_hook = web_hook or settings.DISCORD_WEB_HOOKS
     # print(f"Sending message: {message} {web_hook=}")
     if not web_hook or not message:
         return None
@@ -80,8 +105,7 @@ async def send_message(message: str, tts: bool = False) -> bool | None:
         "content": message,
         "tts": tts,
     }
-    async with httpx.AsyncClient(http2=True) as client:
-        response = await client.post(web_hook, json=json, timeout=10)
+    response = await get_client(web_hook).post(web_hook, json=json)
     return response.status_code < 300
 
 
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import smtplib
+import ssl
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+from env_settings import settings
+from metrics import metrics
+from notifications import NotificationAbstract
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+class EmailNotification(NotificationAbstract):
+    """
+    Notification sending the alerts by e-mail over SMTP.
+
+    The authenticated SMTP session is opened on the first message and reused
+    for the following ones, it is opened again when the server closed it.
+    Alerts arriving within ``batch_window`` seconds of the first one are sent
+    as one message. The blocking smtplib calls run on a dedicated worker
+    thread, one at a time, so the event loop never waits for the server.
+    """
+
+    def __init__(
+        self,
+        host: str = None,
+        port: int = None,
+        user: str = None,
+        password: str = None,
+        tls: str = None,
+        sender: str = None,
+        recipients: list[str] = None,
+        batch_window: float = None,
+        timeout: float = 30.0,
+    ) -> None:
+        """
+        Initializes the EmailNotification object, defaults are read from the settings.
+
+        Args:
+            host (str): The SMTP server.
+            port (int): The SMTP port, 587 for STARTTLS, 465 for SSL, 25 otherwise.
+            user (str): The login, None when the server needs no authentication.
+            password (str): The password.
+            tls (str): 'starttls', 'ssl' or 'none'.
+            sender (str): The From address, the login by default.
+            recipients (list[str]): The To addresses.
+            batch_window (float): Seconds alerts are collected into one message.
+            timeout (float): The SMTP timeout in seconds.
+        """
+        super().__init__()
+        self.host = host or settings.SMTP_HOST
+        if not self.host:
+            raise ValueError("SMTP_HOST is not set")
+        self.tls = (tls or settings.SMTP_TLS).lower()
+        if self.tls not in ("starttls", "ssl", "none"):
+            raise ValueError(f"Unknown SMTP_TLS {self.tls}")
+        self.port = (
+            port
+            or settings.SMTP_PORT
+            or {"starttls": 587, "ssl": 465}.get(self.tls, 25)
+        )
+        self.user = user or settings.SMTP_USER
+        self.password = password or settings.SMTP_PASSWORD
+        self.sender = sender or settings.SMTP_FROM or self.user
+        self.recipients = recipients or settings.SMTP_TO
+        if not self.sender or not self.recipients:
+            raise ValueError("SMTP_FROM and SMTP_TO are not set")
+        self.batch_window = (
+            settings.SMTP_BATCH_WINDOW if batch_window is None else batch_window
+        )
+        self.timeout = timeout
+        self.pending: list[tuple[str | None, str | None]] = []
+        self._smtp: smtplib.SMTP | None = None
+        # One thread owns the SMTP session, the messages are sent in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp")
+        self._batch: asyncio.Task | None = None
+        self.metric_messages = metrics.counter("notification.email.messages")
+        self.metric_alerts = metrics.counter("notification.email.alerts")
+        self.metric_connects = metrics.counter("notification.email.connects")
+        self.metric_errors = metrics.counter("notification.email.errors")
+
+    async def send_alert(
+        self,
+        title: str | None = None,
+        message: str | None = None,
+        params: dict | None = None,
+    ) -> None:
+        """Queue the alert, sent with the alerts of the batch window.
+
+        Args:
+            title (str | None): The title of the notification, if provided.
+            message (str | None): The message content of the notification, if provided.
+            params (dict | None)
+
+        """
+        self.pending.append((title, message))
+        self.metric_alerts.inc()
+        if self._batch is None:
+            self._batch = asyncio.create_task(self.send_batch())
+
+    async def send_batch(self) -> None:
+        """Send the queued alerts at the end of the batch window."""
+        try:
+            await asyncio.sleep(self.batch_window)
+        finally:
+            self._batch = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Send the queued alerts as one message."""
+        if not self.pending:
+            return
+        alerts, self.pending = self.pending, []
+        email = self.build_message(alerts)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self.deliver, email)
+        except (smtplib.SMTPException, OSError) as e:
+            self.metric_errors.inc()
+            logger.error(f"E-mail notification of {len(alerts)} alerts failed: {e!r}")
+
+    def build_message(
+        self, alerts: list[tuple[str | None, str | None]]
+    ) -> EmailMessage:
+        """
+        Build the message of the alerts.
+
+        Args:
+            alerts (list[tuple[str | None, str | None]]): The (title, message)
+                of the alerts.
+
+        Returns:
+            EmailMessage: The message, the subject is the title of the only
+                alert or the number of alerts.
+        """
+        email = EmailMessage()
+        first = alerts[0][0] or "Temperature alert"
+        email["Subject"] = (
+            first if len(alerts) == 1 else f"{len(alerts)} alerts, first: {first}"
+        )
+        email["From"] = self.sender
+        email["To"] = ", ".join(self.recipients)
+        email["Date"] = formatdate(localtime=True)
+        email["Message-ID"] = make_msgid()
+        email.set_content(
+            "\n\n".join("\n".join(part for part in alert if part) for alert in alerts)
+        )
+        return email
+
+    def connect(self) -> smtplib.SMTP:
+        """Open and authenticate the SMTP session, runs on the worker thread."""
+        self.metric_connects.inc()
+        if self.tls == "ssl":
+            smtp = smtplib.SMTP_SSL(
+                self.host,
+                self.port,
+                timeout=self.timeout,
+                context=ssl.create_default_context(),
+            )
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.tls == "starttls":
+                smtp.starttls(context=ssl.create_default_context())
+            if self.user:
+                smtp.login(self.user, self.password or "")
+        except BaseException:
+            # A failed handshake (TLS, credentials) must not leak the socket
+            smtp.close()
+            raise
+        return smtp
+
+    def deliver(self, email: EmailMessage) -> None:
+        """Send the message on the open session, runs on the worker thread.
+
+        A session closed by the server (idle timeout) is opened again and the
+        message is sent once more.
+        """
+        for attempt in range(2):
+            if self._smtp is None:
+                self._smtp = self.connect()
+            try:
+                self._smtp.send_message(email)
+                self.metric_messages.inc()
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self._smtp = None
+                if attempt:
+                    raise
+            except smtplib.SMTPException:
+                self.disconnect()
+                raise
+
+    def disconnect(self) -> None:
+        """Close the SMTP session, runs on the worker thread."""
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            smtp.close()
+
+    async def close(self) -> None:
+        """Send the queued alerts and close the SMTP session."""
+        if self._batch:
+            self._batch.cancel()
+            self._batch = None
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.disconnect)
+        self._executor.shutdown(wait=False)
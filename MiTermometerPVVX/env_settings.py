@@ -18,9 +18,8 @@ class Settings:
                 cls._instance._initialize()
         return cls._instance
 
-    def _load_custom_names(self):
+    def _load_custom_names(self, prefix: str = "NAME_"):
         custom_names = {}
-        prefix = "NAME_"
         for key, value in os.environ.items():
             if key.startswith(prefix):
                 # Remove the prefix and use the remaining part as the key
@@ -49,20 +48,94 @@ class Settings:
         self._find_env()
         self.DEBUG = os.getenv("DEBUG", "False").strip().lower() == "true"
         self.ATC_CUSTOM_NAMES = self._load_custom_names()
+        # Virtual devices: GROUP_<NAME>=[mean|min|max:]member,member
+        self.VIRTUAL_DEVICES = self._load_custom_names("GROUP_")
+        self.VIRTUAL_MEMBER_ALERTS = (
+            os.getenv("VIRTUAL_MEMBER_ALERTS", "False").strip().lower() == "true"
+        )
 
         self.ALERT_LOW_THRESHOLD = os.getenv("ALERT_LOW_THRESHOLD")
         self.ALERT_HIGH_THRESHOLD = os.getenv("ALERT_HIGH_THRESHOLD")
         self.SENT_THRESHOLD_TEMP = os.getenv("SENT_THRESHOLD_TEMP", 1.0)
 
+        self.ALERT_DIGEST_WINDOW = float(os.getenv("ALERT_DIGEST_WINDOW", 0))
+        c = os.getenv("ALERT_CRITICAL_DELTA", "5.0").strip()
+        self.ALERT_CRITICAL_DELTA = float(c) if c.lower() not in ("", "none") else None
+
+        self.ALERT_ROUTES = os.getenv("ALERT_ROUTES", "").strip() or None
+
         self.DISCORD_WEB_HOOKS = os.getenv("DISCORD_WEB_HOOKS")
 
+        self.SMTP_HOST = os.getenv("SMTP_HOST", "").strip() or None
+        self.SMTP_PORT = int(os.getenv("SMTP_PORT", 0))
+        self.SMTP_USER = os.getenv("SMTP_USER", "").strip() or None
+        self.SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+        self.SMTP_TLS = os.getenv("SMTP_TLS", "starttls").strip().lower()
+        self.SMTP_FROM = os.getenv("SMTP_FROM", "").strip() or None
+        t = os.getenv("SMTP_TO")
+        self.SMTP_TO = [i.strip() for i in t.split(",") if i.strip()] if t else []
+        self.SMTP_BATCH_WINDOW = float(os.getenv("SMTP_BATCH_WINDOW", 5))
+
         n = os.getenv("NOTIFICATION")
         self.NOTIFICATION = n.split(",") if n else None
 
+        self.OUTPUT = os.getenv("OUTPUT", "console").strip().lower()
+
         self.BLE_SCANNER_MODE = os.getenv("BLE_SCANNER_MODE", "auto").lower()
         if self.BLE_SCANNER_MODE not in ["auto", "passive", "active"]:
             self.BLE_SCANNER_MODE = "auto"
 
+        self.BLE_DUTY_CYCLE = (
+            os.getenv("BLE_DUTY_CYCLE", "False").strip().lower() == "true"
+        )
+        self.BLE_WATCHDOG = float(os.getenv("BLE_WATCHDOG", 0))
+        self.BLE_RESTART_BACKOFF_MAX = float(os.getenv("BLE_RESTART_BACKOFF_MAX", 60))
+
+        self.EVENT_LOOP = os.getenv("EVENT_LOOP", "asyncio").strip().lower()
+        if self.EVENT_LOOP not in ["asyncio", "uvloop"]:
+            self.EVENT_LOOP = "asyncio"
+        self.LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", 0))
+
+        self.SHARED_MEMORY = os.getenv("SHARED_MEMORY", "").strip() or None
+
+        self.API_SOCKET = os.getenv("API_SOCKET", "").strip() or None
+        self.API_HTTP = os.getenv("API_HTTP", "").strip() or None
+        self.DASHBOARD = os.getenv("DASHBOARD", "False").strip().lower() == "true"
+        self.HISTORY_SIZE = int(os.getenv("HISTORY_SIZE", 10000))
+
+        s = os.getenv("SINKS")
+        self.SINKS = [i.strip() for i in s.split(",") if i.strip()] if s else []
+        self.INFLUX_URL = os.getenv("INFLUX_URL")
+        self.INFLUX_TOKEN = os.getenv("INFLUX_TOKEN")
+        self.INFLUX_MEASUREMENT = os.getenv("INFLUX_MEASUREMENT", "ble")
+        self.INFLUX_BATCH_SIZE = int(os.getenv("INFLUX_BATCH_SIZE", 5000))
+        self.INFLUX_FLUSH_INTERVAL = float(os.getenv("INFLUX_FLUSH_INTERVAL", 10))
+        self.INFLUX_SPILL = os.getenv("INFLUX_SPILL", "influx_spill.lp")
+
+        self.ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+        self.ARCHIVE_FORMAT = os.getenv("ARCHIVE_FORMAT", "jsonl").strip().lower()
+        self.ARCHIVE_RETENTION_DAYS = float(os.getenv("ARCHIVE_RETENTION_DAYS", 0))
+
+        self.WIRE_FORWARD = os.getenv("WIRE_FORWARD", "").strip() or None
+        self.WIRE_LISTEN = os.getenv("WIRE_LISTEN", "").strip() or None
+        self.GATEWAY_NAME = os.getenv("GATEWAY_NAME", "").strip() or None
+
+        self.SOAK_DEVICES = int(os.getenv("SOAK_DEVICES", 20))
+        self.SOAK_RSS_BUDGET_MB = float(os.getenv("SOAK_RSS_BUDGET_MB", 20))
+        self.SOAK_OBJECTS_BUDGET = int(os.getenv("SOAK_OBJECTS_BUDGET", 20000))
+        self.SOAK_TASKS_BUDGET = int(os.getenv("SOAK_TASKS_BUDGET", 5))
+        self.SOAK_QUEUE_BUDGET = int(os.getenv("SOAK_QUEUE_BUDGET", 1000))
+        self.SOAK_LATENCY_DRIFT = float(os.getenv("SOAK_LATENCY_DRIFT", 3.0))
+
+        self.CHECKPOINT_FILE = os.getenv("CHECKPOINT_FILE", "").strip() or None
+        self.CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", 60))
+        self.CHECKPOINT_MAX_AGE = float(os.getenv("CHECKPOINT_MAX_AGE", 3600))
+
+        a = os.getenv("BLE_ADAPTERS")
+        self.BLE_ADAPTERS = (
+            [i.strip() for i in a.split(",") if i.strip()] if a else None
+        )
+
         self.BASE_PATH = Path(__file__).parent
         self.APP_NAME = "BLE metrics and notification"
 
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from metrics import metrics
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+def install_loop_policy(name: str = "asyncio") -> str:
+    """
+    Install the event loop policy used by asyncio.run.
+
+    Args:
+        name (str): 'asyncio' for the default loop or 'uvloop'.
+
+    Returns:
+        str: The name of the installed loop, 'asyncio' when uvloop is not available.
+    """
+    if name == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            logger.warning("uvloop is not installed, using the default asyncio loop")
+            return "asyncio"
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        return "uvloop"
+    return "asyncio"
+
+
+class LoopLagMonitor:
+    """
+    Monitor of the scheduling delay of the asyncio loop.
+
+    A heartbeat coroutine measures how late its sleep returns (the loop lag)
+    and records it in the ``loop.lag_us`` histogram. A watchdog thread checks
+    the heartbeat, and when the loop is blocked longer than ``threshold`` it
+    logs the stack of the loop thread, pointing at the slow callback while it
+    is still running.
+    """
+
+    def __init__(self, threshold: float = 0.1, interval: float = 0.05):
+        """
+        Initialize the monitor.
+
+        Args:
+            threshold (float): Lag in seconds reported as slow callback.
+            interval (float): Seconds between heartbeats.
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.thread_id: int | None = None
+        self.slow_callbacks = 0
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lag = metrics.histogram("loop.lag_us")
+        self._slow = metrics.counter("loop.slow_callbacks")
+        metrics.register_collector("loop", self.get_stats)
+
+    def get_stats(self) -> dict:
+        return {
+            "max_lag": round(self.max_lag, 4),
+            "slow_callbacks": self.slow_callbacks,
+        }
+
+    def _watchdog(self) -> None:
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat
+            if blocked < self.threshold + self.interval or reported == heartbeat:
+                continue
+            reported = heartbeat
+            self.slow_callbacks += 1
+            self._slow.inc()
+            frame = sys._current_frames().get(self.thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            logger.warning(
+                f"Event loop blocked for {blocked * 1000:.0f} ms by:\n{stack}"
+            )
+
+    async def run(self) -> None:
+        """Measure the loop lag until cancelled."""
+        loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watchdog, name="LoopLagMonitor", daemon=True
+        )
+        self._thread.start()
+        try:
+            while True:
+                expected = loop.time() + self.interval
+                await asyncio.sleep(self.interval)
+                lag = max(0.0, loop.time() - expected)
+                self._heartbeat = time.monotonic()
+                self._lag.record(int(lag * 1_000_000))
+                if lag > self.max_lag:
+                    self.max_lag = lag
+        finally:
+            self._stop.set()
+            self._thread.join()
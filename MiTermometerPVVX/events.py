@@ -0,0 +1,214 @@
+import asyncio
+import datetime
+import inspect
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Literal
+
+from metrics import metrics
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+@dataclass(frozen=True, slots=True)
+class Reading:
+    """One accepted measurement of a device."""
+
+    address: str
+    name: str | None
+    temp: float
+    humidity: float
+    battery_v: float
+    battery: int
+    rssi: int | None
+    count: int
+    timestamp: datetime.datetime
+    # Time since the previous reading of the device
+    interval: datetime.timedelta | None = None
+    adapter: str | None = None
+    # Min and max temperature of the members of a virtual device
+    temp_range: tuple[float, float] | None = None
+    # Monotonic time of creation, used for the lag of subscribers
+    created: float = field(default_factory=time.monotonic)
+
+    def as_dict(self) -> dict:
+        """
+        Return the reading as JSON-serializable dictionary.
+
+        Returns:
+            dict: The fields, the timestamp in ISO format and the interval in seconds.
+        """
+        return {
+            "address": self.address,
+            "name": self.name,
+            "temp": self.temp,
+            "humidity": self.humidity,
+            "battery_v": self.battery_v,
+            "battery": self.battery,
+            "rssi": self.rssi,
+            "count": self.count,
+            "timestamp": self.timestamp.isoformat(),
+            "interval": self.interval.total_seconds() if self.interval else None,
+            "adapter": self.adapter,
+            "temp_range": list(self.temp_range) if self.temp_range else None,
+        }
+
+
+Handler = Callable[[Reading], Awaitable[None] | None]
+Overflow = Literal["drop_oldest", "drop_newest", "block"]
+
+
+class Subscriber:
+    """
+    A consumer of readings with its own bounded queue and worker task.
+
+    When the queue is full the overflow policy decides: 'drop_oldest' makes
+    room by discarding the oldest queued reading, 'drop_newest' discards the
+    new reading and 'block' makes the publisher wait.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Handler,
+        maxsize: int = 1000,
+        overflow: Overflow = "drop_oldest",
+    ):
+        if overflow not in ("drop_oldest", "drop_newest", "block"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.name = name
+        self.handler = handler
+        self.overflow = overflow
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.task: asyncio.Task | None = None
+        self.delivered = metrics.counter(f"bus.{name}.delivered")
+        self.dropped = metrics.counter(f"bus.{name}.dropped")
+        self.lag = metrics.histogram(f"bus.{name}.lag_us")
+        metrics.gauge(f"bus.{name}.queue_depth", self.queue.qsize)
+
+    def start(self) -> None:
+        """Start the worker task, the loop must be running."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.worker(), name=f"bus:{self.name}")
+
+    async def offer(self, reading: Reading) -> None:
+        """Queue the reading according to the overflow policy."""
+        if self.overflow == "block":
+            await self.queue.put(reading)
+            return
+        if self.queue.full():
+            self.dropped.inc()
+            if self.overflow == "drop_newest":
+                return
+            self.queue.get_nowait()
+            self.queue.task_done()
+        self.queue.put_nowait(reading)
+
+    async def worker(self) -> None:
+        """Deliver queued readings to the handler."""
+        while True:
+            reading = await self.queue.get()
+            try:
+                self.lag.record(int((time.monotonic() - reading.created) * 1_000_000))
+                result = self.handler(reading)
+                if inspect.isawaitable(result):
+                    await result
+                self.delivered.inc()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Subscriber {self.name} failed: {e!r}")
+            finally:
+                self.queue.task_done()
+
+    async def close(self, drain: bool = True) -> None:
+        """
+        Stop the worker.
+
+        Args:
+            drain (bool): Deliver the queued readings first.
+        """
+        if self.task is None:
+            return
+        if drain and not self.task.done():
+            await self.queue.join()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+
+class EventBus:
+    """
+    In-process publish/subscribe bus of readings.
+
+    Every subscriber gets its own bounded queue and worker, so a slow
+    subscriber only delays itself. Its delivered and dropped readings, queue
+    depth and lag are recorded in the pipeline metrics as ``bus.<name>.*``.
+    """
+
+    def __init__(self):
+        self.subscribers: dict[str, Subscriber] = {}
+
+    def subscribe(
+        self,
+        name: str,
+        handler: Handler,
+        maxsize: int = 1000,
+        overflow: Overflow = "drop_oldest",
+    ) -> Subscriber:
+        """
+        Add a subscriber.
+
+        Args:
+            name (str): The unique name of the subscriber.
+            handler (Handler): Function or coroutine function called per reading.
+            maxsize (int): The size of the queue of the subscriber.
+            overflow (Overflow): The policy when the queue is full.
+
+        Returns:
+            Subscriber: The subscriber.
+        """
+        if name in self.subscribers:
+            raise ValueError(f"Subscriber {name} already exists")
+        subscriber = Subscriber(name, handler, maxsize, overflow)
+        self.subscribers[name] = subscriber
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Started on the first publish
+            pass
+        else:
+            subscriber.start()
+        return subscriber
+
+    async def unsubscribe(self, name: str, drain: bool = False) -> None:
+        """Remove the subscriber and stop its worker."""
+        subscriber = self.subscribers.pop(name, None)
+        if subscriber:
+            await subscriber.close(drain)
+
+    async def publish(self, reading: Reading) -> None:
+        """
+        Queue the reading for every subscriber.
+
+        Args:
+            reading (Reading): The reading.
+        """
+        for subscriber in self.subscribers.values():
+            if subscriber.task is None:
+                subscriber.start()
+            await subscriber.offer(reading)
+
+    async def close(self, drain: bool = True) -> None:
+        """
+        Stop all subscribers.
+
+        Args:
+            drain (bool): Deliver the queued readings first.
+        """
+        for subscriber in list(self.subscribers.values()):
+            await subscriber.close(drain)
@@ -0,0 +1,325 @@
+import asyncio
+import gzip
+import logging
+import os
+import time
+from pathlib import Path
+
+from env_settings import settings
+from events import Reading
+from metrics import metrics
+from sinks import SinkAbstract
+from supervisor import Backoff
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+def escape_tag(value: str) -> str:
+    """Escape a tag key or value of the line protocol."""
+    return (
+        value.replace("\\", "\\\\")
+        .replace(",", "\\,")
+        .replace("=", "\\=")
+        .replace(" ", "\\ ")
+    )
+
+
+def escape_measurement(value: str) -> str:
+    """Escape a measurement name of the line protocol."""
+    return value.replace("\\", "\\\\").replace(",", "\\,").replace(" ", "\\ ")
+
+
+class InfluxSink(SinkAbstract):
+    """
+    Sink writing readings to InfluxDB in line protocol.
+
+    Lines are posted in batches, bounded by number of lines and bytes, or
+    after ``flush_interval`` seconds, gzip compressed over a pooled HTTP
+    connection. Failed posts (network errors, 5xx, 408 and 429) are retried
+    with backoff. When the endpoint stays unreachable the batch is appended
+    to a spill file, which is sent again after the next successful post.
+    """
+
+    def __init__(
+        self,
+        url: str = None,
+        token: str = None,
+        measurement: str = None,
+        batch_size: int = None,
+        max_bytes: int = 1024 * 1024,
+        flush_interval: float = None,
+        gzip_level: int = 5,
+        max_retries: int = 5,
+        spill_path: str = None,
+        spill_max_bytes: int = 50 * 1024 * 1024,
+        timeout: float = 10.0,
+        close_timeout: float = 5.0,
+    ):
+        """
+        Initialize the sink, defaults are read from the settings.
+
+        Args:
+            url (str): The write URL, e.g.
+                'http://localhost:8086/api/v2/write?org=home&bucket=ble'.
+            token (str): The API token, sent as 'Authorization: Token ...'.
+            measurement (str): The measurement name.
+            batch_size (int): The maximum number of lines per post.
+            max_bytes (int): The maximum uncompressed size of a post.
+            flush_interval (float): Seconds after which pending lines are posted.
+            gzip_level (int): The gzip compression level, 0 disables compression.
+            max_retries (int): Retries of a failed post before spilling to disk.
+            spill_path (str): The spill file, None disables spilling.
+            spill_max_bytes (int): The maximum size of the spill file.
+            timeout (float): The HTTP timeout in seconds.
+            close_timeout (float): Seconds the last post may take on close,
+                the batch is spilled after it.
+        """
+        self.url = url or settings.INFLUX_URL
+        if not self.url:
+            raise ValueError("INFLUX_URL is not set")
+        self.token = token or settings.INFLUX_TOKEN
+        self.measurement = escape_measurement(
+            measurement or settings.INFLUX_MEASUREMENT
+        )
+        self.batch_size = batch_size or settings.INFLUX_BATCH_SIZE
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval or settings.INFLUX_FLUSH_INTERVAL
+        self.gzip_level = gzip_level
+        self.max_retries = max_retries
+        spill_path = spill_path or settings.INFLUX_SPILL
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.spill_max_bytes = spill_max_bytes
+        self.timeout = timeout
+        self.close_timeout = close_timeout
+        self.lines: list[bytes] = []
+        # The batch being posted, spilled when the post is cancelled on close
+        self.inflight: list[bytes] = []
+        self.size = 0
+        self.sending = False
+        self.closing = False
+        self.client = None
+        self._tags: dict[tuple, str] = {}
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._lines = metrics.counter("influx.lines")
+        self._batches = metrics.counter("influx.batches")
+        self._errors = metrics.counter("influx.errors")
+        self._spilled = metrics.counter("influx.spilled_lines")
+        self._dropped = metrics.counter("influx.dropped_lines")
+        self._post_time = metrics.histogram("influx.post_us")
+        self._batch_bytes = metrics.histogram("influx.batch_bytes")
+
+    async def start(self) -> None:
+        # httpx is imported only when the sink is selected
+        import httpx
+
+        headers = {"Content-Type": "text/plain; charset=utf-8"}
+        if self.token:
+            headers["Authorization"] = f"Token {self.token}"
+        if self.gzip_level:
+            headers["Content-Encoding"] = "gzip"
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=2, max_keepalive_connections=1),
+        )
+        self._task = asyncio.create_task(self.run(), name="influx")
+
+    def encode(self, reading: Reading) -> bytes:
+        """
+        Return the line protocol line of the reading.
+
+        Args:
+            reading (Reading): The reading.
+
+        Returns:
+            bytes: The line, without newline.
+        """
+        key = (reading.address, reading.name)
+        tags = self._tags.get(key)
+        if tags is None:
+            tags = f"{self.measurement},address={escape_tag(reading.address)}"
+            if reading.name:
+                tags += f",name={escape_tag(reading.name)}"
+            self._tags[key] = tags
+        fields = (
+            f"temp={reading.temp},humidity={reading.humidity},"
+            f"battery={reading.battery}i,battery_v={reading.battery_v},"
+            f"count={reading.count}i"
+        )
+        if reading.rssi is not None:
+            fields += f",rssi={reading.rssi}i"
+        timestamp = int(reading.timestamp.timestamp() * 1_000_000) * 1000
+        return f"{tags} {fields} {timestamp}".encode()
+
+    async def write(self, reading: Reading) -> None:
+        line = self.encode(reading)
+        self.lines.append(line)
+        self.size += len(line) + 1
+        self._lines.inc()
+        if len(self.lines) >= self.batch_size or self.size >= self.max_bytes:
+            if self.sending:
+                # The endpoint is slow or retried, keep the memory bounded
+                await self.spill(self.take())
+            else:
+                self._wake.set()
+
+    def take(self) -> list[bytes]:
+        lines, self.lines, self.size = self.lines, [], 0
+        return lines
+
+    async def run(self) -> None:
+        """Post the pending lines in batches until closed."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # The task must keep draining the lines, or they pile up
+                self._errors.inc()
+                logger.error(f"InfluxDB flush failed: {e!r}")
+            if self.closing:
+                break
+
+    async def flush(self) -> None:
+        """Post the pending lines, spill them when the post failed."""
+        if not self.lines:
+            return
+        self.sending = True
+        try:
+            lines = self.inflight = self.take()
+            posted = await self.post(lines)
+            self.inflight = []
+            if posted:
+                await self.send_spill()
+            else:
+                await self.spill(lines)
+        finally:
+            self.sending = False
+
+    async def post(self, lines: list[bytes]) -> bool:
+        """
+        Post the lines, retrying failed posts with backoff.
+
+        Args:
+            lines (list[bytes]): The lines.
+
+        Returns:
+            bool: False if the endpoint was unreachable, True when posted or
+                rejected as invalid (the lines are dropped).
+        """
+        data = b"\n".join(lines)
+        self._batch_bytes.record(len(data))
+        if self.gzip_level:
+            # Compressing a large batch would block the event loop
+            data = await asyncio.to_thread(gzip.compress, data, self.gzip_level)
+        backoff = Backoff(initial=0.5, maximum=30)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(backoff.next())
+            started = time.perf_counter_ns()
+            try:
+                response = await self.client.post(self.url, content=data)
+            except Exception as e:
+                # Network errors, also an invalid URL or request, are spilled
+                self._errors.inc()
+                logger.warning(f"InfluxDB post failed: {e!r}")
+                continue
+            finally:
+                self._post_time.record((time.perf_counter_ns() - started) // 1000)
+            status = response.status_code
+            if status < 300:
+                self._batches.inc()
+                return True
+            self._errors.inc()
+            if status < 500 and status not in (408, 429):
+                logger.error(
+                    f"InfluxDB rejected {len(lines)} lines: {status} {response.text[:200]}"
+                )
+                self._dropped.inc(len(lines))
+                return True
+            logger.warning(f"InfluxDB post failed: {status}")
+        return False
+
+    def _append_spill(self, lines: list[bytes]) -> int:
+        size = self.spill_path.stat().st_size if self.spill_path.exists() else 0
+        if size >= self.spill_max_bytes:
+            return 0
+        with open(self.spill_path, "ab") as f:
+            f.write(b"\n".join(lines) + b"\n")
+        return len(lines)
+
+    async def spill(self, lines: list[bytes]) -> None:
+        """Append the lines to the spill file, drop them without one."""
+        if not lines:
+            return
+        spilled = 0
+        if self.spill_path:
+            try:
+                spilled = await asyncio.to_thread(self._append_spill, lines)
+            except OSError as e:
+                logger.error(f"InfluxDB spill failed: {e}")
+        self._spilled.inc(spilled)
+        if spilled < len(lines):
+            self._dropped.inc(len(lines) - spilled)
+            logger.warning(f"InfluxDB dropped {len(lines) - spilled} lines")
+
+    @property
+    def sending_path(self) -> Path:
+        return self.spill_path.with_name(self.spill_path.name + ".sending")
+
+    def _take_spill(self) -> list[bytes]:
+        # Moved away first, lines spilled while sending go to a new spill file.
+        # A crash while sending leaves the file, it is sent again (InfluxDB
+        # overwrites points of the same series and time).
+        if not self.sending_path.exists():
+            if not self.spill_path.exists():
+                return []
+            os.replace(self.spill_path, self.sending_path)
+        with open(self.sending_path, "rb") as f:
+            return f.read().splitlines()
+
+    async def send_spill(self) -> None:
+        """Post the spilled lines in batches, spill the rest again on failure."""
+        if not self.spill_path:
+            return
+        try:
+            lines = await asyncio.to_thread(self._take_spill)
+        except OSError as e:
+            logger.error(f"InfluxDB reading spill failed: {e}")
+            return
+        if not lines:
+            return
+        logger.info(f"InfluxDB sending {len(lines)} spilled lines")
+        sent = 0
+        while sent < len(lines):
+            batch = lines[sent : sent + self.batch_size]
+            if not await self.post(batch):
+                break
+            sent += len(batch)
+        if sent < len(lines):
+            await self.spill(lines[sent:])
+        await asyncio.to_thread(self.sending_path.unlink, missing_ok=True)
+
+    async def close(self) -> None:
+        # One attempt on exit, spilled when it fails
+        self.max_retries = 0
+        if self._task:
+            self.closing = True
+            self._wake.set()
+            try:
+                # A post already running keeps its retries and backoff
+                await asyncio.wait_for(self._task, self.close_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("InfluxDB post cancelled on close")
+            self._task = None
+            # The batch of a cancelled post and the lines written since
+            await self.spill(self.inflight + self.take())
+            self.inflight = []
+        if self.client:
+            await self.client.aclose()
+            self.client = None
@@ -0,0 +1,197 @@
+import bisect
+import math
+
+from clock import get_clock
+from utils import counter_delta
+
+
+class LinkQuality:
+    """
+    Reception quality of one device derived from the PVVX frame counter.
+
+    The 8-bit frame counter increases by one for every measurement, so a jump
+    of the counter between two received frames is the number of frames lost
+    on the way to the gateway. The counter wraps around after 255.
+    """
+
+    # Counter steps "behind" the last frame treated as late, out-of-order frames
+    LATE_WINDOW = 16
+    # Upper edges of the inter-arrival histogram buckets in seconds
+    INTERVAL_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 60, 120, 300, math.inf)
+
+    __slots__ = (
+        "received",
+        "missed",
+        "last_count",
+        "last_time",
+        "intervals",
+        "interval_sum",
+        "interval_count",
+        "interval_min",
+        "interval_max",
+        "rssi_count",
+        "rssi_sum",
+        "rssi_min",
+        "rssi_max",
+        "rssi_last",
+    )
+
+    def __init__(self):
+        self.received = 0
+        self.missed = 0
+        self.last_count: int | None = None
+        self.last_time: float | None = None
+        self.intervals = [0] * len(self.INTERVAL_BUCKETS)
+        self.interval_sum = 0.0
+        self.interval_count = 0
+        self.interval_min: float | None = None
+        self.interval_max: float | None = None
+        self.rssi_count = 0
+        self.rssi_sum = 0
+        self.rssi_min: int | None = None
+        self.rssi_max: int | None = None
+        self.rssi_last: int | None = None
+
+    def update(self, count: int, rssi: int | None, now: float = None) -> int:
+        """
+        Account a new (not duplicated) frame.
+
+        Args:
+            count (int): The PVVX frame counter.
+            rssi (int | None): The RSSI of the frame.
+            now (float): The monotonic arrival time.
+
+        Returns:
+            int: The number of frames lost before this one.
+        """
+        now = get_clock().monotonic() if now is None else now
+        lost = 0
+        if self.last_count is not None:
+            delta = counter_delta(self.last_count, count)
+            if delta >= 256 - self.LATE_WINDOW:
+                # Late frame from another adapter, already accounted as lost
+                self.missed = max(0, self.missed - 1)
+                self.received += 1
+                return 0
+            # A large jump is a restart of the device, not lost frames
+            lost = delta - 1 if 0 < delta < 128 else 0
+            self.missed += lost
+            interval = now - self.last_time
+            self.intervals[bisect.bisect_left(self.INTERVAL_BUCKETS, interval)] += 1
+            self.interval_sum += interval
+            self.interval_count += 1
+            if self.interval_min is None or interval < self.interval_min:
+                self.interval_min = interval
+            if self.interval_max is None or interval > self.interval_max:
+                self.interval_max = interval
+        self.received += 1
+        self.last_count = count
+        self.last_time = now
+
+        if rssi is not None:
+            self.rssi_last = rssi
+            self.rssi_count += 1
+            self.rssi_sum += rssi
+            if self.rssi_min is None or rssi < self.rssi_min:
+                self.rssi_min = rssi
+            if self.rssi_max is None or rssi > self.rssi_max:
+                self.rssi_max = rssi
+        return lost
+
+    @property
+    def reception_ratio(self) -> float:
+        """Share of frames received of all frames sent since the first one."""
+        total = self.received + self.missed
+        return self.received / total if total else 1.0
+
+    @property
+    def rssi_mean(self) -> float | None:
+        return self.rssi_sum / self.rssi_count if self.rssi_count else None
+
+    def interval_percentile(self, q: float) -> float | None:
+        """
+        Return the upper bucket edge of the inter-arrival percentile.
+
+        Args:
+            q (float): The percentile in range 0..100.
+
+        Returns:
+            float | None: The bucket edge in seconds, None without intervals.
+        """
+        if not self.interval_count:
+            return None
+        rank = math.ceil(self.interval_count * q / 100)
+        seen = 0
+        for edge, n in zip(self.INTERVAL_BUCKETS, self.intervals):
+            seen += n
+            if seen >= rank:
+                return edge if edge != math.inf else self.interval_max
+        return self.interval_max
+
+    def summary(self) -> dict:
+        """
+        Return the link quality as dictionary.
+
+        Returns:
+            dict: Frame counts, reception ratio, inter-arrival and RSSI stats.
+        """
+        interval_mean = (
+            self.interval_sum / self.interval_count if self.interval_count else None
+        )
+        rssi_mean = self.rssi_mean
+        return {
+            "received": self.received,
+            "missed": self.missed,
+            "reception_ratio": round(self.reception_ratio, 4),
+            "interval_mean": round(interval_mean, 3) if interval_mean else None,
+            "interval_min": self.interval_min,
+            "interval_max": self.interval_max,
+            "interval_p50": self.interval_percentile(50),
+            "interval_p95": self.interval_percentile(95),
+            "interval_buckets": dict(
+                zip([str(b) for b in self.INTERVAL_BUCKETS], self.intervals)
+            ),
+            "rssi_last": self.rssi_last,
+            "rssi_mean": round(rssi_mean, 1) if rssi_mean is not None else None,
+            "rssi_min": self.rssi_min,
+            "rssi_max": self.rssi_max,
+        }
+
+
+class LinkQualityTracker:
+    """Link quality of all devices by address."""
+
+    def __init__(self):
+        self.devices: dict[str, LinkQuality] = {}
+
+    def update(
+        self, address: str, count: int, rssi: int | None, now: float = None
+    ) -> int:
+        """
+        Account a new frame of the device.
+
+        Args:
+            address (str): The address of the device.
+            count (int): The PVVX frame counter.
+            rssi (int | None): The RSSI of the frame.
+            now (float): The monotonic arrival time.
+
+        Returns:
+            int: The number of frames lost before this one.
+        """
+        link = self.devices.get(address)
+        if link is None:
+            link = self.devices[address] = LinkQuality()
+        return link.update(count, rssi, now)
+
+    def get(self, address: str) -> LinkQuality | None:
+        return self.devices.get(address)
+
+    def get_stats(self) -> dict:
+        """
+        Return the link quality summary of every device.
+
+        Returns:
+            dict: Summary by device address.
+        """
+        return {address: link.summary() for address, link in self.devices.items()}
@@ -4,32 +4,81 @@ from logging.handlers import QueueHandler, QueueListener
 from queue import Queue
 
 from env_settings import settings
-from outputs import ConsolePrintAsync
+from event_loop import LoopLagMonitor, install_loop_policy
+from metrics import format_snapshot, metrics
 from parse_args import parse_args
+from plugins import notification_plugins, output_plugins, sink_plugins
 
-from notifications import (
-    DiscordNotification,
-    LoggerNotification,
-    ManagerNotifications,
-    SystemNotification,
-)
-
-from outputs import ConsolePrint
+from notifications import ManagerNotifications
 
 from blescanner import BLEScanner
+from supervisor import Backoff, ScanSupervisor
+
+# The modules of the optional features (backends, wire, API, shared memory,
+# profiler...) are imported where main() enables them, a start only pays
+# for the selected features
 
 print_lock = asyncio.Lock()
-try:
-    registered_notifications = ManagerNotifications(
-        [
-            LoggerNotification(print_lock),
-            DiscordNotification(),
-            SystemNotification(),
-        ]
+# Arguments of plugins, only used when the plugin is selected
+plugin_kwargs = {
+    "logger": {"lock": print_lock},
+    "console": {"lock": print_lock},
+}
+
+
+def create_destination(destination: str):
+    """Create the notification of a route, a plugin name or a Discord webhook URL."""
+    if "://" in destination:
+        return notification_plugins.create("discord", web_hook=destination)
+    return notification_plugins.create(
+        destination, **plugin_kwargs.get(destination, {})
+    )
+
+
+def create_notifications(
+    names: list[str] | None, digest_window: float = 0, routes: str = None
+) -> ManagerNotifications:
+    """Create the selected notifications, importing only their modules."""
+    tasks = []
+    for name in names or []:
+        if name == "none":
+            continue
+        try:
+            tasks.append(
+                notification_plugins.create(name, **plugin_kwargs.get(name, {}))
+            )
+        except Exception as e:
+            print(f"Error registering notification {name}: {e} {type(e)}")
+    router = None
+    if routes:
+        from routing import NotificationRouter, load_routes
+
+        try:
+            router = NotificationRouter(load_routes(routes), create_destination, tasks)
+        except ValueError as e:
+            raise SystemExit(f"Error loading notification routes: {e}")
+    return ManagerNotifications(
+        tasks,
+        digest_window,
+        critical_delta=settings.ALERT_CRITICAL_DELTA,
+        router=router,
     )
-except NameError as e:
-    print(f"Error registering notifications: {e} {type(e)}")
-    registered_notifications = ManagerNotifications()
+
+
+async def start_sinks(names: list[str] | None, scanner: BLEScanner) -> list:
+    """Create and start the selected sinks, subscribed to the reading bus."""
+    sinks = []
+    for name in names or []:
+        try:
+            sink = sink_plugins.create(name, **plugin_kwargs.get(name, {}))
+            await sink.start()
+        except Exception as e:
+            logger.error(f"Error starting sink {name}: {e!r}")
+            continue
+        scanner.bus.subscribe(f"sink.{name}", sink.write, maxsize=10000)
+        sinks.append(sink)
+    return sinks
+
 
 logger = logging.getLogger("BLEScanner.{__name__}")
 logger.setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
@@ -79,6 +128,26 @@ async def init_logger(debug: bool = False):
 LOGGER_TASK = None
 
 
+async def log_stats(interval: float):
+    """Log the metrics snapshot every interval seconds."""
+    logger = logging.getLogger("BLEScanner")
+    previous = None
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = metrics.snapshot()
+        logger.info("*** STATS ***")
+        for line in format_snapshot(snapshot, previous):
+            logger.info(line)
+        previous = snapshot
+
+
+async def stop_profiler(profiler, duration: float, prefix: str):
+    """Stop the sampling profiler after duration seconds and write the profile."""
+    await asyncio.sleep(duration)
+    profiler.stop()
+    profiler.write(prefix)
+
+
 # coroutine to safely start the logger
 async def safely_start_logger(debug: bool = False):
     # initialize the logger
@@ -97,13 +166,76 @@ async def main(
     mode: str = None,
     notification: ManagerNotifications = None,
     debug: bool = False,
-):
+    adapters: list[str] = None,
+    replay: str = None,
+    replay_speed: float = 1.0,
+    capture: str = None,
+    watchdog: float = None,
+    duty_cycle: bool = False,
+    stats: float = 0,
+    profile: float = None,
+    profile_output: str = "profile",
+    memory_interval: float = 0,
+    loop_lag_threshold: float = 0,
+    output_name: str = "console",
+    shared_memory: str = None,
+    api_socket: str = None,
+    api_http: str = None,
+    history_size: int = 10000,
+    dashboard: bool = False,
+    sinks: list[str] = None,
+    forward: str = None,
+    aggregate: str = None,
+    gateway_name: str = None,
+    soak: float = None,
+    soak_devices: int = 20,
+    checkpoint: str = None,
+    groups: dict = None,
+) -> bool:
     await safely_start_logger(debug)
     logger = logging.getLogger("BLEScanner")
     # log a message
     logger.debug(f"Main is starting")
-    output = ConsolePrintAsync(print_lock)
+    output = output_plugins.create(output_name, **plugin_kwargs.get(output_name, {}))
     logger.debug(f"Selected notification: {notification.get_names()}")
+    backend = None
+    if replay or soak:
+        from backends import ReplayBackend, SyntheticBackend
+
+        if soak:
+            # The capture is replayed over and over for the whole soak test
+            backend = (
+                ReplayBackend(replay, speed=replay_speed, loop=True)
+                if replay
+                else SyntheticBackend(soak_devices)
+            )
+        else:
+            backend = ReplayBackend(replay, speed=replay_speed)
+    replay_backend = backend if replay else None
+    if aggregate or forward:
+        from wire import WireBackend, WireForwarder
+    if aggregate:
+        backend = WireBackend(aggregate)
+        # One listener receives the advertisements of all collectors
+        adapters = None
+    capture_writer = None
+    if capture:
+        from capture import open_capture
+
+        capture_writer = open_capture(capture)
+    forwarder = WireForwarder(forward, gateway_name) if forward else None
+    scheduler = None
+    if duty_cycle:
+        from scheduler import DutyCycleScheduler
+
+        scheduler = DutyCycleScheduler()
+    virtual_devices = None
+    if groups:
+        from virtual_devices import VirtualDevices
+
+        virtual_devices = VirtualDevices.from_settings(
+            groups, settings.VIRTUAL_MEMBER_ALERTS
+        )
     scanner = BLEScanner(
         output=output,
         notification=notification,
@@ -113,7 +245,84 @@ async def main(
         use_text_pos=use_text_pos,
         sent_theshold_temp=sent_threshold_temp,
         mode=mode,
+        adapters=adapters,
+        backend=backend,
+        capture=capture_writer,
+        forwarder=forwarder,
+        watchdog=watchdog,
+        scheduler=scheduler,
+        virtual_devices=virtual_devices,
     )
+    supervisor = ScanSupervisor(
+        scanner, backoff=Backoff(maximum=settings.BLE_RESTART_BACKOFF_MAX)
+    )
+    metrics.register_collector("supervisor", supervisor.get_stats)
+    if scanner.scheduler:
+        metrics.register_collector("scheduler", scanner.scheduler.get_stats)
+    shared_table = None
+    if shared_memory:
+        from shared_table import SharedReadingTable
+
+        try:
+            shared_table = SharedReadingTable(shared_memory)
+        except FileExistsError as e:
+            raise SystemExit(f"Error creating the shared memory table: {e}")
+        scanner.bus.subscribe("shared_memory", shared_table.write)
+    if forwarder:
+        await forwarder.start()
+    started_sinks = await start_sinks(sinks, scanner)
+    tasks = []
+    api = None
+    if dashboard and not (api_socket or api_http):
+        api_http = "8080"
+    if api_socket or api_http:
+        from api import QueryAPI
+        from store import ReadingStore
+
+        store = ReadingStore(history_size)
+        scanner.bus.subscribe("store", store.add)
+        dashboard_stream = None
+        if dashboard:
+            from dashboard import DashboardStream
+
+            dashboard_stream = DashboardStream(scanner)
+            scanner.bus.subscribe("dashboard", dashboard_stream.add)
+        api = QueryAPI(store, scanner, dashboard_stream)
+        await api.start(api_socket, api_http)
+        if dashboard_stream:
+            tasks.append(asyncio.create_task(dashboard_stream.watch_alerts()))
+    stats_task = asyncio.create_task(log_stats(stats)) if stats else None
+    tasks.extend([stats_task] if stats_task else [])
+    profiler = None
+    if profile is not None:
+        from profiler import SamplingProfiler
+
+        profiler = SamplingProfiler(loop=asyncio.get_running_loop())
+        profiler.start()
+        if profile:
+            tasks.append(
+                asyncio.create_task(stop_profiler(profiler, profile, profile_output))
+            )
+    if loop_lag_threshold:
+        tasks.append(asyncio.create_task(LoopLagMonitor(loop_lag_threshold).run()))
+    if memory_interval:
+        from profiler import MemoryTracker
+
+        tasks.append(asyncio.create_task(MemoryTracker(memory_interval).run()))
+    checkpointer = None
+    if checkpoint:
+        from checkpoint import Checkpointer
+
+        checkpointer = Checkpointer(scanner, checkpoint)
+        await checkpointer.restore()
+        scanner.bus.subscribe("checkpoint", checkpointer.add)
+        tasks.append(asyncio.create_task(checkpointer.run()))
+    soak_monitor = None
+    if soak:
+        from soak import SoakMonitor
+
+        soak_monitor = SoakMonitor(scanner, soak)
+        tasks.append(asyncio.create_task(soak_monitor.run()))
     params = []
     if custom_names:
         params.append(f"custom_names={custom_names}")
@@ -124,22 +333,65 @@ async def main(
     if sent_threshold_temp:
         params.append(f"sent_threshold_temp={sent_threshold_temp}")
 
+    if adapters:
+        params.append(f"adapters={adapters}")
+    if replay:
+        params.append(f"replay={replay}")
+    if forward:
+        params.append(f"forward={forward}")
+    if aggregate:
+        params.append(f"aggregate={aggregate}")
+    if watchdog:
+        params.append(f"watchdog={watchdog}")
+    if duty_cycle:
+        params.append(f"duty_cycle={duty_cycle}")
     params.append(f"use_text_pos={use_text_pos}")
 
     message = ", ".join(params)
     logger.debug(f"BLE Scanner started with: {message}")
+    if replay_backend is not None and backend is replay_backend:
+        # Stop the application when the capture was replayed
+        replay_task = asyncio.create_task(backend.finished.wait())
+        replay_task.add_done_callback(lambda _: scanner.stop_event.set())
     try:
-        await scanner.start_scanning()
+        await supervisor.run()
     except asyncio.CancelledError:
         logger.info("Scanning cancelled.")
         scanner.stop_event.set()
         await asyncio.sleep(0)
+    finally:
+        for task in tasks:
+            task.cancel()
+        if profiler and profiler.running:
+            profiler.stop()
+            profiler.write(profile_output)
+        logger.info(f"Scanner restarts: {supervisor.get_stats()}")
+        logger.debug(f"Link quality: {scanner.get_link_stats()}")
+        if scanner.scheduler:
+            logger.info(f"Duty cycle: {scanner.scheduler.get_stats()}")
+        await scanner.bus.close()
+        await notification.close()
+        if checkpointer:
+            await checkpointer.save()
+        for sink in started_sinks:
+            await sink.close()
         await output.close()
+        if capture_writer:
+            capture_writer.close()
+        if forwarder:
+            await forwarder.close()
+        if shared_table:
+            shared_table.close()
+        if api:
+            await api.close()
+    return soak_monitor.report() if soak_monitor else True
 
 
 if __name__ in ["main", "__main__"]:
 
-    args = parse_args(registered_notifications.get_names())
+    args = parse_args(
+        notification_plugins.names(), output_plugins.names(), sink_plugins.names()
+    )
 
     if args.debug:
         logger.setLevel(logging.DEBUG if args.debug else logging.INFO)
@@ -158,10 +410,38 @@ if __name__ in ["main", "__main__"]:
     # if custom_names:
     logger.debug(f"Custom Names: {custom_names}")
 
-    # Clear not used notifications from manager
-    registered_notifications.filter(args.notification)
+    groups = None
+    if args.groups:
+        groups = {}
+        for entry in args.groups:
+            try:
+                key, value = entry.split("=", 1)
+                groups[key.strip()] = value.strip()
+            except ValueError:
+                logging.error(f"Invalid entry format: {entry}. Expected NAME=MEMBERS.")
+
+    # Only the selected notifications are imported and created, nothing is
+    # sent during a soak test
+    registered_notifications = create_notifications(
+        ["stub"] if args.soak else args.notification,
+        args.digest,
+        None if args.soak else args.routes,
+    )
+    loop_name = install_loop_policy(args.loop)
+    logger.debug(f"Event loop: {loop_name}")
+    run = asyncio.run
+    if args.soak or args.virtual_time:
+        from clock import VirtualClock
+    if args.soak:
+        run = VirtualClock().run
+    elif args.virtual_time:
+        from capture import read_capture
+
+        first = next(read_capture(args.replay), {})
+        run = VirtualClock(start=first.get("ts")).run
+        logger.debug("Running in virtual time")
     try:
-        asyncio.run(
+        passed = run(
             main(
                 custom_names=custom_names or settings.ATC_CUSTOM_NAMES,
                 alert_low_threshold=args.alert_low_threshold,
@@ -171,7 +451,34 @@ if __name__ in ["main", "__main__"]:
                 mode=args.mode,
                 notification=registered_notifications,
                 debug=args.debug or settings.DEBUG,
+                adapters=args.adapters,
+                replay=args.replay,
+                replay_speed=args.replay_speed,
+                capture=args.capture,
+                watchdog=args.watchdog,
+                duty_cycle=args.duty_cycle,
+                stats=args.stats,
+                profile=args.profile,
+                profile_output=args.profile_output,
+                memory_interval=args.tracemalloc,
+                loop_lag_threshold=args.loop_monitor,
+                output_name=args.output,
+                shared_memory=args.shared_memory,
+                api_socket=args.api_socket,
+                api_http=args.api_http,
+                history_size=args.history_size,
+                dashboard=args.dashboard,
+                sinks=args.sink,
+                forward=args.forward,
+                aggregate=args.aggregate,
+                gateway_name=args.gateway_name,
+                soak=args.soak,
+                soak_devices=args.soak_devices,
+                checkpoint=args.checkpoint,
+                groups=groups or settings.VIRTUAL_DEVICES,
             )
         )
+        if not passed:
+            raise SystemExit(1)
     except KeyboardInterrupt:
         logger.info(f"KeyboardInterrupt. Exit.")
@@ -0,0 +1,260 @@
+import logging
+import time
+from typing import Callable
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+class Counter:
+    """Monotonic counter."""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: int = 1) -> None:
+        self.value += n
+
+
+class Gauge:
+    """
+    Current value, either set explicitly or read from a function on snapshot.
+    """
+
+    __slots__ = ("value", "function")
+
+    def __init__(self, function: Callable[[], float] = None):
+        self.value = 0
+        self.function = function
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def get(self) -> float:
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception as e:
+                logger.debug(f"Gauge function failed: {e}")
+                return 0
+        return self.value
+
+
+class Histogram:
+    """
+    HDR-style histogram of non-negative integer values.
+
+    Values below ``2 ** precision_bits`` have their own bucket, larger values
+    share log-linear buckets with a relative error below
+    ``2 ** -(precision_bits - 1)``. All buckets are allocated up front, so
+    recording is a few integer operations and one list update, without locks
+    or allocations. Values above ``2 ** max_bits`` are clamped.
+    """
+
+    __slots__ = ("precision_bits", "half", "counts", "count", "total", "min", "max")
+
+    def __init__(self, precision_bits: int = 7, max_bits: int = 40):
+        """
+        Initialize the histogram.
+
+        Args:
+            precision_bits (int): Bits of the linear sub-buckets (7 is below 1.6% error).
+            max_bits (int): Bits of the largest value tracked.
+        """
+        self.precision_bits = precision_bits
+        self.half = 1 << (precision_bits - 1)
+        size = (1 << precision_bits) + (max_bits - precision_bits) * self.half
+        self.counts = [0] * size
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.precision_bits
+        if shift <= 0:
+            return value
+        return (
+            (1 << self.precision_bits)
+            + (shift - 1) * self.half
+            + (value >> shift)
+            - self.half
+        )
+
+    def _value(self, index: int) -> int:
+        """Return the highest value of the bucket."""
+        linear = 1 << self.precision_bits
+        if index < linear:
+            return index
+        shift, sub = divmod(index - linear, self.half)
+        shift += 1
+        return ((sub + self.half + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        """
+        Record a value.
+
+        Args:
+            value (int): The value, negative values count as 0.
+        """
+        if value < 0:
+            value = 0
+        index = self._index(value)
+        if index >= len(self.counts):
+            index = len(self.counts) - 1
+        self.counts[index] += 1
+        if not self.count or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+
+    def percentile(self, q: float, since: list[int] = None) -> int:
+        """
+        Return the value at the percentile.
+
+        Args:
+            q (float): The percentile in range 0..100.
+            since (list[int]): A copy of ``counts`` taken earlier, only the
+                values recorded after it are included.
+
+        Returns:
+            int: The highest value of the bucket of the percentile, 0 when empty.
+        """
+        counts = self.counts
+        if since is not None:
+            counts = [n - before for n, before in zip(counts, since)]
+        count = sum(counts) if since is not None else self.count
+        if not count:
+            return 0
+        rank = max(1, round(count * q / 100))
+        seen = 0
+        for index, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        """
+        Return count, mean, min, max and the common percentiles.
+
+        Returns:
+            dict: The summary.
+        """
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 1) if self.count else 0,
+            "min": self.min,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process registry of counters, gauges and histograms.
+
+    Metrics are created once by name and recorded on the hot path without any
+    lookups when the returned object is kept. Other components read all values
+    with ``snapshot()``, collectors add structured stats of other objects.
+    """
+
+    def __init__(self):
+        self.counters: dict[str, Counter] = {}
+        self.gauges: dict[str, Gauge] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.collectors: dict[str, Callable[[], dict]] = {}
+
+    def counter(self, name: str) -> Counter:
+        """Return the counter of the name, created on first use."""
+        metric = self.counters.get(name)
+        if metric is None:
+            metric = self.counters[name] = Counter()
+        return metric
+
+    def gauge(self, name: str, function: Callable[[], float] = None) -> Gauge:
+        """Return the gauge of the name, created on first use."""
+        metric = self.gauges.get(name)
+        if metric is None:
+            metric = self.gauges[name] = Gauge(function)
+        elif function is not None:
+            metric.function = function
+        return metric
+
+    def histogram(self, name: str) -> Histogram:
+        """Return the histogram of the name, created on first use."""
+        metric = self.histograms.get(name)
+        if metric is None:
+            metric = self.histograms[name] = Histogram()
+        return metric
+
+    def register_collector(self, name: str, collector: Callable[[], dict]) -> None:
+        """
+        Register a function returning stats included in every snapshot.
+
+        Args:
+            name (str): The key of the stats in the snapshot.
+            collector (Callable[[], dict]): The function returning the stats.
+        """
+        self.collectors[name] = collector
+
+    def unregister_collector(self, name: str) -> None:
+        self.collectors.pop(name, None)
+
+    def snapshot(self) -> dict:
+        """
+        Return the current values of all metrics.
+
+        Returns:
+            dict: Counters, gauges, histogram summaries and collector stats.
+        """
+        collected = {}
+        for name, collector in self.collectors.items():
+            try:
+                collected[name] = collector()
+            except Exception as e:
+                logger.debug(f"Metrics collector {name} failed: {e}")
+        return {
+            "time": time.time(),
+            "counters": {n: m.value for n, m in self.counters.items()},
+            "gauges": {n: m.get() for n, m in self.gauges.items()},
+            "histograms": {n: m.summary() for n, m in self.histograms.items()},
+            "collectors": collected,
+        }
+
+
+def format_snapshot(snapshot: dict, previous: dict = None) -> list[str]:
+    """
+    Format a snapshot as log lines, with counter rates since the previous one.
+
+    Args:
+        snapshot (dict): The snapshot to format.
+        previous (dict): The previous snapshot used for the rates.
+
+    Returns:
+        list[str]: One line per metric.
+    """
+    lines = []
+    elapsed = snapshot["time"] - previous["time"] if previous else 0
+    for name, value in sorted(snapshot["counters"].items()):
+        line = f"{name}: {value}"
+        if elapsed > 0:
+            rate = (value - previous["counters"].get(name, 0)) / elapsed
+            line += f" ({rate:.2f}/s)"
+        lines.append(line)
+    for name, value in sorted(snapshot["gauges"].items()):
+        lines.append(f"{name}: {value}")
+    for name, summary in sorted(snapshot["histograms"].items()):
+        values = " ".join(f"{k}={v}" for k, v in summary.items())
+        lines.append(f"{name}: {values}")
+    for name, stats in sorted(snapshot["collectors"].items()):
+        lines.append(f"{name}: {stats}")
+    return lines
+
+
+metrics = MetricsRegistry()
@@ -1,32 +1,18 @@
 import asyncio
 import logging
 import platform
+import time
 from abc import ABC, abstractmethod
 from typing import Protocol, TypeVar, Awaitable, Callable
 
 from env_settings import settings
+from metrics import metrics
 from utils import run_in_async_thread
-from discord_api import send_message as discord_send_message
 
-try:
-    from windows_toasts import (
-        Toast,
-        WindowsToaster,
-        ToastDisplayImage,
-        ToastDuration,
-    )
-except ImportError:
-    Toast, WindowsToaster, ToastDisplayImage, ToastDuration = None, None, None, None
-
-try:
-    from pync import Notifier
-except ImportError as e:
-    Notifier = None
-
-try:
-    from plyer import notification
-except ImportError as e:
-    notification = None
+# Platform modules are imported by import_platform_modules() on first use
+Toast, WindowsToaster, ToastDisplayImage, ToastDuration = None, None, None, None
+Notifier = None
+notification = None
 
 
 logger = logging.getLogger(f"BLEScanner.{__name__}")
@@ -34,6 +20,42 @@ logger = logging.getLogger(f"BLEScanner.{__name__}")
 
 # ---------------------------------------------
 
+
+def import_platform_modules(system: str) -> None:
+    """
+    Import the notification module of the platform.
+
+    The imports are deferred until a system notification is used, so other
+    notifications do not pay for them at startup.
+
+    Args:
+        system (str): The name of the platform as returned by platform.system().
+    """
+    global Toast, WindowsToaster, ToastDisplayImage, ToastDuration, Notifier
+    global notification
+    match system:
+        case "Windows":
+            try:
+                from windows_toasts import (
+                    Toast,
+                    WindowsToaster,
+                    ToastDisplayImage,
+                    ToastDuration,
+                )
+            except ImportError:
+                pass
+        case "Darwin":
+            try:
+                from pync import Notifier
+            except ImportError:
+                pass
+        case "Linux":
+            try:
+                from plyer import notification
+            except ImportError:
+                pass
+
+
 T = TypeVar("T", bound="TaskProtocol")
 
 
@@ -155,6 +177,68 @@ class ManagerAbstract:
 
 
 class ManagerNotifications(ManagerAbstract):
+    """
+    Send the alerts to all registered notification tasks.
+
+    In digest mode (``digest_window`` seconds) the first alert is sent at once
+    and opens a window. The alerts received during the window are collected
+    per device and sent as one summary per task when the window closes, with
+    the min/max temperature of every device. Critical alerts, further than
+    ``critical_delta`` from the threshold, are always sent at once.
+
+    With a router (routing.NotificationRouter) the alerts go to the tasks of
+    the routes of the device and severity instead, digests are sent per set
+    of destinations.
+    """
+
+    def __init__(
+        self,
+        tasks: list[T],
+        digest_window: float = 0,
+        critical_delta: float | None = None,
+        router=None,
+    ):
+        """Initialize ManagerNotifications.
+
+        Args:
+            tasks (list[T]): A list of notification tasks.
+            digest_window (float): Seconds of the digest window, 0 disables
+                the digest mode.
+            critical_delta (float | None): Temperature beyond the threshold
+                of critical alerts, None when no alert is critical.
+            router (NotificationRouter): Routes the alerts by device and
+                severity, None sends all alerts to all tasks.
+
+        """
+        super().__init__(tasks)
+        self.router = router
+        self.digest_window = digest_window
+        self.critical_delta = critical_delta
+        # Collected alerts of the open window by device
+        self.digest: dict[str, dict] = {}
+        self._window: asyncio.Task | None = None
+        self.metric_collected = metrics.counter("notification.digest.collected")
+        self.metric_summaries = metrics.counter("notification.digest.summaries")
+
+    def severity(self, params: dict) -> str:
+        """
+        Return the severity of the alert.
+
+        Args:
+            params (dict): The alert: 'device', 'temp', 'type' and 'threshold',
+                an explicit 'severity' is kept.
+
+        Returns:
+            str: 'critical' or 'warning'.
+        """
+        if "severity" in params:
+            return params["severity"]
+        if (
+            self.critical_delta is not None
+            and abs(params["temp"] - params["threshold"]) >= self.critical_delta
+        ):
+            return "critical"
+        return "warning"
 
     async def send_alert(
         self,
@@ -165,6 +249,9 @@ class ManagerNotifications(ManagerAbstract):
         """
         Sends an alert message to all registered notification tasks.
 
+        Alerts with params are collected for the digest while its window is
+        open, unless critical.
+
         Args:
             title (str | None): The title of the notification, if provided.
             message (str | None): The message content of the notification, if provided.
@@ -172,10 +259,124 @@ class ManagerNotifications(ManagerAbstract):
         Returns:
             None
         """
-        if not self.tasks:
+        if not self.tasks and not self.router:
             return
-        for n in self.tasks:
-            await n.send_alert(title, message)
+        if self.digest_window and params and self.severity(params) != "critical":
+            if self._window:
+                self.collect(params)
+                return
+            self._window = asyncio.create_task(self.close_window())
+        await self.send_all(title, message, params)
+
+    async def send_all(
+        self,
+        title: str | None = None,
+        message: str | None = None,
+        params: dict | None = None,
+        tasks: tuple | None = None,
+    ) -> None:
+        """Send the message to the tasks, by default the tasks of the route."""
+        for n in self.route(params) if tasks is None else tasks:
+            started = time.perf_counter_ns()
+            try:
+                await n.send_alert(title, message, params)
+            finally:
+                metrics.histogram(f"notification.{n}.latency_us").record(
+                    (time.perf_counter_ns() - started) // 1000
+                )
+
+    def route(self, params: dict | None) -> tuple:
+        """Return the tasks of the alert."""
+        if self.router is None or not params:
+            return tuple(self.tasks)
+        return self.router.resolve(
+            params["device"], params.get("address"), self.severity(params)
+        )
+
+    def collect(self, params: dict) -> None:
+        """Add the alert to the digest of the open window."""
+        self.metric_collected.inc()
+        temp = params["temp"]
+        entry = self.digest.get(params["device"])
+        if entry is None:
+            self.digest[params["device"]] = {
+                "address": params.get("address"),
+                "type": params["type"],
+                "threshold": params["threshold"],
+                "min": temp,
+                "max": temp,
+                "count": 1,
+            }
+            return
+        entry["type"], entry["threshold"] = params["type"], params["threshold"]
+        entry["min"] = min(entry["min"], temp)
+        entry["max"] = max(entry["max"], temp)
+        entry["count"] += 1
+
+    @staticmethod
+    def format_digest(digest: dict[str, dict]) -> tuple[str, str]:
+        """
+        Format the collected alerts as one notification.
+
+        Args:
+            digest (dict[str, dict]): The collected alerts by device.
+
+        Returns:
+            tuple[str, str]: The title and the message.
+        """
+        count = sum(entry["count"] for entry in digest.values())
+        title = f"Alert digest: {len(digest)} devices, {count} alerts"
+        lines = [
+            f"{device}: {entry['min']:.2f}..{entry['max']:.2f} °C, "
+            f"{'lower' if entry['type'] == 'low' else 'higher'} than "
+            f"{entry['threshold']} °C ({entry['count']} alerts)"
+            for device, entry in sorted(digest.items())
+        ]
+        return title, "\n".join(lines)
+
+    async def close_window(self) -> None:
+        """Send the digest at the end of the window, the window stays open
+        while alerts keep coming."""
+        while True:
+            await asyncio.sleep(self.digest_window)
+            if not self.digest:
+                break
+            await self.flush()
+        self._window = None
+
+    async def flush(self) -> None:
+        """Send the collected alerts as summary."""
+        if not self.digest:
+            return
+        digest, self.digest = self.digest, {}
+        # One summary per set of destinations, the collected alerts are warnings
+        groups: dict[tuple, dict] = {}
+        for device, entry in digest.items():
+            tasks = self.route(
+                {"device": device, "address": entry["address"], "severity": "warning"}
+            )
+            groups.setdefault(tasks, {})[device] = entry
+        for tasks, group in groups.items():
+            if not tasks:
+                continue
+            self.metric_summaries.inc()
+            try:
+                await self.send_all(*self.format_digest(group), tasks=tasks)
+            except Exception as e:
+                logger.error(f"Digest notification failed: {e}")
+
+    async def close(self) -> None:
+        """Send the collected alerts and close the tasks holding connections."""
+        if self._window:
+            self._window.cancel()
+            self._window = None
+        await self.flush()
+        for task in self.tasks:
+            close = getattr(task, "close", None)
+            if close:
+                await close()
+        if self.router:
+            await self.router.close()
 
 
 # ==========================================================
@@ -304,6 +505,35 @@ class LoggerNotification(NotificationAbstract):
             logger.info("*** END LOGGER NOTIFICATION ***")
 
 
+class StubNotification(NotificationAbstract):
+    """
+    Local stand-in of a remote notification, used by the soak test.
+
+    Nothing is sent: the alerts are counted and a delay emulates the latency
+    of the remote service.
+    """
+
+    def __init__(self, delay: float = 0.05) -> None:
+        """
+        Initializes the StubNotification object.
+
+        Args:
+            delay (float): Seconds each alert takes.
+        """
+        super().__init__()
+        self.delay = delay
+        self.sent = 0
+
+    async def send_alert(
+        self,
+        title: str | None = None,
+        message: str | None = None,
+        params: dict | None = None,
+    ) -> None:
+        await asyncio.sleep(self.delay)
+        self.sent += 1
+
+
 class PrintNotification(NotificationAbstract):
     async def send_alert(
         self,
@@ -328,6 +558,20 @@ class PrintNotification(NotificationAbstract):
 
 
 class DiscordNotification(NotificationAbstract):
+    def __init__(self, web_hook: str | None = None):
+        """
+        Initializes the DiscordNotification object.
+
+        Args:
+            web_hook (str | None): The webhook URL, DISCORD_WEB_HOOKS by default.
+        """
+        super().__init__()
+        # httpx with HTTP/2 is imported only when Discord is selected
+        from discord_api import close_client, send_message
+
+        self.web_hook = web_hook
+        self._send_message = send_message
+        self._close_client = close_client
 
     async def send_alert(
         self,
@@ -350,7 +594,11 @@ class DiscordNotification(NotificationAbstract):
             msg_list.append(message)
 
         discord_message = "\n".join(msg_list)
-        await discord_send_message(discord_message)
+        await self._send_message(discord_message, web_hook=self.web_hook)
+
+    async def close(self) -> None:
+        """Close the connection pool of the webhook."""
+        await self._close_client(self.web_hook)
 
 
 class PlatformNotification(NotificationAbstract):
@@ -359,6 +607,7 @@ class PlatformNotification(NotificationAbstract):
         self._sender: (
             Callable[..., Awaitable[..., None] | None] | Awaitable[..., None] | None
         ) = None
+        import_platform_modules(platform.system())
         match platform.system():
             case "Windows":
                 if all([Toast, WindowsToaster, ToastDisplayImage, ToastDuration]):
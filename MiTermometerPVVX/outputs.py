@@ -1,12 +1,133 @@
 import asyncio
 from abc import ABC, abstractmethod
+import datetime
 import logging
+from typing import Callable
 
+from events import Reading
+from link_quality import LinkQuality
+from metrics import metrics
 from utils import AsyncWithDummy
 
 logger = logging.getLogger(f"BLEScanner.{__name__}")
 
 
+class ReadingFormatter:
+    """
+    Formats readings as display lines, reusing the text of unchanged fields.
+
+    The text of every field is cached per device with the value it was
+    formatted from, so a new reading only formats the fields that changed.
+    """
+
+    def __init__(self, width: int = 21):
+        """
+        Initialize the formatter.
+
+        Args:
+            width (int): The width of the lines, longer lines are cut.
+        """
+        self.width = width
+        self.separator = "-" * width
+        self._cache: dict[str, dict[str, tuple]] = {}
+
+    def _field(self, fields: dict, key: str, value, render: Callable) -> str:
+        cached = fields.get(key)
+        if cached is not None and cached[0] == value:
+            return cached[1]
+        text = render(value)[: self.width].ljust(self.width)
+        fields[key] = (value, text)
+        return text
+
+    def lines(self, reading: Reading, link: LinkQuality = None) -> list[str]:
+        """
+        Return the display lines of the reading.
+
+        Args:
+            reading (Reading): The reading.
+            link (LinkQuality, optional): The link quality of the device.
+
+        Returns:
+            list[str]: The lines, padded to the width.
+        """
+        fields = self._cache.setdefault(reading.address, {})
+        field = self._field
+        lines = [
+            field(fields, "name", reading.name, lambda v: f"Device: {v}"),
+            self.separator,
+            field(fields, "temp", reading.temp, lambda v: f"Temp: {v:<.2f}°C"),
+            field(
+                fields, "humidity", reading.humidity, lambda v: f"Humidity: {v:<.2f}%"
+            ),
+        ]
+        if reading.temp_range is not None:
+            # Virtual device: the range of the members instead of the radio
+            lines.append(
+                field(
+                    fields,
+                    "range",
+                    reading.temp_range,
+                    lambda v: f"Range: {v[0]:.2f}..{v[1]:.2f}°C",
+                )
+            )
+            lines.append(
+                field(
+                    fields,
+                    "spread",
+                    round(reading.temp_range[1] - reading.temp_range[0], 2),
+                    lambda v: f"Spread: {v:.2f}°C",
+                )
+            )
+        else:
+            lines.append(
+                field(
+                    fields,
+                    "battery",
+                    (reading.battery, reading.battery_v),
+                    lambda v: f"Battery: {v[0]}% ({v[1]:.2f}V)",
+                )
+            )
+            lines.append(
+                field(fields, "rssi", reading.rssi, lambda v: f"RSSI: {v} dBm")
+            )
+        if link:
+            lines.append(
+                field(
+                    fields,
+                    "link",
+                    (round(link.reception_ratio, 2), link.missed),
+                    lambda v: f"Link: {v[0]:.0%} lost {v[1]}",
+                )
+            )
+        lines.append(
+            field(
+                fields,
+                "count",
+                (reading.count, reading.temp_range is not None),
+                lambda v: f"{'Members' if v[1] else 'Count'}: {v[0]:<3}",
+            )
+        )
+        timestamp = reading.timestamp
+        lines.append(
+            field(
+                fields,
+                "seen",
+                (timestamp.hour, timestamp.minute, timestamp.second),
+                lambda v: f"Last Seen: {v[0]:02}:{v[1]:02}:{v[2]:02}",
+            )
+        )
+        if reading.interval:
+            lines.append(
+                field(
+                    fields,
+                    "duration",
+                    int(reading.interval.total_seconds()),
+                    lambda v: f"Duration: {str(datetime.timedelta(seconds=v)):<9}",
+                )
+            )
+        return lines
+
+
 class PrintAbstract(ABC):
     """
     Abstract base class for PrintAbstract objects.
@@ -33,6 +154,49 @@ class PrintAbstract(ABC):
         """
         ...
 
+    def formatter(self, width: int) -> ReadingFormatter:
+        """
+        Return the formatter of readings for the width, created on first use.
+
+        Args:
+            width (int): The width of the lines.
+
+        Returns:
+            ReadingFormatter: The formatter.
+        """
+        formatter = getattr(self, "_formatter", None)
+        if formatter is None or formatter.width != width:
+            formatter = self._formatter = ReadingFormatter(width)
+        return formatter
+
+    async def print_reading(
+        self,
+        reading: Reading,
+        link: LinkQuality = None,
+        pos: dict = None,
+        width: int = 21,
+    ) -> int:
+        """
+        Print a reading. The output decides whether and how it is formatted.
+
+        The default implementation prints the lines of the formatter one by
+        one with ``print_value``.
+
+        Args:
+            reading (Reading): The reading.
+            link (LinkQuality, optional): The link quality of the device.
+            pos (dict, optional): The position of the first line. Defaults to None.
+            width (int): The width of the lines.
+
+        Returns:
+            int: The number of printed lines.
+        """
+        lines = self.formatter(width).lines(reading, link)
+        for y, line in enumerate(lines):
+            line_pos = None if pos is None else {"x": pos["x"], "y": pos["y"] + y}
+            await self.print_value(line, line_pos)
+        return len(lines)
+
     @abstractmethod
     async def clear(self) -> None:
         """
@@ -103,6 +267,37 @@ class ConsolePrint(PrintAbstract):
         """
         self.print_method(self.format_text(text, pos))
 
+    async def print_reading(
+        self,
+        reading: Reading,
+        link: LinkQuality = None,
+        pos: dict = None,
+        width: int = 21,
+    ) -> int:
+        """
+        Print all lines of the reading with a single print call.
+
+        Args:
+            reading (Reading): The reading.
+            link (LinkQuality, optional): The link quality of the device.
+            pos (dict, optional): The position of the first line. Defaults to None.
+            width (int): The width of the lines.
+
+        Returns:
+            int: The number of printed lines.
+        """
+        lines = self.formatter(width).lines(reading, link)
+        if pos is None:
+            text = "\n".join(lines)
+        else:
+            x, y = pos["x"], pos["y"]
+            text = "".join(
+                self.POSITION.format(y=y + i, x=x, text=line)
+                for i, line in enumerate(lines)
+            )
+        await self.print_value(text)
+        return len(lines)
+
     async def clear(self):
         """
         Clear the terminal screen by printing the clear screen escape sequence.
@@ -147,6 +342,8 @@ class ConsolePrintAsync(ConsolePrint):
         """
         super().__init__()
         self.print_queue = asyncio.Queue()
+        metrics.gauge("output.queue_depth", self.print_queue.qsize)
+        self._queue_depth = metrics.histogram("output.queue_depth_on_put")
         self.worker_task = asyncio.create_task(self.print_worker())
         self.print_method = self.async_print
         self._lock = lock
@@ -165,13 +362,25 @@ class ConsolePrintAsync(ConsolePrint):
 
         The task is responsible for calling task_done() on the queue after
         printing each message, to allow the queue to be properly drained.
+        Messages queued meanwhile are joined and printed with a single write.
         """
         while True:
             message = await self.print_queue.get()
             if message is None:  # Exit signal
                 break
-            print(message)  # Perform the actual print operation
-            self.print_queue.task_done()
+            messages = [message]
+            exit_signal = False
+            while not self.print_queue.empty():
+                message = self.print_queue.get_nowait()
+                if message is None:
+                    exit_signal = True
+                    break
+                messages.append(message)
+            print("\n".join(messages))  # Perform the actual print operation
+            for _ in messages:
+                self.print_queue.task_done()
+            if exit_signal:
+                break
 
     async def async_print(self, text: str):
         """
@@ -183,6 +392,7 @@ class ConsolePrintAsync(ConsolePrint):
         Args:
             text (str): The string to print
         """
+        self._queue_depth.record(self.print_queue.qsize())
         await self.print_queue.put(text)
 
     async def print_value(self, text: str, pos: dict = None) -> None:
@@ -244,3 +454,26 @@ class ConsolePrintAsync(ConsolePrint):
         """
         await self.print_queue.put(None)  # Send exit signal to worker
         await self.worker_task
+
+
+class NullOutput(PrintAbstract):
+    """
+    Output discarding everything, for headless gateways that only export data.
+
+    Readings are never formatted.
+    """
+
+    async def print_value(self, text: str, pos: dict = None) -> None:
+        pass
+
+    async def print_reading(
+        self,
+        reading: Reading,
+        link: LinkQuality = None,
+        pos: dict = None,
+        width: int = 21,
+    ) -> int:
+        return 0
+
+    async def clear(self) -> None:
+        pass
@@ -1,10 +1,11 @@
 import argparse
 
 from env_settings import settings
+from utils import parse_duration
 from __init__ import __version__
 
 
-def parse_args(notification_names=None):
+def parse_args(notification_names=None, output_names=None, sink_names=None):
     custom_names_default = (
         " ".join(
             [f"{key}='{value}'" for key, value in settings.ATC_CUSTOM_NAMES.items()]
@@ -21,6 +22,16 @@ def parse_args(notification_names=None):
         nargs="+",
         help=f'Define custom names in the format KEY=VALUE, where KEY can match with end of device name (e.g., 12345="OUTSIDE"). Default is {custom_names_default}.',
     )
+    groups_default = (
+        " ".join(f"{key}='{value}'" for key, value in settings.VIRTUAL_DEVICES.items())
+        or "not used"
+    )
+    parser.add_argument(
+        "-g",
+        "--groups",
+        nargs="+",
+        help=f"Define virtual devices in the format NAME=[mean|min|max:]MEMBER,MEMBER, where MEMBER can match with end of device name or the address (e.g., FREEZERS=max:5EDB77,F6ED7A). Default is {groups_default}.",
+    )
     parser.add_argument(
         "-lt",
         "--alert-low-threshold",
@@ -43,6 +54,19 @@ def parse_args(notification_names=None):
         default=settings.SENT_THRESHOLD_TEMP,
         help=f"Set the delta temperature alert threshold for send next notification. Default is {settings.SENT_THRESHOLD_TEMP}.",
     )
+    parser.add_argument(
+        "--digest",
+        type=float,
+        metavar="SECONDS",
+        default=settings.ALERT_DIGEST_WINDOW,
+        help=f"Send the alerts following the first one as one summary per SECONDS, alerts {settings.ALERT_CRITICAL_DELTA} °C beyond the threshold are sent at once. Default is {settings.ALERT_DIGEST_WINDOW or 'disabled'}.",
+    )
+    parser.add_argument(
+        "--routes",
+        default=settings.ALERT_ROUTES,
+        metavar="FILE",
+        help="Route the alerts by device group and severity to the notifications and Discord webhooks of the JSON routes FILE. Default is all alerts to all notifications.",
+    )
     parser.add_argument(
         "-dtp",
         "--disable_text_pos",
@@ -56,6 +80,159 @@ def parse_args(notification_names=None):
         default=settings.BLE_SCANNER_MODE,
         help=f"Select scan mode. Default is '{settings.BLE_SCANNER_MODE}'.",
     )
+    parser.add_argument(
+        "-a",
+        "--adapters",
+        nargs="+",
+        default=settings.BLE_ADAPTERS,
+        help=f"Scan concurrently on the listed BLE adapters (e.g., hci0 hci1). Default is {', '.join(settings.BLE_ADAPTERS or ['default adapter'])}.",
+    )
+    parser.add_argument(
+        "-w",
+        "--watchdog",
+        type=float,
+        default=settings.BLE_WATCHDOG,
+        help=f"Restart scanning when no advertisement was received for this number of seconds. Use 0 to disable. Default is {settings.BLE_WATCHDOG}.",
+    )
+    parser.add_argument(
+        "-dc",
+        "--duty-cycle",
+        default=settings.BLE_DUTY_CYCLE,
+        help=f"Alternate adaptive scan windows and idle periods instead of continuous scanning. Default is {'enabled' if settings.BLE_DUTY_CYCLE else 'disabled'}.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--stats",
+        type=float,
+        metavar="SECONDS",
+        default=0,
+        help="Log the internal pipeline metrics every SECONDS. Default is disabled.",
+    )
+    parser.add_argument(
+        "--loop",
+        choices=["asyncio", "uvloop"],
+        default=settings.EVENT_LOOP,
+        help=f"Select the event loop, uvloop falls back to asyncio when not installed. Default is '{settings.EVENT_LOOP}'.",
+    )
+    parser.add_argument(
+        "--loop-monitor",
+        type=float,
+        nargs="?",
+        const=0.1,
+        default=settings.LOOP_LAG_THRESHOLD,
+        metavar="SECONDS",
+        help="Monitor the event loop lag and log the stack of callbacks blocking the loop longer than SECONDS (0.1 when omitted). Default is disabled.",
+    )
+    parser.add_argument(
+        "--profile",
+        type=float,
+        nargs="?",
+        const=0,
+        metavar="SECONDS",
+        help="Profile the asyncio loop (wall-clock and CPU) for SECONDS, or until exit when omitted, and write collapsed-stack files.",
+    )
+    parser.add_argument(
+        "--profile-output",
+        default="profile",
+        metavar="PREFIX",
+        help="Path prefix of the profile files. Default is 'profile'.",
+    )
+    parser.add_argument(
+        "--tracemalloc",
+        type=float,
+        metavar="SECONDS",
+        default=0,
+        help="Take tracemalloc snapshots every SECONDS and log the top allocation growth sites. Default is disabled.",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="FILE",
+        help="Replay advertisements from a capture file instead of scanning BLE devices.",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        type=float,
+        default=1.0,
+        help="Replay speed factor, 0 replays as fast as possible. Default is 1.0.",
+    )
+    parser.add_argument(
+        "--virtual-time",
+        action="store_true",
+        help="Run the replay in virtual time from the start of the capture: waits take no real time, durations and rate limits follow the capture.",
+    )
+    parser.add_argument(
+        "--soak",
+        type=parse_duration,
+        metavar="DURATION",
+        help="Run a soak test of the simulated DURATION (e.g. 24h) in virtual time, with synthetic devices (or the looped --replay) and stub notifications. Fails when the resource growth exceeds the SOAK_* budgets.",
+    )
+    parser.add_argument(
+        "--soak-devices",
+        type=int,
+        default=settings.SOAK_DEVICES,
+        help=f"Number of synthetic devices of the soak test. Default is {settings.SOAK_DEVICES}.",
+    )
+    parser.add_argument(
+        "--capture",
+        metavar="FILE",
+        help="Append received advertisements to a capture file for later replay,"
+        " binary for files with the .pvcap suffix.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=settings.CHECKPOINT_FILE,
+        metavar="FILE",
+        help=f"Save the device registry and the alert state to FILE every {settings.CHECKPOINT_INTERVAL:g} seconds and restore it on start, when not older than {settings.CHECKPOINT_MAX_AGE:g} seconds. Default is disabled.",
+    )
+    parser.add_argument(
+        "--forward",
+        default=settings.WIRE_FORWARD,
+        metavar="[tcp://|udp://]HOST:PORT",
+        help="Collector mode: forward the received advertisements to an aggregator. Default is disabled.",
+    )
+    parser.add_argument(
+        "--aggregate",
+        default=settings.WIRE_LISTEN,
+        metavar="[HOST:]PORT",
+        help="Aggregator mode: receive the advertisements of collectors (TCP and UDP) instead of scanning BLE devices. Default is disabled.",
+    )
+    parser.add_argument(
+        "--gateway-name",
+        default=settings.GATEWAY_NAME,
+        help="Name of this collector on the aggregator. Default is the host name.",
+    )
+    parser.add_argument(
+        "--shared-memory",
+        nargs="?",
+        const="pvvx_readings",
+        default=settings.SHARED_MEMORY,
+        metavar="NAME",
+        help="Publish the latest reading per device in the shared memory segment NAME ('pvvx_readings' when omitted) for other local processes. Default is disabled.",
+    )
+    parser.add_argument(
+        "--api-socket",
+        default=settings.API_SOCKET,
+        metavar="PATH",
+        help="Serve the local query API on the Unix domain socket PATH. Default is disabled.",
+    )
+    parser.add_argument(
+        "--api-http",
+        default=settings.API_HTTP,
+        metavar="[HOST:]PORT",
+        help="Serve the local query API over HTTP, the host defaults to 127.0.0.1. Default is disabled.",
+    )
+    parser.add_argument(
+        "--dashboard",
+        default=settings.DASHBOARD,
+        action="store_true",
+        help="Serve the live web dashboard on the query API, on 127.0.0.1:8080 when --api-http is not given.",
+    )
+    parser.add_argument(
+        "--history-size",
+        type=int,
+        default=settings.HISTORY_SIZE,
+        help=f"Number of readings per device kept for the query API. Default is {settings.HISTORY_SIZE}.",
+    )
     notification_registered_choice = notification_names or []
     notification_registered_choice.append("none")
     notification_registered_default = (
@@ -71,6 +248,24 @@ def parse_args(notification_names=None):
             f"Select notification mode individually or multiple, separated by space. Default is '{notification_registered_default[0]}'. "
         ),
     )
+    output_choice = output_names or ["console"]
+    parser.add_argument(
+        "-o",
+        "--output",
+        choices=output_choice,
+        default=(
+            settings.OUTPUT if settings.OUTPUT in output_choice else output_choice[0]
+        ),
+        help=f"Select the output of readings. Default is '{settings.OUTPUT}'.",
+    )
+    sink_choice = sink_names or []
+    parser.add_argument(
+        "--sink",
+        nargs="+",
+        choices=sink_choice,
+        default=[i for i in settings.SINKS if i in sink_choice],
+        help="Export readings to the sinks, separated by space. Default is none.",
+    )
     parser.add_argument(
         "-d",
         "--debug",
@@ -88,5 +283,7 @@ def parse_args(notification_names=None):
     )
 
     args = parser.parse_args()
+    if args.virtual_time and not args.replay:
+        parser.error("--virtual-time requires --replay")
 
     return args
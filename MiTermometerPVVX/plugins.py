@@ -0,0 +1,123 @@
+import importlib
+import logging
+from typing import Any, Callable
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+class PluginRegistry:
+    """
+    Registry of plugins described by name and loaded only when selected.
+
+    A plugin target is either a "module:attribute" string, imported on the
+    first ``load``, or the factory itself. Third-party packages add plugins
+    with entry points of the registry group, e.g. in pyproject.toml::
+
+        [tool.poetry.plugins."mitermometerpvvx.notifications"]
+        "slack" = "my_package.slack:SlackNotification"
+    """
+
+    def __init__(self, group: str):
+        """
+        Initialize the registry.
+
+        Args:
+            group (str): The entry point group of third-party plugins.
+        """
+        self.group = group
+        self.targets: dict[str, str | Callable] = {}
+        self._loaded: dict[str, Callable] = {}
+        self._entry_points_loaded = False
+
+    def register(self, name: str, target: str | Callable) -> None:
+        """
+        Register a plugin.
+
+        Args:
+            name (str): The name used to select the plugin.
+            target (str | Callable): "module:attribute" or the factory.
+        """
+        self.targets[name] = target
+        self._loaded.pop(name, None)
+
+    def load_entry_points(self) -> None:
+        """Register the plugins of installed packages, without importing them."""
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+        from importlib.metadata import entry_points
+
+        try:
+            found = entry_points(group=self.group)
+        except Exception as e:
+            logger.error(f"Error reading entry points of {self.group}: {e}")
+            return
+        for entry_point in found:
+            self.targets.setdefault(entry_point.name, entry_point)
+
+    def names(self) -> list[str]:
+        """
+        Return the names of all plugins.
+
+        Returns:
+            list[str]: The plugin names in registration order.
+        """
+        self.load_entry_points()
+        return list(self.targets)
+
+    def load(self, name: str) -> Callable:
+        """
+        Import the plugin and return its factory.
+
+        Args:
+            name (str): The plugin name.
+
+        Returns:
+            Callable: The plugin class or factory.
+
+        Raises:
+            KeyError: If no plugin of the name is registered.
+        """
+        factory = self._loaded.get(name)
+        if factory is not None:
+            return factory
+        self.load_entry_points()
+        target = self.targets[name]
+        if isinstance(target, str):
+            module_name, _, attribute = target.partition(":")
+            factory = getattr(importlib.import_module(module_name), attribute)
+        elif hasattr(target, "load") and hasattr(target, "group"):
+            factory = target.load()
+        else:
+            factory = target
+        self._loaded[name] = factory
+        return factory
+
+    def create(self, name: str, **kwargs) -> Any:
+        """
+        Load the plugin and create an instance.
+
+        Args:
+            name (str): The plugin name.
+            **kwargs: Arguments of the plugin factory.
+
+        Returns:
+            Any: The plugin instance.
+        """
+        return self.load(name)(**kwargs)
+
+
+notification_plugins = PluginRegistry("mitermometerpvvx.notifications")
+notification_plugins.register("logger", "notifications:LoggerNotification")
+notification_plugins.register("discord", "notifications:DiscordNotification")
+notification_plugins.register("system", "notifications:SystemNotification")
+notification_plugins.register("email", "email_notification:EmailNotification")
+notification_plugins.register("stub", "notifications:StubNotification")
+
+output_plugins = PluginRegistry("mitermometerpvvx.outputs")
+output_plugins.register("console", "outputs:ConsolePrintAsync")
+output_plugins.register("none", "outputs:NullOutput")
+
+sink_plugins = PluginRegistry("mitermometerpvvx.sinks")
+sink_plugins.register("influxdb", "influx_sink:InfluxSink")
+sink_plugins.register("archive", "archive_sink:ArchiveSink")
@@ -0,0 +1,231 @@
+import asyncio
+import linecache
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+class SamplingProfiler:
+    """
+    Sampling profiler of the thread running the asyncio loop.
+
+    A background thread samples the stack of the loop thread every
+    ``interval`` seconds. The stack is prefixed with the name of the asyncio
+    task running at that moment, so samples of coroutines are attributed to
+    their tasks. Two collapsed-stack profiles are kept (the input format of
+    flamegraph.pl and speedscope):
+
+    - wall: number of samples per stack, idle time in the selector included.
+    - cpu: microseconds of CPU time of the loop thread per stack. Only
+      available where ``time.pthread_getcpuclockid`` exists (Linux, macOS).
+    """
+
+    def __init__(self, interval: float = 0.005, loop: asyncio.AbstractEventLoop = None):
+        """
+        Initialize the profiler for the current thread.
+
+        Args:
+            interval (float): The sampling interval in seconds.
+            loop (asyncio.AbstractEventLoop): The loop of the thread, used to
+                resolve the current task.
+        """
+        self.interval = interval
+        self.loop = loop
+        self.thread_id = threading.get_ident()
+        self.wall: Counter[str] = Counter()
+        self.cpu: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._cpu_clock = None
+        if hasattr(time, "pthread_getcpuclockid"):
+            try:
+                self._cpu_clock = time.pthread_getcpuclockid(self.thread_id)
+            except OSError:
+                self._cpu_clock = None
+        self._frame_names: dict = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """Start sampling in a daemon thread."""
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="SamplingProfiler", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Profiler started, sampling every {self.interval * 1000:.1f} ms")
+
+    def stop(self) -> None:
+        """Stop sampling."""
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        logger.info(f"Profiler stopped after {self.samples} samples")
+
+    def _frame_name(self, frame) -> str:
+        code = frame.f_code
+        name = self._frame_names.get(code)
+        if name is None:
+            name = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._frame_names[code] = name
+        return name
+
+    def _task_name(self) -> str | None:
+        if self.loop is None:
+            return None
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            return None
+        return f"task:{task.get_name()}" if task else None
+
+    def _sample(self) -> str | None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return None
+        names = []
+        while frame is not None:
+            names.append(self._frame_name(frame))
+            frame = frame.f_back
+        task_name = self._task_name()
+        if task_name:
+            names.append(task_name)
+        names.reverse()
+        return ";".join(names)
+
+    def _run(self) -> None:
+        cpu_last = time.clock_gettime(self._cpu_clock) if self._cpu_clock else None
+        while not self._stop.wait(self.interval):
+            stack = self._sample()
+            if stack is None:
+                continue
+            self.samples += 1
+            self.wall[stack] += 1
+            if self._cpu_clock is not None:
+                cpu_now = time.clock_gettime(self._cpu_clock)
+                cpu_us = int((cpu_now - cpu_last) * 1_000_000)
+                cpu_last = cpu_now
+                if cpu_us > 0:
+                    self.cpu[stack] += cpu_us
+
+    @staticmethod
+    def _write_collapsed(path: Path, stacks: Counter) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, value in stacks.most_common():
+                f.write(f"{stack} {value}\n")
+
+    def write(self, prefix: str | Path) -> list[Path]:
+        """
+        Write the collapsed-stack profiles.
+
+        Args:
+            prefix (str | Path): The path prefix, '.wall.folded' and
+                '.cpu.folded' are appended.
+
+        Returns:
+            list[Path]: The written files.
+        """
+        files = []
+        wall_path = Path(f"{prefix}.wall.folded")
+        self._write_collapsed(wall_path, self.wall)
+        files.append(wall_path)
+        if self._cpu_clock is not None:
+            cpu_path = Path(f"{prefix}.cpu.folded")
+            self._write_collapsed(cpu_path, self.cpu)
+            files.append(cpu_path)
+        logger.info(f"Profile written: {', '.join(str(f) for f in files)}")
+        return files
+
+
+class MemoryTracker:
+    """
+    Periodic tracemalloc snapshots reporting the top allocation growth sites.
+
+    Every snapshot is compared with the first (baseline) one, so slowly
+    growing allocations of long runs stand out.
+    """
+
+    IGNORED = (
+        tracemalloc.__file__,
+        linecache.__file__,
+        "<frozen importlib._bootstrap>",
+    )
+
+    def __init__(self, interval: float = 600.0, top: int = 10, frames: int = 5):
+        """
+        Initialize the memory tracker.
+
+        Args:
+            interval (float): Seconds between snapshots.
+            top (int): Number of growth sites to report.
+            frames (int): Number of frames stored per allocation.
+        """
+        self.interval = interval
+        self.top = top
+        self.frames = frames
+        self.baseline: tracemalloc.Snapshot | None = None
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces(
+            [tracemalloc.Filter(False, pattern) for pattern in self.IGNORED]
+        )
+
+    def _growth(self, snapshot: tracemalloc.Snapshot) -> list[str]:
+        stats = snapshot.compare_to(self.baseline, "traceback")
+        lines = []
+        for stat in stats[: self.top]:
+            if stat.size_diff <= 0:
+                break
+            frame = stat.traceback[0]
+            lines.append(
+                f"{stat.size_diff / 1024:+.1f} KiB ({stat.count_diff:+d} blocks) "
+                f"{frame.filename}:{frame.lineno}"
+            )
+        return lines
+
+    async def report(self) -> list[str]:
+        """
+        Take a snapshot and log the top growth sites since the baseline.
+
+        Returns:
+            list[str]: The reported lines.
+        """
+        snapshot = await asyncio.to_thread(self._take_snapshot)
+        if self.baseline is None:
+            self.baseline = snapshot
+            return []
+        lines = await asyncio.to_thread(self._growth, snapshot)
+        current, peak = tracemalloc.get_traced_memory()
+        logger.info(
+            f"*** MEMORY GROWTH (traced {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB) ***"
+        )
+        for line in lines:
+            logger.info(line)
+        return lines
+
+    async def run(self) -> None:
+        """Take snapshots every interval until cancelled."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        try:
+            await self.report()
+            while True:
+                await asyncio.sleep(self.interval)
+                await self.report()
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,184 @@
+"""
+Routing of alerts to notification channels by device group and severity.
+
+The routes are read from a JSON file::
+
+    {
+        "routes": [
+            {
+                "name": "tenant-a",
+                "devices": ["ATC_5E*", "A4:C1:38:F6:ED:7A"],
+                "severities": ["critical"],
+                "destinations": ["logger", "https://discord.com/api/webhooks/..."]
+            }
+        ]
+    }
+
+Device patterns match the device name or address (case-insensitive, ``*`` and
+``?`` wildcards). A route without ``severities`` takes all alerts.
+Destinations are notification plugin names or Discord webhook URLs. An alert
+goes to the destinations of all matching routes, alerts of devices without
+route go to the enabled notifications.
+"""
+
+import json
+import logging
+import re
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+WILDCARD = re.compile(r"[*?\[]")
+
+
+@dataclass(frozen=True, slots=True)
+class Route:
+    """Destinations of the alerts of a device group."""
+
+    name: str
+    devices: tuple[str, ...]
+    severities: frozenset[str] | None
+    destinations: tuple[str, ...]
+
+
+def load_routes(path: str | Path) -> list[Route]:
+    """
+    Read the routes file.
+
+    Args:
+        path (str | Path): The JSON file.
+
+    Returns:
+        list[Route]: The routes in the order of the file.
+
+    Raises:
+        ValueError: If the file is not a valid routes file.
+    """
+    try:
+        config = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Cannot read routes {path}: {e}") from e
+    routes = []
+    for i, item in enumerate(config.get("routes", [])):
+        name = item.get("name") or f"route{i}"
+        devices = item.get("devices")
+        destinations = item.get("destinations")
+        if not devices or not destinations:
+            raise ValueError(f"Route {name} needs devices and destinations")
+        severities = item.get("severities")
+        routes.append(
+            Route(
+                name=name,
+                devices=tuple(d.casefold() for d in devices),
+                severities=frozenset(severities) if severities else None,
+                destinations=tuple(destinations),
+            )
+        )
+    return routes
+
+
+class NotificationRouter:
+    """
+    Resolve the notification tasks of an alert.
+
+    Exact device patterns are indexed in a dictionary, only wildcard patterns
+    are matched, once per (device, address, severity): the resolved tasks are
+    cached, so later alerts of the device are a dictionary lookup. Every
+    destination is created once and shared by the routes, e.g. one Discord
+    notification (and connection pool) per webhook URL.
+    """
+
+    def __init__(
+        self,
+        routes: list[Route],
+        factory: Callable[[str], object],
+        default: list = None,
+    ):
+        """
+        Initialize the router.
+
+        Args:
+            routes (list[Route]): The routes.
+            factory (Callable[[str], object]): Creates the notification task
+                of a destination (plugin name or webhook URL).
+            default (list): The tasks of alerts without route.
+        """
+        self.routes = routes
+        self.factory = factory
+        self.default = default or []
+        self.exact: dict[str, list[int]] = {}
+        self.wildcards: list[tuple[str, int]] = []
+        for index, route in enumerate(routes):
+            for pattern in route.devices:
+                if WILDCARD.search(pattern):
+                    self.wildcards.append((pattern, index))
+                else:
+                    self.exact.setdefault(pattern, []).append(index)
+        self.destinations: dict[str, object] = {}
+        self._cache: dict[tuple, tuple] = {}
+
+    def destination(self, name: str) -> object | None:
+        """Return the task of the destination, created on first use."""
+        task = self.destinations.get(name)
+        if task is None and name not in self.destinations:
+            try:
+                task = self.factory(name)
+            except Exception as e:
+                logger.error(f"Error creating notification {name}: {e}")
+            self.destinations[name] = task
+        return task
+
+    def match(self, device: str | None, address: str | None) -> list[int]:
+        """Return the indexes of the routes of the device, in order."""
+        keys = [k.casefold() for k in (device, address) if k]
+        indexes = set()
+        for key in keys:
+            indexes.update(self.exact.get(key, ()))
+        for pattern, index in self.wildcards:
+            if index not in indexes and any(fnmatchcase(k, pattern) for k in keys):
+                indexes.add(index)
+        return sorted(indexes)
+
+    def resolve(self, device: str | None, address: str | None, severity: str) -> tuple:
+        """
+        Return the notification tasks of an alert.
+
+        Args:
+            device (str | None): The name of the device.
+            address (str | None): The address of the device.
+            severity (str): The severity of the alert.
+
+        Returns:
+            tuple: The tasks, the default tasks when no route matches the
+                device (a device of a route without route of the severity
+                gets no notification).
+        """
+        key = (device, address, severity)
+        tasks = self._cache.get(key)
+        if tasks is not None:
+            return tasks
+        indexes = self.match(device, address)
+        if not indexes:
+            tasks = self._cache[key] = tuple(self.default)
+            return tasks
+        tasks = []
+        for index in indexes:
+            route = self.routes[index]
+            if route.severities is not None and severity not in route.severities:
+                continue
+            for name in route.destinations:
+                task = self.destination(name)
+                if task is not None and task not in tasks:
+                    tasks.append(task)
+        tasks = self._cache[key] = tuple(tasks)
+        return tasks
+
+    async def close(self) -> None:
+        """Close the destinations holding connections."""
+        for task in self.destinations.values():
+            close = getattr(task, "close", None)
+            if close:
+                await close()
@@ -0,0 +1,204 @@
+import logging
+
+from clock import get_clock
+from link_quality import LinkQuality
+from utils import counter_delta
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+class DeviceArrivals:
+    """Advertisement arrival estimates of one device."""
+
+    __slots__ = (
+        "last_seen",
+        "last_window",
+        "adv_interval",
+        "last_count",
+        "last_count_time",
+        "counter_period",
+        "captured",
+        "expected",
+    )
+
+    def __init__(self):
+        self.last_seen: float | None = None
+        self.last_window: int | None = None
+        self.adv_interval: float | None = None
+        self.last_count: int | None = None
+        self.last_count_time: float | None = None
+        self.counter_period: float | None = None
+        self.captured = 0
+        self.expected = 0
+
+
+class DutyCycleScheduler:
+    """
+    Adaptive scheduler of scan windows and idle periods.
+
+    PVVX thermometers advertise every ``adv_interval`` seconds and increase the
+    frame counter every ``counter_period`` seconds. A scan window longer than
+    the slowest advertising interval catches at least one advertisement, and
+    the idle period ``min(counter_period) - 2 * window - guard`` leaves two
+    scan windows (and the guard) in the fastest counter period, so every new
+    counter value is caught. Whenever a frame is missed the scheduler
+    falls back to continuous scanning for ``fallback`` seconds.
+    """
+
+    # Gaps shorter than this are duplicates received by several adapters
+    MIN_GAP = 0.1
+    EWMA_ALPHA = 0.2
+
+    def __init__(
+        self,
+        min_window: float = 3.0,
+        max_window: float = 30.0,
+        margin: float = 1.5,
+        guard: float = 1.0,
+        min_idle: float = 2.0,
+        fallback: float = 60.0,
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            min_window (float): The shortest scan window in seconds.
+            max_window (float): The longest scan window in seconds.
+            margin (float): Safety factor applied to the advertising interval.
+            guard (float): Seconds kept free of idle time in every counter period.
+            min_idle (float): Idle periods shorter than this scan continuously.
+            fallback (float): Seconds of continuous scanning after a missed frame,
+                also used to learn the arrival rates at start.
+        """
+        self.min_window = min_window
+        self.max_window = max_window
+        self.margin = margin
+        self.guard = guard
+        self.min_idle = min_idle
+        self.fallback = fallback
+        self.devices: dict[str, DeviceArrivals] = {}
+        self.window_id = 0
+        self.missed = 0
+        self.continuous_until = get_clock().monotonic() + fallback
+        self.last_plan: tuple[float, float] | None = None
+
+    def start_window(self) -> None:
+        """Mark the start of a new scan window."""
+        self.window_id += 1
+
+    def observe(self, address: str, count: int, now: float = None) -> None:
+        """
+        Record an advertisement, duplicates included.
+
+        Args:
+            address (str): The address of the device.
+            count (int): The PVVX frame counter.
+            now (float): The monotonic arrival time.
+        """
+        now = get_clock().monotonic() if now is None else now
+        device = self.devices.get(address)
+        if device is None:
+            device = self.devices[address] = DeviceArrivals()
+
+        if device.last_window == self.window_id and device.last_seen is not None:
+            gap = now - device.last_seen
+            if gap >= self.MIN_GAP:
+                device.adv_interval = self._ewma(device.adv_interval, gap)
+        device.last_seen = now
+        device.last_window = self.window_id
+
+        if device.last_count is None:
+            device.last_count = count
+            device.last_count_time = now
+            device.captured += 1
+            device.expected += 1
+            return
+        delta = counter_delta(device.last_count, count)
+        if delta == 0 or delta >= 256 - LinkQuality.LATE_WINDOW:
+            # Duplicate, or a late frame from another adapter
+            return
+        if delta >= 128:
+            # A restart of the device, not missed frames
+            device.last_count = count
+            device.last_count_time = now
+            device.captured += 1
+            device.expected += 1
+            return
+        device.captured += 1
+        device.expected += delta
+        if delta > 1:
+            self.missed += delta - 1
+            self.continuous_until = now + self.fallback
+            logger.debug(
+                f"Missed {delta - 1} frames of {address}, scanning continuously"
+            )
+        else:
+            device.counter_period = self._ewma(
+                device.counter_period, now - device.last_count_time
+            )
+        device.last_count = count
+        device.last_count_time = now
+
+    def _ewma(self, value: float | None, sample: float) -> float:
+        if value is None:
+            return sample
+        return value + self.EWMA_ALPHA * (sample - value)
+
+    def plan(self, now: float = None) -> tuple[float, float]:
+        """
+        Plan the next scan window.
+
+        Args:
+            now (float): The monotonic time.
+
+        Returns:
+            tuple[float, float]: The window and the idle period in seconds. An idle
+                period of 0 means continuous scanning.
+        """
+        now = get_clock().monotonic() if now is None else now
+        plan = (self.fallback, 0.0)
+        if now >= self.continuous_until:
+            intervals = [d.adv_interval for d in self.devices.values()]
+            periods = [d.counter_period for d in self.devices.values()]
+            if intervals and None not in intervals and None not in periods:
+                window = min(
+                    self.max_window,
+                    max(self.min_window, max(intervals) * self.margin),
+                )
+                idle = min(periods) - 2 * window - self.guard
+                if idle >= self.min_idle:
+                    plan = (window, idle)
+        if plan != self.last_plan:
+            logger.debug(
+                f"Scan plan: window {plan[0]:.1f}s, idle {plan[1]:.1f}s, "
+                f"capture ratio {self.capture_ratio():.3f}"
+            )
+            self.last_plan = plan
+        return plan
+
+    def capture_ratio(self) -> float:
+        """
+        Return the share of PVVX frames captured of all frames sent.
+
+        Returns:
+            float: Captured / expected frames, 1.0 before any frame was seen.
+        """
+        expected = sum(d.expected for d in self.devices.values())
+        if not expected:
+            return 1.0
+        return sum(d.captured for d in self.devices.values()) / expected
+
+    def get_stats(self) -> dict:
+        """
+        Return the scheduler stats.
+
+        Returns:
+            dict: The current plan, missed frames and the frame-capture ratio.
+        """
+        window, idle = self.last_plan or (None, None)
+        return {
+            "window": window,
+            "idle": idle,
+            "missed": self.missed,
+            "capture_ratio": round(self.capture_ratio(), 4),
+        }
@@ -0,0 +1,357 @@
+"""
+Latest reading per device in a shared memory segment.
+
+The scanner process writes a fixed-layout table with ``SharedReadingTable``,
+other local processes (a kiosk UI, a fan relay control loop) poll it with
+``SharedReadingReader`` without IPC round-trips. The reader only depends on
+the standard library and this module.
+
+Layout (little endian)::
+
+    header  16 bytes  magic b"PVVX", version u16, slots u16, used u32,
+                      owner u32 (PID of the writer)
+    slot   128 bytes  seq u64, address 40s, name 32s, temp f64, humidity f64,
+                      battery_v f64, timestamp f64 (epoch), interval f64
+                      (NaN when unknown), battery u8, rssi i8 (-128 when
+                      unknown), count u8, crc u32 (CRC32 of the fields)
+
+Every slot is protected by a seqlock: the writer makes the sequence odd,
+writes the slot and makes it even again. A reader retries while the
+sequence is odd or changed during its read.
+
+The stores of the writer are plain memory copies without memory barriers,
+Python offers no fence. On weakly ordered CPUs (ARM, e.g. a Raspberry Pi)
+another core may see the even sequence before all bytes of the slot, so the
+reader also checks the CRC32 of the fields and retries on a mismatch. A torn
+slot is detected on every CPU.
+
+A segment left over by a crashed writer is taken over, a segment whose
+owner is still running is refused.
+"""
+
+import datetime
+import logging
+import math
+import os
+import struct
+import zlib
+from multiprocessing import shared_memory
+
+from events import Reading
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+MAGIC = b"PVVX"
+VERSION = 2
+HEADER = struct.Struct("<4sHHII")
+SEQ = struct.Struct("<Q")
+BODY = struct.Struct("<40s32sdddddBbB")
+CRC = struct.Struct("<I")
+SLOT_SIZE = 128
+assert SEQ.size + BODY.size + CRC.size <= SLOT_SIZE
+RSSI_UNKNOWN = -128
+DEFAULT_NAME = "pvvx_readings"
+
+
+def table_size(slots: int) -> int:
+    """Return the size in bytes of a table of the number of slots."""
+    return HEADER.size + slots * SLOT_SIZE
+
+
+def _encode(text: str | None, size: int) -> bytes:
+    return (text or "").encode("utf-8")[:size]
+
+
+def _decode(raw: bytes) -> str:
+    return raw.rstrip(b"\0").decode("utf-8", errors="ignore")
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing segment without removing it on exit."""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Before Python 3.13 the resource tracker of the attaching process
+        # would remove the segment of the writer on exit
+        shm = shared_memory.SharedMemory(name)
+        try:
+            from multiprocessing import resource_tracker
+
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+def _live_owner(name: str) -> int | None:
+    """
+    Return the PID of the running writer of the segment.
+
+    Args:
+        name (str): The name of the segment.
+
+    Returns:
+        int | None: The PID, None if the writer is gone.
+
+    Raises:
+        FileExistsError: If the segment is not a readings table.
+    """
+    shm = _attach(name)
+    try:
+        if shm.size < HEADER.size:
+            raise FileExistsError(f"Shared memory '{name}' is not a readings table")
+        magic, _, _, _, owner = HEADER.unpack_from(shm.buf, 0)
+    finally:
+        shm.close()
+    if magic != MAGIC:
+        raise FileExistsError(f"Shared memory '{name}' is not a readings table")
+    if os.name == "nt":
+        # Windows removes a segment with its last handle, it has an owner
+        return owner
+    if not owner:
+        return None
+    try:
+        os.kill(owner, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        # Running under another user
+        pass
+    return owner
+
+
+class SharedReadingTable:
+    """Writer of the latest reading per device, owned by the scanner process."""
+
+    def __init__(self, name: str = DEFAULT_NAME, slots: int = 64):
+        """
+        Create the shared memory segment.
+
+        Args:
+            name (str): The name of the segment.
+            slots (int): The maximum number of devices.
+
+        Raises:
+            FileExistsError: If the segment is used by a running process, or is
+                not a readings table.
+        """
+        self.name = name
+        self.slots = slots
+        try:
+            self.shm = shared_memory.SharedMemory(
+                name, create=True, size=table_size(slots)
+            )
+        except FileExistsError:
+            owner = _live_owner(name)
+            if owner is not None:
+                raise FileExistsError(
+                    f"Shared memory '{name}' is used by the running process {owner}"
+                )
+            # Left over by a crashed process, the layout is rewritten below
+            logger.warning(
+                f"Taking over the shared memory '{name}' of a stopped writer"
+            )
+            self.shm = shared_memory.SharedMemory(name)
+            if self.shm.size < table_size(slots):
+                self.shm.close()
+                self.shm.unlink()
+                self.shm = shared_memory.SharedMemory(
+                    name, create=True, size=table_size(slots)
+                )
+        self.buf = self.shm.buf
+        self.buf[: table_size(slots)] = bytes(table_size(slots))
+        self.index: dict[str, int] = {}
+        self.seqs = [0] * slots
+        self.full_warned = False
+        self.owner = os.getpid()
+        HEADER.pack_into(self.buf, 0, MAGIC, VERSION, slots, 0, self.owner)
+        logger.info(f"Shared memory table '{name}' with {slots} slots")
+
+    def slot_of(self, address: str) -> int | None:
+        slot = self.index.get(address)
+        if slot is None:
+            if len(self.index) >= self.slots:
+                if not self.full_warned:
+                    logger.warning(f"Shared memory table '{self.name}' is full")
+                    self.full_warned = True
+                return None
+            slot = len(self.index)
+            self.index[address] = slot
+            HEADER.pack_into(
+                self.buf, 0, MAGIC, VERSION, self.slots, len(self.index), self.owner
+            )
+        return slot
+
+    def write(self, reading: Reading) -> None:
+        """
+        Write the reading into the slot of its device.
+
+        Args:
+            reading (Reading): The reading.
+        """
+        slot = self.slot_of(reading.address)
+        if slot is None:
+            return
+        offset = HEADER.size + slot * SLOT_SIZE
+        seq = self.seqs[slot] + 1
+        body = BODY.pack(
+            _encode(reading.address, 40),
+            _encode(reading.name, 32),
+            reading.temp,
+            reading.humidity,
+            reading.battery_v,
+            reading.timestamp.timestamp(),
+            reading.interval.total_seconds() if reading.interval else math.nan,
+            reading.battery,
+            RSSI_UNKNOWN if reading.rssi is None else reading.rssi,
+            reading.count,
+        )
+        SEQ.pack_into(self.buf, offset, seq)
+        start = offset + SEQ.size
+        self.buf[start : start + BODY.size] = body
+        CRC.pack_into(self.buf, start + BODY.size, zlib.crc32(body))
+        self.seqs[slot] = seq + 1
+        SEQ.pack_into(self.buf, offset, seq + 1)
+
+    def close(self) -> None:
+        """Close and remove the shared memory segment."""
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedReadingReader:
+    """
+    Reader of the table, for other processes.
+
+    Example::
+
+        reader = SharedReadingReader()
+        reading = reader.get("A4:C1:38:5E:DB:77")
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME, retries: int = 1000):
+        """
+        Attach to the shared memory segment.
+
+        Args:
+            name (str): The name of the segment.
+            retries (int): Attempts to read a slot being written.
+
+        Raises:
+            FileNotFoundError: If the segment does not exist.
+            ValueError: If the segment is not a table of this version.
+        """
+        self.shm = _attach(name)
+        self.buf = self.shm.buf
+        self.retries = retries
+        magic, version, self.slots, _, _ = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"Shared memory '{name}' is not a readings table")
+        self.index: dict[str, int] = {}
+        self.indexed = 0
+
+    @property
+    def used(self) -> int:
+        """The number of devices in the table."""
+        return HEADER.unpack_from(self.buf, 0)[3]
+
+    def read_slot(self, slot: int) -> tuple | None:
+        """
+        Read a consistent copy of the fields of a slot.
+
+        Args:
+            slot (int): The slot number.
+
+        Returns:
+            tuple | None: The raw fields in layout order, None if empty.
+
+        Raises:
+            TimeoutError: If the slot stayed inconsistent for all retries.
+        """
+        offset = HEADER.size + slot * SLOT_SIZE
+        start = offset + SEQ.size
+        for _ in range(self.retries):
+            (seq,) = SEQ.unpack_from(self.buf, offset)
+            if seq & 1:
+                continue
+            if seq == 0:
+                return None
+            body = bytes(self.buf[start : start + BODY.size])
+            (crc,) = CRC.unpack_from(self.buf, start + BODY.size)
+            if SEQ.unpack_from(self.buf, offset)[0] != seq:
+                continue
+            # A torn copy passes the sequence check on weakly ordered CPUs
+            if zlib.crc32(body) == crc:
+                return BODY.unpack(body)
+        raise TimeoutError(f"Slot {slot} stayed inconsistent")
+
+    def read(self, slot: int) -> Reading | None:
+        """
+        Read the reading of a slot.
+
+        Args:
+            slot (int): The slot number.
+
+        Returns:
+            Reading | None: The reading, None if the slot is empty.
+        """
+        fields = self.read_slot(slot)
+        if fields is None:
+            return None
+        address, name, temp, humidity, battery_v, timestamp, interval = fields[:7]
+        battery, rssi, count = fields[7:]
+        return Reading(
+            address=_decode(address),
+            name=_decode(name) or None,
+            temp=temp,
+            humidity=humidity,
+            battery_v=battery_v,
+            battery=battery,
+            rssi=None if rssi == RSSI_UNKNOWN else rssi,
+            count=count,
+            timestamp=datetime.datetime.fromtimestamp(timestamp),
+            interval=(
+                None if math.isnan(interval) else datetime.timedelta(seconds=interval)
+            ),
+        )
+
+    def get(self, address: str) -> Reading | None:
+        """
+        Return the latest reading of the device.
+
+        Args:
+            address (str): The device address.
+
+        Returns:
+            Reading | None: The reading, None if the device is unknown.
+        """
+        if address not in self.index and self.indexed != self.used:
+            self._reindex()
+        slot = self.index.get(address)
+        return None if slot is None else self.read(slot)
+
+    def readings(self) -> list[Reading]:
+        """Return the latest readings of all devices."""
+        readings = (self.read(slot) for slot in range(self.used))
+        return [reading for reading in readings if reading is not None]
+
+    def _reindex(self) -> None:
+        used = self.used
+        for slot in range(self.indexed, used):
+            fields = self.read_slot(slot)
+            if fields is None:
+                # Slot reserved but not written yet
+                used = slot
+                break
+            self.index[_decode(fields[0])] = slot
+        self.indexed = used
+
+    def close(self) -> None:
+        """Detach from the shared memory segment."""
+        self.buf = None
+        self.shm.close()
@@ -0,0 +1,37 @@
+from abc import ABC, abstractmethod
+import logging
+
+from events import Reading
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+class SinkAbstract(ABC):
+    """
+    Abstract base class of sinks exporting readings.
+
+    A sink is attached to the reading event bus, ``write`` is called with
+    every accepted reading from the worker of its subscriber.
+    """
+
+    async def start(self) -> None:
+        """
+        Start the sink, called in the running loop before the first reading.
+        """
+        ...
+
+    @abstractmethod
+    async def write(self, reading: Reading) -> None:
+        """
+        Export a reading.
+
+        Args:
+            reading (Reading): The reading.
+        """
+        ...
+
+    async def close(self) -> None:
+        """
+        Flush the pending readings and close the sink.
+        """
+        ...
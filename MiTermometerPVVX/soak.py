@@ -0,0 +1,207 @@
+import asyncio
+import gc
+import logging
+import os
+import sys
+
+from clock import Clock, get_clock
+from env_settings import settings
+from metrics import metrics
+from utils import background_tasks
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+# Stage latencies compared between the start and the end of the soak test
+LATENCY_HISTOGRAMS = ("ble.decode_us", "alerts.evaluate_us", "bus.alerts.lag_us")
+
+
+def rss_kb() -> int | None:
+    """Return the resident set size of the process in KiB, None if unknown."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Peak RSS: bytes on macOS, KiB elsewhere
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class SoakMonitor:
+    """
+    Resource and latency sampler of a soak test.
+
+    Every ``interval`` seconds (of the clock, virtual in soak tests) the RSS,
+    the number of live objects, asyncio tasks and background thread tasks,
+    the depths of the bus queues, the per-device state of the scanner and
+    the stage latencies are sampled. After ``duration`` the scanner is
+    stopped and the growth from the end of the warm-up to the end of the test
+    is checked against the budgets, slow leaks fail the test.
+    """
+
+    def __init__(
+        self,
+        scanner,
+        duration: float,
+        interval: float = None,
+        warmup: float = 0.1,
+        clock: Clock = None,
+    ):
+        """
+        Initialize the monitor, the budgets are read from the settings.
+
+        Args:
+            scanner (BLEScanner): The scanner under test, stopped at the end.
+            duration (float): Seconds of the soak test.
+            interval (float): Seconds between samples, 1/100 of the duration
+                by default.
+            warmup (float): Fraction of the duration before the baseline sample.
+            clock (Clock): The clock, the current clock by default.
+        """
+        self.scanner = scanner
+        self.duration = duration
+        self.interval = interval or max(duration / 100, 1.0)
+        self.warmup = warmup
+        self.clock = clock or get_clock()
+        self.samples: list[dict] = []
+        self._window_counts: dict[str, list[int]] = {}
+
+    def latency_window(self) -> dict[str, int]:
+        """Return the p99 latencies recorded since the previous sample."""
+        latencies = {}
+        for name in LATENCY_HISTOGRAMS:
+            histogram = metrics.histograms.get(name)
+            if histogram is None:
+                continue
+            latencies[name] = histogram.percentile(99, self._window_counts.get(name))
+            self._window_counts[name] = list(histogram.counts)
+        return latencies
+
+    def sample(self) -> dict:
+        """Take a sample of the resources."""
+        scanner = self.scanner
+        gauges = metrics.snapshot()["gauges"]
+        tables = [
+            scanner.atc_counters,
+            scanner.atc_date,
+            scanner.atc_monotonic,
+            scanner.atc_seen_counters,
+            scanner.atc_rssi,
+            scanner.atc_rssi_adapter,
+            scanner.cache_sent_alert,
+        ]
+        # The rate limit cache of the Discord messages, when the module is used
+        discord_api = sys.modules.get("discord_api")
+        if discord_api is not None:
+            tables.append(discord_api._sent_messages_cache)
+        return {
+            "time": self.clock.monotonic(),
+            "rss_kb": rss_kb(),
+            "objects": len(gc.get_objects()),
+            "tasks": len(asyncio.all_tasks()),
+            "background_tasks": len(background_tasks),
+            "queue_depth": max(
+                (v for n, v in gauges.items() if n.endswith(".queue_depth")),
+                default=0,
+            ),
+            "devices": len(scanner.atc_devices),
+            # Largest per-device table, above the number of devices is a leak
+            "device_state": max(len(d) for d in tables),
+            "latency_p99_us": self.latency_window(),
+        }
+
+    async def run(self) -> None:
+        """Sample until the duration has passed, then stop the scanner."""
+        started = self.clock.monotonic()
+        self.samples.append(self.sample())
+        while self.clock.monotonic() - started < self.duration:
+            await asyncio.sleep(self.interval)
+            self.samples.append(self.sample())
+            logger.debug(f"Soak sample: {self.samples[-1]}")
+        self.scanner.stop_event.set()
+
+    def baseline(self) -> dict:
+        """Return the first sample after the warm-up."""
+        start = self.samples[0]["time"] + self.duration * self.warmup
+        for sample in self.samples:
+            if sample["time"] >= start:
+                return sample
+        return self.samples[-1]
+
+    def evaluate(self) -> list[str]:
+        """
+        Check the growth against the budgets.
+
+        Returns:
+            list[str]: The exceeded budgets, empty when the test passed.
+        """
+        if len(self.samples) < 2:
+            return ["soak test ended before the second sample"]
+        base, last = self.baseline(), self.samples[-1]
+        failures = []
+        if base["rss_kb"] is not None and last["rss_kb"] is not None:
+            growth = (last["rss_kb"] - base["rss_kb"]) / 1024
+            if growth > settings.SOAK_RSS_BUDGET_MB:
+                failures.append(
+                    f"RSS grew {growth:.1f} MiB > {settings.SOAK_RSS_BUDGET_MB} MiB"
+                )
+        checks = (
+            ("objects", settings.SOAK_OBJECTS_BUDGET),
+            ("tasks", settings.SOAK_TASKS_BUDGET),
+            ("background_tasks", settings.SOAK_TASKS_BUDGET),
+        )
+        for key, budget in checks:
+            growth = last[key] - base[key]
+            if growth > budget:
+                failures.append(f"{key} grew by {growth} > {budget}")
+        if last["device_state"] > last["devices"]:
+            failures.append(
+                f"per-device state of {last['device_state']} entries "
+                f"> {last['devices']} devices"
+            )
+        depth = max(sample["queue_depth"] for sample in self.samples)
+        if depth > settings.SOAK_QUEUE_BUDGET:
+            failures.append(f"queue depth {depth} > {settings.SOAK_QUEUE_BUDGET}")
+        for name, first in base["latency_p99_us"].items():
+            latest = last["latency_p99_us"].get(name, 0)
+            # Ignore drift within the resolution of short timings
+            if latest > max(first, 50) * settings.SOAK_LATENCY_DRIFT:
+                failures.append(
+                    f"{name} p99 drifted from {first} us to {latest} us "
+                    f"> x{settings.SOAK_LATENCY_DRIFT}"
+                )
+        return failures
+
+    def report(self) -> bool:
+        """
+        Log the resource growth and the verdict.
+
+        Returns:
+            bool: True if all budgets were kept.
+        """
+        failures = self.evaluate()
+        if len(self.samples) >= 2:
+            base, last = self.baseline(), self.samples[-1]
+            hours = (last["time"] - self.samples[0]["time"]) / 3600
+            logger.info(f"Soak test: {hours:.1f} h, {len(self.samples)} samples")
+            for key in ("rss_kb", "objects", "tasks", "background_tasks"):
+                logger.info(f"  {key}: {base[key]} -> {last[key]}")
+            logger.info(
+                f"  queue_depth max: {max(s['queue_depth'] for s in self.samples)}"
+            )
+            logger.info(
+                f"  device_state: {base['device_state']} -> {last['device_state']} "
+                f"entries of {last['devices']} devices"
+            )
+            for name, value in last["latency_p99_us"].items():
+                logger.info(
+                    f"  {name} p99: {base['latency_p99_us'].get(name)} -> {value} us"
+                )
+        for failure in failures:
+            logger.error(f"Soak budget exceeded: {failure}")
+        logger.info(f"Soak test {'failed' if failures else 'passed'}")
+        return not failures
@@ -0,0 +1,86 @@
+import datetime
+import logging
+from bisect import bisect_left, bisect_right
+from collections import deque
+from itertools import islice
+
+from events import Reading
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+class ReadingStore:
+    """
+    In-memory latest reading and bounded history of every device.
+
+    The version is bumped on every added reading, so consumers cache what
+    they derive from the store until the version changes.
+    """
+
+    def __init__(self, history_size: int = 10000):
+        """
+        Initialize the store.
+
+        Args:
+            history_size (int): The number of readings kept per device.
+        """
+        self.history_size = history_size
+        self.version = 0
+        self.latest: dict[str, Reading] = {}
+        self.history: dict[str, deque[Reading]] = {}
+
+    def add(self, reading: Reading) -> None:
+        """
+        Add an accepted reading, used as bus subscriber.
+
+        Args:
+            reading (Reading): The reading.
+        """
+        history = self.history.get(reading.address)
+        if history is None:
+            history = self.history[reading.address] = deque(maxlen=self.history_size)
+        history.append(reading)
+        self.latest[reading.address] = reading
+        self.version += 1
+
+    def devices(self) -> list[dict]:
+        """
+        Return the known devices.
+
+        Returns:
+            list[dict]: Address, name, last seen time and number of stored readings.
+        """
+        return [
+            {
+                "address": address,
+                "name": reading.name,
+                "last_seen": reading.timestamp.isoformat(),
+                "readings": len(self.history[address]),
+            }
+            for address, reading in self.latest.items()
+        ]
+
+    def get_history(
+        self,
+        address: str,
+        start: datetime.datetime = None,
+        end: datetime.datetime = None,
+    ) -> list[Reading]:
+        """
+        Return the stored readings of the device between start and end.
+
+        Args:
+            address (str): The device address.
+            start (datetime.datetime, optional): The first time, inclusive.
+            end (datetime.datetime, optional): The last time, inclusive.
+
+        Returns:
+            list[Reading]: The readings in time order.
+        """
+        history = self.history.get(address)
+        if not history:
+            return []
+        key = lambda reading: reading.timestamp
+        low = 0 if start is None else bisect_left(history, start, key=key)
+        high = len(history) if end is None else bisect_right(history, end, key=key)
+        return list(islice(history, low, high))
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import random
+
+from clock import get_clock
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter.
+
+    Delays grow as ``initial * factor ** attempt`` limited by ``maximum``,
+    and are randomized by +/- ``jitter`` (a fraction of the delay).
+    """
+
+    def __init__(
+        self,
+        initial: float = 1.0,
+        maximum: float = 60.0,
+        factor: float = 2.0,
+        jitter: float = 0.2,
+    ):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.attempt = 0
+
+    def next(self) -> float:
+        """
+        Return the next delay and advance the attempt counter.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        delay = min(self.maximum, self.initial * self.factor**self.attempt)
+        self.attempt += 1
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+    def reset(self) -> None:
+        """Start again from the initial delay."""
+        self.attempt = 0
+
+
+class ScanSupervisor:
+    """
+    Keep the BLE scanner running, restarting it with backoff when it fails.
+
+    The scanner object is reused across restarts, so the device registry,
+    display layout and alert state are preserved. Every restart runs the
+    passive/active mode selection of the scanner again.
+    """
+
+    def __init__(
+        self,
+        scanner,
+        backoff: Backoff = None,
+        healthy_after: float = 60.0,
+        max_restarts: int = None,
+    ):
+        """
+        Initialize the supervisor.
+
+        Args:
+            scanner (BLEScanner): The scanner to supervise.
+            backoff (Backoff): The backoff used between restarts.
+            healthy_after (float): Seconds of scanning after which the backoff is reset.
+            max_restarts (int): Give up after this number of restarts. None is unlimited.
+        """
+        self.scanner = scanner
+        self.backoff = backoff or Backoff()
+        self.healthy_after = healthy_after
+        self.max_restarts = max_restarts
+        self.restart_count = 0
+        self.downtime = 0.0
+        self.last_error: BaseException | None = None
+        self._down_since: float | None = None
+        self._scanning_since: float | None = None
+
+    def get_stats(self) -> dict:
+        """
+        Return the restart stats.
+
+        Returns:
+            dict: Restart count, total downtime in seconds and the last error.
+        """
+        downtime = self.downtime
+        if self._down_since is not None:
+            downtime += get_clock().monotonic() - self._down_since
+        return {
+            "restarts": self.restart_count,
+            "downtime": round(downtime, 3),
+            "last_error": repr(self.last_error) if self.last_error else None,
+        }
+
+    async def _run_session(self) -> None:
+        """Run one scanning session, tracking when scanning has started."""
+        self._scanning_since = None
+        session = asyncio.create_task(self.scanner.start_scanning())
+        scanning = asyncio.create_task(self.scanner.scanning.wait())
+        try:
+            await asyncio.wait((session, scanning), return_when=asyncio.FIRST_COMPLETED)
+            if scanning.done():
+                self._scanning_since = get_clock().monotonic()
+                if self._down_since is not None:
+                    down = self._scanning_since - self._down_since
+                    self.downtime += down
+                    self._down_since = None
+                    logger.info(
+                        f"Scanner recovered after {down:.1f}s "
+                        f"(restarts: {self.restart_count}, downtime: {self.downtime:.1f}s)"
+                    )
+            await session
+        finally:
+            for task in (session, scanning):
+                if not task.done():
+                    task.cancel()
+
+    async def run(self) -> None:
+        """Run the scanner until its stop event is set."""
+        stop_event = self.scanner.stop_event
+        while not stop_event.is_set():
+            error = None
+            try:
+                await self._run_session()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+            if stop_event.is_set():
+                break
+
+            self.last_error = error
+            now = get_clock().monotonic()
+            if self._down_since is None:
+                self._down_since = now
+            if (
+                self._scanning_since is not None
+                and now - self._scanning_since >= self.healthy_after
+            ):
+                self.backoff.reset()
+            if (
+                self.max_restarts is not None
+                and self.restart_count >= self.max_restarts
+            ):
+                logger.error(
+                    f"Scanner failed, giving up after {self.restart_count} restarts"
+                )
+                if error:
+                    raise error
+                break
+
+            delay = self.backoff.next()
+            self.restart_count += 1
+            logger.warning(
+                f"Scanner stopped ({error!r}), restart #{self.restart_count} in {delay:.1f}s"
+            )
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+        logger.debug(f"Supervisor stats: {self.get_stats()}")
@@ -12,12 +12,47 @@ class AsyncWithDummy(asyncio.Lock):
         return True  # Suppress exceptions if needed (returning True does this)
 
 
+# Running tasks of run_in_async_thread, the loop keeps only weak references
+background_tasks: set[asyncio.Task] = set()
+
+
 def run_in_async_thread(func):
     @wraps(func)
     async def wrapper(*args, **kwargs) -> None:
         # Run the function in a separate thread
         coro = asyncio.to_thread(func, *args, **kwargs)
-        # Create and run the task asynchronously
-        asyncio.create_task(coro)
+        # Create and run the task asynchronously, referenced until done
+        task = asyncio.create_task(coro)
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
 
     return wrapper
+
+
+def counter_delta(prev: int, count: int, modulo: int = 256) -> int:
+    """
+    Return the number of steps from prev to count of a wrapping frame counter.
+
+    Args:
+        prev (int): The previous counter value.
+        count (int): The current counter value.
+        modulo (int): The counter range, 256 for the 8-bit PVVX counter.
+
+    Returns:
+        int: The forward distance, 0 if the counter did not change.
+    """
+    return (count - prev) % modulo
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parse a duration like '90', '45s', '30m', '24h' or '7d' into seconds.
+
+    Raises:
+        ValueError: If the duration is not valid.
+    """
+    value = value.strip().lower()
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
@@ -0,0 +1,210 @@
+"""
+Virtual devices aggregating the readings of several thermometers.
+
+A group ("room", "freezer bank") is defined by its members, matched like the
+custom names by the end of the device name or by the address. Every reading
+of a member updates the aggregates of its groups incrementally, and the group
+is published as a reading of its own: the temperature is the selected
+statistic (mean, min or max) of the members, the range the min/max of the
+members. Group readings are displayed, stored and alerted like the readings
+of a physical device.
+"""
+
+import bisect
+import logging
+
+from events import Reading
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+ADDRESS_PREFIX = "group:"
+STATISTICS = ("mean", "min", "max")
+
+
+class Aggregate:
+    """
+    Mean, min and max of the last value of every member.
+
+    Replacing the value of a member adjusts the sum and moves the value in a
+    sorted list, other members are not visited again.
+    """
+
+    __slots__ = ("values", "sorted", "sum")
+
+    def __init__(self):
+        self.values: dict[str, float] = {}
+        self.sorted: list[float] = []
+        self.sum = 0.0
+
+    def update(self, member: str, value: float) -> None:
+        """Set the value of the member."""
+        previous = self.values.get(member)
+        if previous is not None:
+            if previous == value:
+                return
+            del self.sorted[bisect.bisect_left(self.sorted, previous)]
+            self.sum -= previous
+        self.values[member] = value
+        bisect.insort(self.sorted, value)
+        self.sum += value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / len(self.sorted)
+
+    @property
+    def min(self) -> float:
+        return self.sorted[0]
+
+    @property
+    def max(self) -> float:
+        return self.sorted[-1]
+
+
+class VirtualDevice:
+    """A group of devices published as one device."""
+
+    def __init__(self, name: str, members: list[str], statistic: str = "mean"):
+        """
+        Initialize the group.
+
+        Args:
+            name (str): The name of the virtual device.
+            members (list[str]): Ends of the member names or member addresses.
+            statistic (str): The temperature of the group, 'mean', 'min' or
+                'max' of the members.
+        """
+        if statistic not in STATISTICS:
+            raise ValueError(f"Unknown statistic {statistic} of group {name}")
+        self.name = name
+        self.address = ADDRESS_PREFIX + name
+        self.members = members
+        self.statistic = statistic
+        self.temp = Aggregate()
+        self.humidity = Aggregate()
+        self.battery = Aggregate()
+        self.battery_v = Aggregate()
+        self.last: Reading | None = None
+
+    def is_member(self, address: str, name: str | None) -> bool:
+        """Check whether the device is a member of the group."""
+        for member in self.members:
+            if member.upper() == address.upper():
+                return True
+            if name and (name.endswith(member) or name == member):
+                return True
+        return False
+
+    def update(self, reading: Reading) -> Reading:
+        """
+        Account the reading of a member.
+
+        Args:
+            reading (Reading): The reading of the member.
+
+        Returns:
+            Reading: The reading of the group.
+        """
+        address = reading.address
+        self.temp.update(address, reading.temp)
+        self.humidity.update(address, reading.humidity)
+        self.battery.update(address, reading.battery)
+        self.battery_v.update(address, reading.battery_v)
+        temp = getattr(self.temp, self.statistic)
+        group = Reading(
+            address=self.address,
+            name=self.name,
+            temp=round(temp, 2),
+            humidity=round(self.humidity.mean, 2),
+            # The weakest battery of the group
+            battery_v=self.battery_v.min,
+            battery=int(self.battery.min),
+            rssi=None,
+            count=len(self.temp.values),
+            timestamp=reading.timestamp,
+            interval=(reading.timestamp - self.last.timestamp) if self.last else None,
+            temp_range=(self.temp.min, self.temp.max),
+        )
+        self.last = group
+        return group
+
+
+class VirtualDevices:
+    """The virtual devices and the groups of every physical device."""
+
+    def __init__(self, groups: list[VirtualDevice], member_alerts: bool = False):
+        """
+        Initialize the virtual devices.
+
+        Args:
+            groups (list[VirtualDevice]): The groups.
+            member_alerts (bool): Alert on the members of groups too, by
+                default only the groups are alerted.
+        """
+        self.groups = groups
+        self.member_alerts = member_alerts
+        # Groups of the physical devices, resolved once per device
+        self.membership: dict[str, tuple[VirtualDevice, ...]] = {}
+
+    @classmethod
+    def from_settings(
+        cls, config: dict[str, str], member_alerts: bool = False
+    ) -> "VirtualDevices":
+        """
+        Create the groups of the settings.
+
+        Args:
+            config (dict[str, str]): The members by group name, as
+                '[mean|min|max:]member,member', e.g. 'max:ATC_5EDB77,F6ED7A'.
+            member_alerts (bool): Alert on the members of groups too.
+
+        Returns:
+            VirtualDevices: The virtual devices.
+        """
+        groups = []
+        for name, value in config.items():
+            statistic, _, members = value.partition(":")
+            if statistic not in STATISTICS:
+                # No statistic, or the colon belongs to an address
+                statistic, members = "mean", value
+            groups.append(
+                VirtualDevice(
+                    name,
+                    [m.strip() for m in members.split(",") if m.strip()],
+                    statistic,
+                )
+            )
+        return cls(groups, member_alerts)
+
+    def groups_of(self, address: str, name: str | None) -> tuple[VirtualDevice, ...]:
+        """Return the groups of the device, cached by address."""
+        groups = self.membership.get(address)
+        if groups is None:
+            groups = self.membership[address] = tuple(
+                group for group in self.groups if group.is_member(address, name)
+            )
+            if groups:
+                logger.debug(
+                    f"Device {name} ({address}) is member of "
+                    f"{', '.join(group.name for group in groups)}"
+                )
+        return groups
+
+    def is_alerting(self, address: str) -> bool:
+        """Check whether the readings of the device are alerted."""
+        return self.member_alerts or not self.membership.get(address)
+
+    def update(self, reading: Reading) -> list[Reading]:
+        """
+        Update the groups of the device of the reading.
+
+        Args:
+            reading (Reading): The reading of a physical device.
+
+        Returns:
+            list[Reading]: The readings of the updated groups.
+        """
+        return [
+            group.update(reading)
+            for group in self.groups_of(reading.address, reading.name)
+        ]
@@ -0,0 +1,590 @@
+"""
+Compact binary wire protocol between collector gateways and an aggregator.
+
+A collector forwards the raw PVVX advertisements it receives, the
+aggregator feeds them to its own scanner as if they were received by an
+adapter named ``<gateway>/<adapter>``. The usual cross-adapter dedup on
+(address, frame counter) merges the streams of all gateways, and display,
+alerts and storage run once on the aggregator.
+
+Frame (TCP stream and UDP datagram alike)::
+
+    length u32 (of the packet), packet
+
+Packet::
+
+    magic b"PW", version u8, gateway (u8 length + UTF-8), count u16, records
+
+Record::
+
+    flags u8 (bit 0: address is text instead of 6-byte MAC),
+    address (6 bytes, or u8 length + UTF-8), rssi i8 (-128 unknown),
+    name (u8 length + UTF-8), adapter (u8 length + UTF-8),
+    service data (u8 length + bytes)
+"""
+
+import asyncio
+import inspect
+import logging
+import socket
+import struct
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+from backends import ReplayAdvertisementData, ReplayDevice
+from metrics import metrics
+from supervisor import Backoff
+
+logger = logging.getLogger(f"BLEScanner.{__name__}")
+
+MAGIC = b"PW"
+VERSION = 1
+LENGTH = struct.Struct("!I")
+HEADER = struct.Struct("!2sB")
+COUNT = struct.Struct("!H")
+FLAG_TEXT_ADDRESS = 1
+RSSI_UNKNOWN = -128
+# Packets stay below the usual MTU, no IP fragmentation of UDP datagrams
+MAX_PACKET = 1400
+MAX_FRAME = 65536
+DEFAULT_PORT = 8642
+
+
+class WireError(ValueError):
+    """Malformed packet."""
+
+
+@dataclass(frozen=True, slots=True)
+class WireRecord:
+    address: str
+    rssi: int | None
+    name: str | None
+    adapter: str | None
+    data: bytes
+
+
+def _short_text(text: str | None) -> bytes:
+    raw = (text or "").encode("utf-8")[:255]
+    return bytes((len(raw),)) + raw
+
+
+def encode_record(record: WireRecord) -> bytes:
+    """Return the wire encoding of the record."""
+    try:
+        address = bytes.fromhex(record.address.replace(":", ""))
+        flags = 0 if len(address) == 6 else FLAG_TEXT_ADDRESS
+    except ValueError:
+        flags = FLAG_TEXT_ADDRESS
+    if flags & FLAG_TEXT_ADDRESS:
+        address = _short_text(record.address)
+    rssi = RSSI_UNKNOWN if record.rssi is None else max(-127, min(127, record.rssi))
+    data = bytes(record.data[:255])
+    return b"".join(
+        (
+            bytes((flags,)),
+            address,
+            struct.pack("!b", rssi),
+            _short_text(record.name),
+            _short_text(record.adapter),
+            bytes((len(data),)),
+            data,
+        )
+    )
+
+
+def encode_packet(gateway: str, records: list[bytes]) -> bytes:
+    """
+    Return the frame of a packet of encoded records.
+
+    Args:
+        gateway (str): The name of the sending gateway.
+        records (list[bytes]): The encoded records.
+
+    Returns:
+        bytes: The length-prefixed packet.
+    """
+    packet = b"".join(
+        (
+            HEADER.pack(MAGIC, VERSION),
+            _short_text(gateway),
+            COUNT.pack(len(records)),
+            *records,
+        )
+    )
+    return LENGTH.pack(len(packet)) + packet
+
+
+def decode_packet(packet: bytes) -> tuple[str, Iterator[WireRecord]]:
+    """
+    Decode a packet, without its length prefix.
+
+    Args:
+        packet (bytes): The packet.
+
+    Returns:
+        tuple[str, Iterator[WireRecord]]: The gateway and its records.
+
+    Raises:
+        WireError: If the packet header is malformed, malformed records
+            raise it while iterating.
+    """
+    view = memoryview(packet)
+    try:
+        magic, version = HEADER.unpack_from(view, 0)
+    except struct.error:
+        raise WireError("Truncated packet")
+    if magic != MAGIC or version != VERSION:
+        raise WireError(f"Unknown packet {bytes(magic)!r} version {version}")
+    offset = HEADER.size
+    gateway, offset = _read_text(view, offset)
+    if offset + COUNT.size > len(view):
+        raise WireError("Truncated packet")
+    (count,) = COUNT.unpack_from(view, offset)
+    return gateway, _records(view, offset + COUNT.size, count)
+
+
+def _read_bytes(view: memoryview, offset: int, length: int) -> tuple[bytes, int]:
+    end = offset + length
+    if end > len(view):
+        raise WireError("Truncated field")
+    return bytes(view[offset:end]), end
+
+
+def _read_text(view: memoryview, offset: int) -> tuple[str, int]:
+    if offset >= len(view):
+        raise WireError("Truncated text")
+    raw, end = _read_bytes(view, offset + 1, view[offset])
+    return raw.decode("utf-8", errors="replace"), end
+
+
+def _records(view: memoryview, offset: int, count: int) -> Iterator[WireRecord]:
+    try:
+        for _ in range(count):
+            flags = view[offset]
+            offset += 1
+            if flags & FLAG_TEXT_ADDRESS:
+                address, offset = _read_text(view, offset)
+            else:
+                mac, offset = _read_bytes(view, offset, 6)
+                address = mac.hex(":").upper()
+            rssi = struct.unpack_from("!b", view, offset)[0]
+            name, offset = _read_text(view, offset + 1)
+            adapter, offset = _read_text(view, offset)
+            data, offset = _read_bytes(view, offset + 1, view[offset])
+            yield WireRecord(
+                address,
+                None if rssi == RSSI_UNKNOWN else rssi,
+                name or None,
+                adapter or None,
+                data,
+            )
+    except (IndexError, struct.error):
+        raise WireError("Truncated record")
+
+
+def parse_address(address: str, default_port: int = DEFAULT_PORT) -> tuple:
+    """
+    Parse '[tcp://|udp://][HOST:]PORT'.
+
+    Returns:
+        tuple: (protocol, host, port), protocol is None when not given.
+    """
+    protocol = None
+    if "://" in address:
+        protocol, address = address.split("://", 1)
+        protocol = protocol.lower()
+    host, _, port = address.rpartition(":")
+    return protocol, host or None, int(port) if port else default_port
+
+
+class WireForwarder:
+    """
+    Collector side: forwards the received PVVX advertisements to an aggregator.
+
+    Used like the capture writer of the scanner. Repeated advertisements of
+    the same frame counter are forwarded once. Records are batched into
+    packets of ``batch_size`` records or ``MAX_PACKET`` bytes, sent at the
+    latest after ``flush_interval`` seconds. Over TCP the connection is
+    re-established with backoff, packets are dropped while it is down (the
+    BLE data is live, old frames are not worth delaying new ones).
+    """
+
+    def __init__(
+        self,
+        address: str,
+        gateway: str = None,
+        batch_size: int = 32,
+        flush_interval: float = 0.2,
+        max_pending: int = 1000,
+    ):
+        """
+        Initialize the forwarder.
+
+        Args:
+            address (str): '[tcp://|udp://]HOST:PORT' of the aggregator, TCP by default.
+            gateway (str): The name of this gateway, the host name by default.
+            batch_size (int): Records per packet.
+            flush_interval (float): Seconds a record waits for its packet.
+            max_pending (int): Packets queued while the connection is down.
+        """
+        protocol, self.host, self.port = parse_address(address)
+        self.protocol = protocol or "tcp"
+        if self.protocol not in ("tcp", "udp"):
+            raise ValueError(f"Unknown protocol: {self.protocol}")
+        self.host = self.host or "127.0.0.1"
+        self.gateway = gateway or socket.gethostname()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records: list[bytes] = []
+        self.size = 0
+        self.last_counter: dict[str, int] = {}
+        self.queue: asyncio.Queue = asyncio.Queue(max_pending)
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._task: asyncio.Task | None = None
+        self._sent_packets = metrics.counter("wire.packets_sent")
+        self._sent_records = metrics.counter("wire.records_sent")
+        self._dropped = metrics.counter("wire.packets_dropped")
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self.run(), name="wire-forwarder")
+        logger.info(
+            f"Forwarding to {self.protocol}://{self.host}:{self.port} as {self.gateway}"
+        )
+
+    def write(
+        self, device, advertising_data, adv_atc: bytes, adapter: str | None = None
+    ) -> None:
+        """
+        Queue an advertisement for forwarding.
+
+        Args:
+            device: The BLE device object (needs ``address`` and ``name``).
+            advertising_data: The advertising data object (needs ``rssi``).
+            adv_atc (bytes): The raw PVVX service data.
+            adapter (str | None): The adapter that received the advertisement.
+        """
+        counter = adv_atc[13] if len(adv_atc) > 13 else None
+        if counter is not None and self.last_counter.get(device.address) == counter:
+            return
+        self.last_counter[device.address] = counter
+        record = encode_record(
+            WireRecord(
+                device.address,
+                advertising_data.rssi,
+                device.name,
+                adapter,
+                bytes(adv_atc),
+            )
+        )
+        if self.size + len(record) > MAX_PACKET - 300:
+            self.flush()
+        self.records.append(record)
+        self.size += len(record)
+        if len(self.records) >= self.batch_size:
+            self.flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.flush_interval, self.flush
+            )
+
+    def flush(self) -> None:
+        """Queue the pending records as one packet."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self.records:
+            return
+        records, self.records, self.size = self.records, [], 0
+        try:
+            self.queue.put_nowait((encode_packet(self.gateway, records), len(records)))
+        except asyncio.QueueFull:
+            self._dropped.inc()
+
+    async def run(self) -> None:
+        """Send the queued packets until cancelled."""
+        if self.protocol == "udp":
+            await self._run_udp()
+        else:
+            await self._run_tcp()
+
+    async def _run_udp(self) -> None:
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol, remote_addr=(self.host, self.port)
+        )
+        try:
+            while True:
+                frame, count = await self.queue.get()
+                transport.sendto(frame)
+                self._sent_packets.inc()
+                self._sent_records.inc(count)
+        finally:
+            transport.close()
+
+    async def _run_tcp(self) -> None:
+        backoff = Backoff(initial=0.5, maximum=30)
+        while True:
+            try:
+                _, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                delay = backoff.next()
+                logger.warning(f"Aggregator unreachable: {e!r}, retry in {delay:.1f}s")
+                self._drop_queued()
+                await asyncio.sleep(delay)
+                continue
+            backoff.reset()
+            logger.info(f"Connected to aggregator {self.host}:{self.port}")
+            try:
+                while True:
+                    frame, count = await self.queue.get()
+                    writer.write(frame)
+                    await writer.drain()
+                    self._sent_packets.inc()
+                    self._sent_records.inc(count)
+            except OSError as e:
+                logger.warning(f"Aggregator connection lost: {e!r}")
+            finally:
+                writer.close()
+
+    def _drop_queued(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            self._dropped.inc()
+
+    async def close(self) -> None:
+        self.flush()
+        if self._task is None:
+            return
+        # Give the queued packets a moment to leave
+        for _ in range(10):
+            if self.queue.empty():
+                break
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        try:
+            await self._task
+        except (asyncio.CancelledError, OSError):
+            pass
+        self._task = None
+
+
+class _DatagramReceiver(asyncio.DatagramProtocol):
+    def __init__(self, session: "WireSession"):
+        self.session = session
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if len(data) < LENGTH.size:
+            self.session.bad_packet(addr, "Truncated datagram")
+            return
+        (length,) = LENGTH.unpack_from(data)
+        if length != len(data) - LENGTH.size:
+            self.session.bad_packet(addr, "Length mismatch")
+            return
+        self.session.enqueue(data[LENGTH.size :], addr)
+
+
+class WireSession:
+    """
+    One running aggregator listener (TCP and UDP on the same port).
+
+    Used as async context manager in the same way as BleakScanner.
+    """
+
+    def __init__(self, backend: "WireBackend", callback: Callable, adapter=None):
+        self.backend = backend
+        self.callback = callback
+        self.packets: asyncio.Queue = asyncio.Queue(10000)
+        self.server: asyncio.AbstractServer | None = None
+        self.transport: asyncio.DatagramTransport | None = None
+        self.task: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        backend = self.backend
+        loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(
+            self.handle_connection, backend.host, backend.port
+        )
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramReceiver(self), local_addr=(backend.host, backend.port)
+        )
+        self.task = asyncio.create_task(self.run())
+        logger.info(f"Aggregator listening on {backend.host}:{backend.port} tcp+udp")
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.transport.close()
+        self.server.close()
+        for writer in list(self.backend.connections):
+            writer.close()
+        await self.server.wait_closed()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    def bad_packet(self, peer, reason: str) -> None:
+        self.backend.bad_packets.inc()
+        logger.debug(f"Bad packet from {peer}: {reason}")
+
+    def enqueue(self, packet: bytes, peer) -> None:
+        try:
+            self.packets.put_nowait((packet, peer))
+        except asyncio.QueueFull:
+            self.backend.dropped_packets.inc()
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        peer = writer.get_extra_info("peername")
+        logger.info(f"Collector connected from {peer}")
+        self.backend.connections.add(writer)
+        try:
+            while True:
+                (length,) = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+                if length > MAX_FRAME:
+                    self.bad_packet(peer, f"Frame of {length} bytes")
+                    break
+                packet = await reader.readexactly(length)
+                # Back pressure on the collector when the scanner is behind
+                await self.packets.put((packet, peer))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.backend.connections.discard(writer)
+            writer.close()
+            logger.info(f"Collector {peer} disconnected")
+
+    async def run(self) -> None:
+        """Feed the received records to the scanner callback."""
+        while True:
+            packet, peer = await self.packets.get()
+            try:
+                gateway, records = decode_packet(packet)
+                self.backend.received_packets.inc()
+                for record in records:
+                    self.backend.received_records.inc()
+                    device = ReplayDevice(record.address, record.name)
+                    advertising_data = ReplayAdvertisementData(
+                        record.rssi, {self.backend.service_uuid: record.data}
+                    )
+                    source = f"{gateway}/{record.adapter or 'default'}"
+                    result = self.callback(device, advertising_data, source)
+                    if inspect.isawaitable(result):
+                        await result
+            except WireError as e:
+                self.bad_packet(peer, str(e))
+            except Exception as e:
+                # One bad packet or record must not stop the aggregator
+                self.backend.bad_packets.inc()
+                logger.error(f"Packet from {peer} failed: {e!r}")
+
+
+class WireBackend:
+    """
+    Aggregator backend: receives the advertisements forwarded by collectors.
+
+    Every record is delivered with the source adapter ``<gateway>/<adapter>``,
+    so the adapter stats of the scanner are kept per gateway.
+    """
+
+    ATC_SERVICE = "0000181a-0000-1000-8000-00805f9b34fb"
+
+    def __init__(self, address: str, service_uuid: str = ATC_SERVICE):
+        """
+        Initialize the aggregator backend.
+
+        Args:
+            address (str): '[HOST:]PORT' to listen on (TCP and UDP), all
+                interfaces by default.
+            service_uuid (str): Service UUID used for the received service data.
+        """
+        _, host, self.port = parse_address(address)
+        self.host = host or "0.0.0.0"
+        self.service_uuid = service_uuid
+        self.connections: set[asyncio.StreamWriter] = set()
+        self.received_packets = metrics.counter("wire.packets_received")
+        self.received_records = metrics.counter("wire.records_received")
+        self.bad_packets = metrics.counter("wire.bad_packets")
+        self.dropped_packets = metrics.counter("wire.packets_dropped")
+
+    def __call__(
+        self, callback: Callable, scanning_mode: str = "passive", adapter=None
+    ):
+        return WireSession(self, callback, adapter)
+
+
+def fuzz(iterations: int = 10000, seed: int = 0) -> int:
+    """
+    Decode truncated and corrupted packets, only WireError may be raised.
+
+    Every valid packet is decoded at each truncation length, then with
+    random bytes flipped.
+
+    Args:
+        iterations (int): The number of random packets.
+        seed (int): The seed of the random packets.
+
+    Returns:
+        int: The number of packets raising another exception, 0 when robust.
+    """
+    import random
+
+    rng = random.Random(seed)
+    failures = 0
+
+    def check(packet: bytes) -> None:
+        nonlocal failures
+        try:
+            _, records = decode_packet(packet)
+            list(records)
+        except WireError:
+            pass
+        except Exception as e:
+            failures += 1
+            if failures <= 10:
+                print(f"fuzz: {packet.hex()} raised {e!r}")
+
+    for _ in range(iterations):
+        records = [
+            encode_record(
+                WireRecord(
+                    address=(
+                        rng.randbytes(6).hex(":").upper()
+                        if rng.random() < 0.8
+                        else "text-" + str(rng.randrange(1000))
+                    ),
+                    rssi=rng.choice([None, rng.randrange(-100, 0)]),
+                    name=rng.choice([None, "ATC_5EDB77", "é" * rng.randrange(5)]),
+                    adapter=rng.choice([None, "hci0"]),
+                    data=rng.randbytes(rng.randrange(20)),
+                )
+            )
+            for _ in range(rng.randrange(4))
+        ]
+        packet = encode_packet(rng.choice(["gw", "floor1"]), records)[LENGTH.size :]
+        for length in range(len(packet)):
+            check(packet[:length])
+        corrupted = bytearray(packet)
+        for _ in range(rng.randrange(1, 4)):
+            corrupted[rng.randrange(len(corrupted))] = rng.randrange(256)
+        check(bytes(corrupted))
+        check(rng.randbytes(rng.randrange(32)))
+    print(f"fuzz: {iterations} packets, {failures} failures")
+    return failures
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Wire protocol checks")
+    parser.add_argument(
+        "--fuzz",
+        type=int,
+        default=10000,
+        metavar="N",
+        help="Decode N truncated and corrupted packets. Default is 10000.",
+    )
+    args = parser.parse_args()
+    sys.exit(1 if fuzz(args.fuzz) else 0)
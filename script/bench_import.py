@@ -0,0 +1,76 @@
+"""
+Import-time benchmark of the application startup.
+
+Runs ``main.py --version`` (all module level imports, no scanning) several
+times with ``python -X importtime`` and reports the median wall time, the
+slowest imports and which optional notification modules were loaded.
+
+Usage:
+    python bench_import.py [--runs N] [--top N]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+MAIN = Path(__file__).resolve().parent.parent.joinpath("MiTermometerPVVX", "main.py")
+WATCHED = ("httpx", "h2", "bleak", "plyer", "pync", "windows_toasts", "dotenv")
+
+
+def run_once(args: list[str]) -> tuple[float, str]:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", str(MAIN), *args],
+        capture_output=True,
+        text=True,
+        cwd=MAIN.parent,
+    )
+    return time.perf_counter() - started, result.stderr
+
+
+def parse_importtime(output: str) -> dict[str, int]:
+    """Return the cumulative import time in microseconds by top level module."""
+    imports = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line.split("|")
+            imports[name.strip()] = int(cumulative)
+        except ValueError:
+            continue
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="Number of runs")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports shown")
+    args = parser.parse_args()
+
+    times = []
+    imports = {}
+    for _ in range(args.runs):
+        elapsed, output = run_once(["--version"])
+        times.append(elapsed)
+        imports = parse_importtime(output)
+
+    print(
+        f"startup: median {statistics.median(times) * 1000:.0f} ms, "
+        f"min {min(times) * 1000:.0f} ms over {args.runs} runs"
+    )
+    print(f"slowest imports (cumulative):")
+    for name, us in sorted(imports.items(), key=lambda i: i[1], reverse=True)[
+        : args.top
+    ]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+    print("optional modules loaded at startup:")
+    for name in WATCHED:
+        print(f"  {name}: {'yes' if name in imports else 'no'}")
+
+
+if __name__ == "__main__":
+    main()